@@ -0,0 +1 @@
+"""Load tests and benchmarks, they are run by hand and are not collected by pytest."""
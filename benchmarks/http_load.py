@@ -0,0 +1,352 @@
+"""HTTP load test of the task endpoints with a mixed workload.
+
+Recreates the schema of the benchmark database (DATABASE_TEST_URL by default, it is wiped),
+seeds it and drives the ASGI app in process, or a server started on the same database with --url:
+
+    python -m benchmarks.http_load run --consignments 10000 --duration 30 --concurrency 16
+    python -m benchmarks.http_load compare benchmarks/results/a.json benchmarks/results/b.json
+
+Runs are reproducible for the same arguments and --seed: the data has the same shape and
+every worker makes the same sequence of requests.
+"""
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, time as dt_time, timedelta
+from pathlib import Path
+
+from fastapi.encoders import jsonable_encoder
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import insert
+
+from benchmarks.results import RESULTS_DIR, save
+from src.adapters.database import Database
+from src.db_models.products import Products
+from src.db_models.tasks import Consignments, ConsignmentsProgress, ProductsToConsignments, ShiftTasks
+from src.modules.tasks.schemas import AddProductModel, AddTaskModel
+from tests.plugins.factories import consignment_schema, product_schema, task_schema
+
+CHUNK_SIZE = 5000
+DEFAULT_MIX = {'ingest_tasks': 10, 'ingest_products': 20, 'aggregate': 30, 'list': 20, 'get': 20}
+
+
+@dataclass
+class Dataset:
+    consignments: list[tuple[int, int, date]]
+    task_ids: list[int]
+    # Bindings which are not aggregated yet, aggregation takes them from the end.
+    pending: list[tuple[str, int]]
+    next_number: int
+    days: int
+
+
+def seed_date(i: int, days: int) -> date:
+    return date.today() - timedelta(days=i % days)
+
+
+async def seed(
+    database: Database,
+    consignments: int,
+    products_per_consignment: int,
+    days: int,
+    rng: random.Random,
+) -> Dataset:
+    """Seeds consignments with their tasks and products, one task per consignment."""
+    dataset = Dataset(consignments=[], task_ids=[], pending=[], next_number=consignments + 1, days=days)
+    async with database.async_session() as session:
+        for start in range(0, consignments, CHUNK_SIZE):
+            rows = [
+                consignment_schema(consignment_number=i + 1, consignment_date=seed_date(i, days))
+                for i in range(start, min(start + CHUNK_SIZE, consignments))
+            ]
+            created = (await session.execute(
+                insert(Consignments).returning(
+                    Consignments.consignment_id, Consignments.consignment_number, Consignments.consignment_date,
+                ),
+                rows,
+            )).all()
+            dataset.consignments.extend(tuple(row) for row in created)
+            task_ids = (await session.execute(
+                insert(ShiftTasks).returning(ShiftTasks.task_id),
+                [
+                    task_schema(
+                        consignment_id=consignment_id,
+                        close_status=number % 10 == 0,
+                        closed_at=datetime.now() if number % 10 == 0 else None,
+                        started_at=datetime.combine(consignment_date, dt_time(8)),
+                        completed_at=datetime.combine(consignment_date, dt_time(16)),
+                    )
+                    for consignment_id, number, consignment_date in created
+                ],
+            )).scalars().all()
+            dataset.task_ids.extend(task_ids)
+            bindings = [
+                {**product_schema(), 'consignment_id': consignment_id, 'consignment_date': consignment_date}
+                for consignment_id, _, consignment_date in created
+                for _ in range(products_per_consignment)
+            ]
+            if bindings:
+                await session.execute(
+                    insert(Products),
+                    [{'product_id': binding['product_id']} for binding in bindings],
+                )
+                await session.execute(insert(ProductsToConsignments), bindings)
+                await session.execute(insert(ConsignmentsProgress), [
+                    {'consignment_id': consignment_id, 'total_products': products_per_consignment}
+                    for consignment_id, _, _ in created
+                ])
+            dataset.pending.extend((binding['product_id'], binding['consignment_id']) for binding in bindings)
+    rng.shuffle(dataset.pending)
+    return dataset
+
+
+def task_payload(**overriders) -> dict:
+    schema = {**consignment_schema(), **task_schema(), **overriders}
+    return jsonable_encoder({
+        model_field.validation_alias: schema[name] for name, model_field in AddTaskModel.model_fields.items()
+    })
+
+
+def product_payload(**overriders) -> dict:
+    schema = {**product_schema(), **overriders}
+    return jsonable_encoder({
+        model_field.validation_alias: schema[name] for name, model_field in AddProductModel.model_fields.items()
+    })
+
+
+async def ingest_tasks(client: AsyncClient, dataset: Dataset, rng: random.Random, batch: int):
+    """New consignments, every fifth task overwrites a seeded one."""
+    tasks = []
+    for _ in range(batch):
+        if rng.random() < 0.2:
+            _, number, consignment_date = rng.choice(dataset.consignments)
+        else:
+            number, consignment_date = dataset.next_number, seed_date(dataset.next_number, dataset.days)
+            dataset.next_number += 1
+        tasks.append(task_payload(consignment_number=number, consignment_date=consignment_date))
+    return 'POST /v1/tasks', await client.post('/v1/tasks', json=tasks)
+
+
+async def ingest_products(client: AsyncClient, dataset: Dataset, rng: random.Random, batch: int):
+    consignment_id, number, consignment_date = rng.choice(dataset.consignments)
+    products = [
+        product_payload(consignment_number=number, consignment_date=consignment_date)
+        for _ in range(batch)
+    ]
+    response = await client.post('/v1/tasks/products', json=products)
+    if response.is_success:
+        dataset.pending.extend(
+            (product[AddProductModel.model_fields['product_id'].validation_alias], consignment_id)
+            for product in products
+        )
+    return 'POST /v1/tasks/products', response
+
+
+async def aggregate(client: AsyncClient, dataset: Dataset, rng: random.Random, batch: int):
+    product_id, consignment_id = dataset.pending.pop()
+    return (
+        'POST /v1/tasks/products/{product_id}/consignments/{consignment_id}',
+        await client.post(f'/v1/tasks/products/{product_id}/consignments/{consignment_id}'),
+    )
+
+
+async def list_tasks(client: AsyncClient, dataset: Dataset, rng: random.Random, batch: int):
+    _, number, consignment_date = rng.choice(dataset.consignments)
+    start_date = seed_date(rng.randrange(dataset.days), dataset.days)
+    params = rng.choice([
+        {},
+        {'close_status': 'false'},
+        {'consignment_number': number},
+        {'consignment_date': consignment_date.isoformat()},
+        {'start_date': start_date.isoformat(), 'end_date': (start_date + timedelta(days=7)).isoformat()},
+    ])
+    return 'GET /v1/tasks', await client.get('/v1/tasks', params=params)
+
+
+async def get_task(client: AsyncClient, dataset: Dataset, rng: random.Random, batch: int):
+    task_id = rng.choice(dataset.task_ids)
+    return 'GET /v1/tasks/{task_id}', await client.get(f'/v1/tasks/{task_id}')
+
+
+OPERATIONS = {
+    'ingest_tasks': ingest_tasks,
+    'ingest_products': ingest_products,
+    'aggregate': aggregate,
+    'list': list_tasks,
+    'get': get_task,
+}
+
+
+async def run_workload(
+    client: AsyncClient,
+    dataset: Dataset,
+    mix: dict[str, int],
+    concurrency: int,
+    duration: float,
+    warmup: float,
+    batch: int,
+    seed: int,
+) -> dict:
+    """Runs workers until the deadline, requests made during the warmup are not measured."""
+    names = [name for name in mix if mix[name] > 0]
+    weights = [mix[name] for name in names]
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: dict[str, Counter] = defaultdict(Counter)
+    started = time.perf_counter()
+    measured_from = started + warmup
+    deadline = measured_from + duration
+
+    async def worker(number: int) -> None:
+        rng = random.Random(seed * 1000 + number)
+        while (now := time.perf_counter()) < deadline:
+            name = rng.choices(names, weights)[0]
+            if name == 'aggregate' and not dataset.pending:
+                name = 'ingest_products'
+            route, response = await OPERATIONS[name](client, dataset, rng, batch)
+            if now >= measured_from:
+                latencies[route].append(time.perf_counter() - now)
+                statuses[route][response.status_code] += 1
+
+    await asyncio.gather(*(worker(number) for number in range(concurrency)))
+    elapsed = time.perf_counter() - measured_from
+    return {route: summarize(latencies[route], statuses[route], elapsed) for route in sorted(latencies)}
+
+
+def summarize(latencies: list[float], statuses: Counter, elapsed: float) -> dict:
+    if len(latencies) > 1:
+        cuts = statistics.quantiles(latencies, n=100, method='inclusive')
+        p50, p95, p99 = cuts[49], cuts[94], cuts[98]
+    else:
+        p50 = p95 = p99 = latencies[0]
+    return {
+        'requests': len(latencies),
+        'errors': sum(count for status, count in statuses.items() if status >= 400),
+        'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        'rps': round(len(latencies) / elapsed, 2),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'p50_ms': round(p50 * 1000, 3),
+        'p95_ms': round(p95 * 1000, 3),
+        'p99_ms': round(p99 * 1000, 3),
+    }
+
+
+def print_routes(routes: dict) -> None:
+    print(f"{'route':<70} {'req':>7} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in routes.items():
+        print(
+            f"{route:<70} {stats['requests']:>7} {stats['errors']:>5} {stats['rps']:>9.1f} "
+            f"{stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} {stats['p99_ms']:>9.2f}"
+        )
+
+
+async def run(args: argparse.Namespace) -> None:
+    from src.server import app, settings
+
+    database = Database(db_url=args.database_url or settings.database.test_url)
+    mix = {**DEFAULT_MIX, **args.mix}
+    try:
+        await database.drop_database()
+        await database.create_database()
+        print(f'Seeding {args.consignments} consignments x {args.products} products...')
+        dataset = await seed(database, args.consignments, args.products, args.days, random.Random(args.seed))
+        if args.url:
+            client = AsyncClient(base_url=args.url, timeout=args.timeout)
+        else:
+            app.adapters_container.database.override(database)
+            client = AsyncClient(transport=ASGITransport(app=app), base_url='http://benchmark', timeout=args.timeout)
+        async with client:
+            print(f'Running for {args.duration}s after {args.warmup}s of warmup with {args.concurrency} workers...')
+            routes = await run_workload(
+                client, dataset, mix, args.concurrency, args.duration, args.warmup, args.batch, args.seed,
+            )
+    finally:
+        await database.engine.dispose()
+
+    total = {
+        'requests': sum(stats['requests'] for stats in routes.values()),
+        'errors': sum(stats['errors'] for stats in routes.values()),
+        'rps': round(sum(stats['rps'] for stats in routes.values()), 2),
+    }
+    output = save('http_load', {
+        'parameters': {
+            'target': args.url or 'asgi',
+            'consignments': args.consignments,
+            'products': args.products,
+            'days': args.days,
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'batch': args.batch,
+            'mix': mix,
+            'seed': args.seed,
+        },
+        'routes': routes,
+        'total': total,
+    }, args.output)
+    print_routes(routes)
+    print(f"total: {total['rps']:.1f} req/s, {total['errors']} errors, saved to {output}")
+
+
+def compare(args: argparse.Namespace) -> None:
+    base, head = (json.loads(path.read_text()) for path in (args.base, args.head))
+    print(f"{base['commit']} -> {head['commit']}")
+    if base['parameters'] != head['parameters']:
+        print('warning: the runs have different parameters')
+    print(f"{'route':<70} {'req/s':>16} {'p95 ms':>16} {'p99 ms':>16}")
+    for route in sorted(base['routes'].keys() & head['routes'].keys()):
+        before, after = base['routes'][route], head['routes'][route]
+        print(f'{route:<70}', *(
+            f"{after[key]:>9.1f} {(after[key] / before[key] - 1) * 100 if before[key] else 0:>+5.0f}%"
+            for key in ('rps', 'p95_ms', 'p99_ms')
+        ))
+
+
+def parse_mix(value: str) -> dict[str, int]:
+    mix = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        if name not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f'unknown operation {name!r}, expected one of {", ".join(OPERATIONS)}')
+        mix[name] = int(weight)
+    return mix
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.http_load')
+    commands = parser.add_subparsers(required=True)
+
+    run_parser = commands.add_parser('run', help="Seeds the database and runs the workload.")
+    run_parser.add_argument('--database-url', help="Wiped and seeded, DATABASE_TEST_URL by default.")
+    run_parser.add_argument('--url', help="Base URL of a running server, the app is run in process by default.")
+    run_parser.add_argument('--consignments', type=int, default=10000, help="Seeded consignments and tasks.")
+    run_parser.add_argument('--products', type=int, default=10, help="Seeded products per consignment.")
+    run_parser.add_argument('--days', type=int, default=365, help="Consignment dates are spread over the days.")
+    run_parser.add_argument('--duration', type=float, default=30, help="Measured seconds.")
+    run_parser.add_argument('--warmup', type=float, default=3, help="Seconds before measuring.")
+    run_parser.add_argument('--concurrency', type=int, default=16, help="Concurrent clients.")
+    run_parser.add_argument('--batch', type=int, default=10, help="Tasks or products per ingestion request.")
+    run_parser.add_argument(
+        '--mix', type=parse_mix, default={},
+        help=f"Weights of operations, e.g. aggregate=50,list=0. Defaults: {DEFAULT_MIX}.",
+    )
+    run_parser.add_argument('--timeout', type=float, default=30)
+    run_parser.add_argument('--seed', type=int, default=1)
+    run_parser.add_argument('--output', type=Path, help=f"Results JSON, saved to {RESULTS_DIR} by default.")
+    run_parser.set_defaults(command=lambda args: asyncio.run(run(args)))
+
+    compare_parser = commands.add_parser('compare', help="Compares two saved runs.")
+    compare_parser.add_argument('base', type=Path)
+    compare_parser.add_argument('head', type=Path)
+    compare_parser.set_defaults(command=compare)
+
+    args = parser.parse_args(argv)
+    args.command(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,32 @@
+"""Saved results of benchmark runs, they are named by the benchmark and the commit."""
+import json
+import platform
+import subprocess
+from datetime import datetime
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).parent / 'results'
+
+
+def git(*args: str) -> str | None:
+    try:
+        return subprocess.run(['git', *args], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(benchmark: str, results: dict, output: Path | None = None) -> Path:
+    """Saves results with the commit and the environment of the run."""
+    commit = git('rev-parse', 'HEAD')
+    results = {
+        'benchmark': benchmark,
+        'commit': commit,
+        'dirty': bool(git('status', '--porcelain', '--untracked-files=no')),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        **results,
+    }
+    output = output or RESULTS_DIR / f"{benchmark}-{(commit or 'unknown')[:12]}-{datetime.now():%Y%m%dT%H%M%S}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    return output
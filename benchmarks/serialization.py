@@ -0,0 +1,109 @@
+"""Serialization of Task responses: the validated FastAPI path against ModelsResponse.
+
+The FastAPI path validates the returned tasks against the response model of the route once
+more and encodes them with the standard json module, ModelsResponse encodes the fields of
+the built tasks with orjson. Tasks are built from ORM rows in memory, no database is used:
+
+    python -m benchmarks.serialization --sizes 1 30 1000 --products 30
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from uuid import uuid4
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_response_field
+
+from benchmarks.results import save
+from src.db_models.tasks import Consignments, ShiftTasks
+from src.modules.responses import ModelsResponse
+from src.modules.tasks.schemas import Task
+from tests.plugins.factories import consignment_schema, task_schema
+
+DEFAULT_SIZES = (1, 30, 1000)
+
+# Response model of the list route, as FastAPI creates it from the return annotation.
+RESPONSE_FIELD = create_response_field(name='response', type_=list[Task], mode='serialization')
+
+
+def build_tasks(size: int, products: int) -> list[Task]:
+    tasks = []
+    for task_id in range(1, size + 1):
+        row = ShiftTasks(task_id=task_id, **task_schema())
+        row.consignment = Consignments(consignment_id=task_id, **consignment_schema())
+        tasks.append(Task.from_orm_task(row, products=[str(uuid4()) for _ in range(products)]))
+    return tasks
+
+
+async def fastapi_path(tasks: list[Task]) -> bytes:
+    content = await serialize_response(field=RESPONSE_FIELD, response_content=tasks, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+async def models_response(tasks: list[Task]) -> bytes:
+    return ModelsResponse(tasks).body
+
+
+SERIALIZERS: dict[str, Callable[[list[Task]], Awaitable[bytes]]] = {
+    'fastapi': fastapi_path,
+    'models_response': models_response,
+}
+
+
+async def measure(serializer, tasks: list[Task], repeat: int, number: int) -> dict:
+    """Medians of `repeat` timings of `number` calls, in microseconds per call."""
+    timings = []
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        for _ in range(number):
+            await serializer(tasks)
+        timings.append((time.perf_counter() - started_at) / number * 1e6)
+    return {
+        'min_us': round(min(timings), 3),
+        'median_us': round(statistics.median(timings), 3),
+    }
+
+
+async def run(sizes: list[int], products: int, repeat: int) -> dict:
+    results = {}
+    for size in sizes:
+        tasks = build_tasks(size, products)
+        encoded = {name: await serializer(tasks) for name, serializer in SERIALIZERS.items()}
+        if len({json.dumps(json.loads(body), sort_keys=True) for body in encoded.values()}) != 1:
+            raise RuntimeError(f'serializers disagree on {size} tasks')
+        number = max(1, 2000 // (size * (products + 1)))
+        results[size] = {
+            name: await measure(serializer, tasks, repeat, number)
+            for name, serializer in SERIALIZERS.items()
+        }
+        results[size]['bytes'] = len(encoded['models_response'])
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.serialization')
+    parser.add_argument('--sizes', type=int, nargs='+', default=list(DEFAULT_SIZES), help="Tasks per response.")
+    parser.add_argument('--products', type=int, default=30, help="Products of every task.")
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--output', type=Path, help="Results JSON, saved to benchmarks/results by default.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.sizes, args.products, args.repeat))
+    output = save('serialization', {
+        'parameters': {'sizes': args.sizes, 'products': args.products, 'repeat': args.repeat},
+        'results': results,
+    }, args.output)
+    print(f"{'tasks':>6} {'bytes':>9} {'fastapi, us':>14} {'orjson, us':>14} {'speedup':>8}")
+    for size, result in results.items():
+        before, after = result['fastapi']['median_us'], result['models_response']['median_us']
+        print(f"{size:>6} {result['bytes']:>9} {before:>14.1f} {after:>14.1f} {before / after:>7.1f}x")
+    print(f'saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
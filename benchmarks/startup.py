@@ -0,0 +1,130 @@
+"""Time from the start of a process to its first served request.
+
+By default every run starts a new interpreter which imports the app, runs its startup
+hooks and serves the first request in process. With --command a server is started
+instead and --url is polled until it responds, e.g. to time restarts of gunicorn workers:
+
+    python -m benchmarks.startup --runs 10
+    python -m benchmarks.startup --command "gunicorn src.server:app -k uvicorn.workers.UvicornWorker -w 4 \
+-b 127.0.0.1:8001" --url http://127.0.0.1:8001/v1/tasks?limit=1
+
+The database of DATABASE_URL has to be migrated, the first request reads it.
+"""
+import argparse
+import asyncio
+import json
+import shlex
+import statistics
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from benchmarks.results import save
+
+DEFAULT_PATH = '/v1/tasks?limit=1'
+
+
+async def serve_first_request(path: str) -> None:
+    """Runs in the measured process, only the standard library is imported before."""
+    started_at = time.perf_counter()
+    from httpx import ASGITransport, AsyncClient
+
+    from src.server import app
+    imported_at = time.perf_counter()
+    await app.router.startup()
+    started_up_at = time.perf_counter()
+    async with AsyncClient(transport=ASGITransport(app=app), base_url='http://startup') as client:
+        response = await client.get(path)
+    served_at = time.perf_counter()
+    print(json.dumps({
+        'status': response.status_code,
+        'import_ms': (imported_at - started_at) * 1000,
+        'startup_ms': (started_up_at - imported_at) * 1000,
+        'first_request_ms': (served_at - started_up_at) * 1000,
+    }), flush=True)
+    await app.router.shutdown()
+    await app.adapters_container.database().engine.dispose()
+
+
+def run_in_process(path: str) -> dict:
+    started_at = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.startup', '--serve', path],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    line = process.stdout.readline()
+    total = (time.perf_counter() - started_at) * 1000
+    process.wait()
+    if not line:
+        raise RuntimeError(f'the app exited with {process.returncode} before serving a request')
+    phases = json.loads(line)
+    if phases.pop('status') >= 500:
+        raise RuntimeError('the first request failed, is the database migrated?')
+    return {'total_ms': total, **phases}
+
+
+def run_server(command: str, url: str, timeout: float) -> dict:
+    import httpx
+
+    started_at = time.perf_counter()
+    process = subprocess.Popen(shlex.split(command), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while time.perf_counter() - started_at < timeout:
+            if process.poll() is not None:
+                raise RuntimeError(f'the server exited with {process.returncode}')
+            try:
+                if httpx.get(url, timeout=timeout).status_code < 500:
+                    return {'total_ms': (time.perf_counter() - started_at) * 1000}
+            except httpx.TransportError:
+                time.sleep(0.01)
+        raise RuntimeError(f'the server did not respond in {timeout}s')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m benchmarks.startup')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--path', default=DEFAULT_PATH, help="Path of the first request in process.")
+    parser.add_argument('--command', help="Command starting a server.")
+    parser.add_argument('--url', help="URL polled until the server responds, with --command.")
+    parser.add_argument('--timeout', type=float, default=60)
+    parser.add_argument('--output', type=Path, help="Results JSON, saved to benchmarks/results by default.")
+    parser.add_argument('--serve', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+    if args.serve:
+        asyncio.run(serve_first_request(args.serve))
+        return
+    if args.command and not args.url:
+        parser.error('--url is required with --command')
+
+    runs = [
+        run_server(args.command, args.url, args.timeout) if args.command else run_in_process(args.path)
+        for _ in range(args.runs)
+    ]
+    phases = {
+        phase: {
+            'min': round(min(run[phase] for run in runs), 3),
+            'median': round(statistics.median(run[phase] for run in runs), 3),
+            'max': round(max(run[phase] for run in runs), 3),
+        }
+        for phase in runs[0]
+    }
+    output = save('startup', {
+        'parameters': {
+            'runs': args.runs,
+            'target': args.command or 'asgi',
+            'url': args.url or args.path,
+        },
+        'phases': phases,
+    }, args.output)
+    for phase, stats in phases.items():
+        print(f"{phase:<18} min {stats['min']:>9.1f}  median {stats['median']:>9.1f}  max {stats['max']:>9.1f}")
+    print(f'saved to {output}')
+
+
+if __name__ == '__main__':
+    main()
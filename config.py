@@ -1,5 +1,7 @@
+from functools import lru_cache
+
 from dotenv import load_dotenv
-from pydantic import Field
+from pydantic import Field, model_validator
 from pydantic_settings import BaseSettings
 
 load_dotenv()
@@ -8,6 +10,25 @@ load_dotenv()
 class DatabaseConfig(BaseSettings):
     url: str = Field(validation_alias='DATABASE_URL')
     test_url: str = Field(validation_alias='DATABASE_TEST_URL')
+    # Connections of all workers, the pool of a worker gets its share unless DATABASE_POOL_SIZE is set.
+    max_connections: int = Field(default=80, validation_alias='DATABASE_MAX_CONNECTIONS')
+    workers: int = Field(default=4, validation_alias='WEB_CONCURRENCY')
+    pool_size: int | None = Field(default=None, validation_alias='DATABASE_POOL_SIZE')
+    max_overflow: int = Field(default=5, validation_alias='DATABASE_MAX_OVERFLOW')
+    pool_timeout: float = Field(default=10, validation_alias='DATABASE_POOL_TIMEOUT')
+    pool_recycle: int = Field(default=1800, validation_alias='DATABASE_POOL_RECYCLE')
+    pool_pre_ping: bool = Field(default=True, validation_alias='DATABASE_POOL_PRE_PING')
+    # Waits for a connection longer than this are logged.
+    pool_slow_wait: float = Field(default=0.1, validation_alias='DATABASE_POOL_SLOW_WAIT')
+    statement_cache_size: int = Field(default=100, validation_alias='DATABASE_STATEMENT_CACHE_SIZE')
+    # PgBouncer in transaction mode does not keep prepared statements between transactions.
+    pgbouncer: bool = Field(default=False, validation_alias='DATABASE_PGBOUNCER')
+
+    @model_validator(mode='after')
+    def derive_pool_size(self):
+        if self.pool_size is None:
+            self.pool_size = max(self.max_connections // self.workers - self.max_overflow, 1)
+        return self
 
 
 class CORSConfig(BaseSettings):
@@ -15,11 +36,73 @@ class CORSConfig(BaseSettings):
     headers: list[str] = Field(validation_alias='CORS_HEADERS')
 
 
+class CacheConfig(BaseSettings):
+    consignments_size: int = Field(default=100000, validation_alias='CONSIGNMENTS_CACHE_SIZE')
+    consignments_ttl: float = Field(default=3600, validation_alias='CONSIGNMENTS_CACHE_TTL')
+    consignments_negative_ttl: float = Field(
+        default=5, validation_alias='CONSIGNMENTS_CACHE_NEGATIVE_TTL')
+    consignment_dates_size: int = Field(default=100000, validation_alias='CONSIGNMENT_DATES_CACHE_SIZE')
+    consignment_dates_ttl: float = Field(default=3600, validation_alias='CONSIGNMENT_DATES_CACHE_TTL')
+    closed_tasks_size: int = Field(default=10000, validation_alias='CLOSED_TASKS_CACHE_SIZE')
+    closed_tasks_ttl: float = Field(default=300, validation_alias='CLOSED_TASKS_CACHE_TTL')
+
+
+class ProductsFilterConfig(BaseSettings):
+    enabled: bool = Field(default=False, validation_alias='PRODUCTS_FILTER_ENABLED')
+    capacity: int = Field(default=100_000_000, validation_alias='PRODUCTS_FILTER_CAPACITY')
+    error_rate: float = Field(default=0.01, validation_alias='PRODUCTS_FILTER_ERROR_RATE')
+    # Unknown codes are looked up in the database within this many seconds after a notification of new bindings.
+    settle: float = Field(default=2, validation_alias='PRODUCTS_FILTER_SETTLE')
+
+
+class AggregationCoalescerConfig(BaseSettings):
+    # Aggregations arriving within the window are committed together, zero disables coalescing.
+    window_ms: float = Field(default=0, validation_alias='AGGREGATION_COALESCER_WINDOW_MS')
+    max_items: int = Field(default=200, validation_alias='AGGREGATION_COALESCER_MAX_ITEMS')
+
+
+class PartitionsConfig(BaseSettings):
+    months_ahead: int = Field(default=3, validation_alias='PARTITIONS_MONTHS_AHEAD')
+    archive_horizon_months: int = Field(default=12, validation_alias='PARTITIONS_ARCHIVE_HORIZON_MONTHS')
+    archive_schema: str = Field(default='archive', validation_alias='PARTITIONS_ARCHIVE_SCHEMA')
+
+
+class RollupsConfig(BaseSettings):
+    # Aggregations of the last seconds may be not committed yet, they are left to the next refresh.
+    refresh_lag: float = Field(default=300, validation_alias='ROLLUPS_REFRESH_LAG')
+    refresh_step_hours: int = Field(default=24, validation_alias='ROLLUPS_REFRESH_STEP_HOURS')
+
+
+class IdempotencyConfig(BaseSettings):
+    enabled: bool = Field(default=True, validation_alias='IDEMPOTENCY_ENABLED')
+    # Requests with an Idempotency-Key are answered with the stored response within this many seconds.
+    retention: float = Field(default=86400, validation_alias='IDEMPOTENCY_RETENTION')
+    # Requests without it are only deduplicated by the hash of the body within the retry window,
+    # results of ingestion depend on the state of the database.
+    hash_retention: float = Field(default=60, validation_alias='IDEMPOTENCY_HASH_RETENTION')
+    prune_batch_size: int = Field(default=10000, validation_alias='IDEMPOTENCY_PRUNE_BATCH_SIZE')
+
+
 class Settings(BaseSettings):
-    database: DatabaseConfig = DatabaseConfig()
-    cors: CORSConfig = CORSConfig()
+    database: DatabaseConfig = Field(default_factory=DatabaseConfig)
+    cors: CORSConfig = Field(default_factory=CORSConfig)
+    cache: CacheConfig = Field(default_factory=CacheConfig)
+    products_filter: ProductsFilterConfig = Field(default_factory=ProductsFilterConfig)
+    aggregation_coalescer: AggregationCoalescerConfig = Field(default_factory=AggregationCoalescerConfig)
+    partitions: PartitionsConfig = Field(default_factory=PartitionsConfig)
+    rollups: RollupsConfig = Field(default_factory=RollupsConfig)
+    idempotency: IdempotencyConfig = Field(default_factory=IdempotencyConfig)
     app_port: int = Field(validation_alias='APP_PORT')
 
+    @model_validator(mode='after')
+    def check_products_filter(self):
+        # The filter follows bindings with LISTEN, which does not work through PgBouncer in transaction mode.
+        if self.products_filter.enabled and self.database.pgbouncer:
+            raise ValueError('PRODUCTS_FILTER_ENABLED can not be used with DATABASE_PGBOUNCER')
+        return self
+
 
-def get_settings():
+@lru_cache
+def get_settings() -> Settings:
+    """Settings are read from the environment once per process."""
     return Settings()
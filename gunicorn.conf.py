@@ -0,0 +1,23 @@
+"""Gunicorn hooks, the file is read by gunicorn from the working directory."""
+import os
+import shutil
+
+from prometheus_client import multiprocess
+
+# Workers are forked from the master with the app imported, a restarted worker does not import it again.
+# Importing the app neither connects to the database nor creates an engine, pools are created by workers.
+preload_app = True
+
+
+def on_starting(server):
+    """Clears metrics of previous runs and of maintenance commands, /metrics would sum them up."""
+    directory = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    """Drops live gauges of the exited worker."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,68 @@
+import asyncio
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import Connection, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from config import get_settings
+from src.adapters.database import Base
+from src.db_models import analytics, idempotency, products, tasks  # noqa: F401
+from src.db_models.tasks import is_products_partition
+
+# Serializes concurrent upgrades, e.g. several containers started at once.
+MIGRATIONS_LOCK_ID = 72_410_001
+
+target_metadata = Base.metadata
+
+
+def include_name(name: str | None, type_: str, parent_names: dict) -> bool:
+    """Partitions are managed by `python -m src.cli partitions`, not by migrations."""
+    return not (type_ == 'table' and is_products_partition(name))
+
+
+if context.config.config_file_name and context.config.attributes.get('configure_logger', True):
+    fileConfig(context.config.config_file_name)
+
+
+def run_migrations(connection: Connection) -> None:
+    # The lock is held by the session, migrations run in their own transaction.
+    connection.execute(text('SELECT pg_advisory_lock(:id)'), {'id': MIGRATIONS_LOCK_ID})
+    connection.commit()
+    try:
+        context.configure(
+            connection=connection,
+            target_metadata=target_metadata,
+            include_name=include_name,
+            compare_server_default=True,
+        )
+        with context.begin_transaction():
+            context.run_migrations()
+    finally:
+        connection.execute(text('SELECT pg_advisory_unlock(:id)'), {'id': MIGRATIONS_LOCK_ID})
+        connection.commit()
+
+
+async def run_async_migrations() -> None:
+    engine = create_async_engine(get_settings().database.url)
+    async with engine.connect() as connection:
+        await connection.run_sync(run_migrations)
+    await engine.dispose()
+
+
+def run_migrations_offline() -> None:
+    context.configure(
+        url=get_settings().database.url,
+        target_metadata=target_metadata,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+elif connection := context.config.attributes.get('connection'):
+    run_migrations(connection)
+else:
+    asyncio.run(run_async_migrations())
@@ -0,0 +1,77 @@
+"""initial
+
+Revision ID: 0001
+Revises:
+Create Date: 2024-03-20 12:00:00
+
+Schema as it was created by Base.metadata.create_all at startup. Databases that
+already have it are adopted as is.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    if sa.inspect(op.get_bind()).has_table('shift_tasks'):
+        return
+    op.create_table(
+        'consignments',
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('consignment_number', sa.Integer(), nullable=False),
+        sa.Column('consignment_date', sa.Date(), nullable=False),
+        sa.PrimaryKeyConstraint('consignment_id', name='pk_consignments'),
+        sa.UniqueConstraint('consignment_number', 'consignment_date',
+                            name='uq_consignments_consignment_number'),
+    )
+    op.create_index('ix_consignments_consignment_id', 'consignments', ['consignment_id'])
+    op.create_table(
+        'products',
+        sa.Column('product_id', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('product_id', name='pk_products'),
+    )
+    op.create_index('ix_products_product_id', 'products', ['product_id'])
+    op.create_table(
+        'shift_tasks',
+        sa.Column('task_id', sa.Integer(), nullable=False),
+        sa.Column('close_status', sa.Boolean()),
+        sa.Column('name', sa.String()),
+        sa.Column('line', sa.String()),
+        sa.Column('shift', sa.String()),
+        sa.Column('brigade', sa.String()),
+        sa.Column('nomenclature', sa.String()),
+        sa.Column('code', sa.String()),
+        sa.Column('identifier', sa.String()),
+        sa.Column('started_at', sa.DateTime()),
+        sa.Column('completed_at', sa.DateTime()),
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('closed_at', sa.DateTime()),
+        sa.ForeignKeyConstraint(['consignment_id'], ['consignments.consignment_id'],
+                                name='fk_shift_tasks_consignment_id_consignments'),
+        sa.PrimaryKeyConstraint('task_id', name='pk_shift_tasks'),
+    )
+    op.create_index('ix_shift_tasks_task_id', 'shift_tasks', ['task_id'])
+    op.create_table(
+        'products_to_consignments',
+        sa.Column('product_to_consignment_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.String(), nullable=False),
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('is_aggregated', sa.Boolean()),
+        sa.Column('aggregated_at', sa.DateTime()),
+        sa.ForeignKeyConstraint(['consignment_id'], ['consignments.consignment_id'],
+                                name='fk_products_to_consignments_consignment_id_consignments'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.product_id'],
+                                name='fk_products_to_consignments_product_id_products'),
+        sa.PrimaryKeyConstraint('product_to_consignment_id', name='pk_products_to_consignments'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('products_to_consignments')
+    op.drop_table('shift_tasks')
+    op.drop_table('products')
+    op.drop_table('consignments')
@@ -0,0 +1,110 @@
+"""production indexes
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-03-20 12:30:00
+
+Adds the version columns, the unique constraints the upserts rely on and the indexes
+of the hot paths of TasksRepository. Every step is skipped if a later create_all
+already made it.
+
+Duplicates violating the new constraints are not deleted but moved to the tables
+removed_0002_products_to_consignments and removed_0002_shift_tasks, which are only
+kept if they got rows. The operator reviews them and drops them or restores rows,
+the downgrade leaves them as they are.
+"""
+import logging
+
+import sqlalchemy as sa
+from alembic import op
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+
+def add_column(table: str, column: sa.Column) -> None:
+    if column.name not in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}:
+        op.add_column(table, column)
+
+
+def create_unique_constraint(name: str, table: str, columns: list[str]) -> None:
+    if name not in {c['name'] for c in sa.inspect(op.get_bind()).get_unique_constraints(table)}:
+        op.create_unique_constraint(name, table, columns)
+
+
+def move_rows(table: str, using: str, condition: str) -> None:
+    """Moves rows of the table matching the condition to removed_0002_<table>."""
+    removed_table = f'removed_0002_{table}'
+    op.execute(f'CREATE TABLE IF NOT EXISTS {removed_table} (LIKE {table})')
+    moved = op.get_bind().execute(sa.text(f'''
+        WITH moved AS (
+            DELETE FROM {table} AS t USING {using} WHERE {condition} RETURNING t.*
+        )
+        INSERT INTO {removed_table} SELECT * FROM moved
+    ''')).rowcount
+    if moved:
+        logger.warning('Moved %s duplicate rows of %s to %s, review them before dropping it',
+                       moved, table, removed_table)
+    elif not op.get_bind().execute(sa.text(f'SELECT EXISTS (SELECT FROM {removed_table})')).scalar():
+        op.drop_table(removed_table)
+
+
+def upgrade() -> None:
+    add_column('consignments', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    add_column('shift_tasks', sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+    add_column('shift_tasks', sa.Column('updated_at', sa.DateTime()))
+
+    # A product code belongs to one consignment, the first binding wins unless
+    # a later one was already aggregated.
+    move_rows(
+        'products_to_consignments',
+        using='''(
+            SELECT product_to_consignment_id,
+                   row_number() OVER (
+                       PARTITION BY product_id
+                       ORDER BY is_aggregated DESC NULLS LAST, product_to_consignment_id
+                   ) AS position
+            FROM products_to_consignments
+        ) AS d''',
+        condition='t.product_to_consignment_id = d.product_to_consignment_id AND d.position > 1',
+    )
+    create_unique_constraint('uq_products_to_consignments_product_id',
+                             'products_to_consignments', ['product_id'])
+    # A consignment has one task, the latest one overwrote the previous ones.
+    move_rows(
+        'shift_tasks',
+        using='shift_tasks AS newer',
+        condition='newer.consignment_id = t.consignment_id AND newer.task_id > t.task_id',
+    )
+    create_unique_constraint('uq_shift_tasks_consignment_id', 'shift_tasks', ['consignment_id'])
+
+    op.create_index('ix_products_to_consignments_consignment_id_product_id',
+                    'products_to_consignments', ['consignment_id', 'product_id'],
+                    if_not_exists=True)
+    op.create_index('ix_products_to_consignments_not_aggregated',
+                    'products_to_consignments', ['consignment_id', 'product_id'],
+                    postgresql_where=sa.text('is_aggregated = false'),
+                    if_not_exists=True)
+    op.create_index('ix_shift_tasks_started_at_task_id',
+                    'shift_tasks', ['started_at', 'task_id'],
+                    if_not_exists=True)
+    op.create_index('ix_shift_tasks_close_status_started_at_task_id',
+                    'shift_tasks', ['close_status', 'started_at', 'task_id'],
+                    if_not_exists=True)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shift_tasks_close_status_started_at_task_id', 'shift_tasks')
+    op.drop_index('ix_shift_tasks_started_at_task_id', 'shift_tasks')
+    op.drop_index('ix_products_to_consignments_not_aggregated', 'products_to_consignments')
+    op.drop_index('ix_products_to_consignments_consignment_id_product_id',
+                  'products_to_consignments')
+    op.drop_constraint('uq_shift_tasks_consignment_id', 'shift_tasks')
+    op.drop_constraint('uq_products_to_consignments_product_id', 'products_to_consignments')
+    op.drop_column('shift_tasks', 'updated_at')
+    op.drop_column('shift_tasks', 'version')
+    op.drop_column('consignments', 'version')
@@ -0,0 +1,111 @@
+"""partition products
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-03-27 12:00:00
+
+Rebuilds products_to_consignments as a table partitioned by month of the consignment
+date. Existing bindings are copied into partitions of their months, the default
+partition takes months without one. Partitions ahead are created by
+`python -m src.cli partitions create`.
+"""
+from datetime import timedelta
+
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0003'
+down_revision = '0002'
+branch_labels = None
+depends_on = None
+
+TABLE = 'products_to_consignments'
+COLUMNS = 'product_to_consignment_id, product_id, consignment_id, is_aggregated, aggregated_at'
+
+
+def rename_old_table(table: str, suffix: str) -> None:
+    """Frees the names of the table, its constraints, indexes and sequence."""
+    op.rename_table(TABLE, table)
+    for constraint in (f'pk_{TABLE}', f'uq_{TABLE}_product_id',
+                       f'fk_{TABLE}_product_id_products',
+                       f'fk_{TABLE}_consignment_id_consignments'):
+        op.execute(f'ALTER TABLE {table} RENAME CONSTRAINT {constraint} TO {constraint}_{suffix}')
+    for index in (f'ix_{TABLE}_consignment_id_product_id', f'ix_{TABLE}_not_aggregated'):
+        op.execute(f'ALTER INDEX {index} RENAME TO {index}_{suffix}')
+    op.execute(f'ALTER SEQUENCE {TABLE}_product_to_consignment_id_seq '
+               f'RENAME TO {table}_product_to_consignment_id_seq')
+
+
+def create_indexes() -> None:
+    op.create_index(f'ix_{TABLE}_consignment_id_product_id', TABLE, ['consignment_id', 'product_id'])
+    op.create_index(f'ix_{TABLE}_not_aggregated', TABLE, ['consignment_id', 'product_id'],
+                    postgresql_where=sa.text('is_aggregated = false'))
+
+
+def upgrade() -> None:
+    rename_old_table(f'{TABLE}_old', 'old')
+    op.create_table(
+        TABLE,
+        sa.Column('product_to_consignment_id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('product_id', sa.String(), nullable=False),
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('consignment_date', sa.Date(), nullable=False),
+        sa.Column('is_aggregated', sa.Boolean()),
+        sa.Column('aggregated_at', sa.DateTime()),
+        sa.ForeignKeyConstraint(['consignment_id'], ['consignments.consignment_id'],
+                                name=f'fk_{TABLE}_consignment_id_consignments'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.product_id'],
+                                name=f'fk_{TABLE}_product_id_products'),
+        sa.PrimaryKeyConstraint('product_to_consignment_id', 'consignment_date', name=f'pk_{TABLE}'),
+        sa.UniqueConstraint('product_id', 'consignment_date', name=f'uq_{TABLE}_product_id'),
+        postgresql_partition_by='RANGE (consignment_date)',
+    )
+    create_indexes()
+    op.execute(f'CREATE TABLE {TABLE}_default PARTITION OF {TABLE} DEFAULT')
+    months = op.get_bind().execute(sa.text(f'''
+        SELECT DISTINCT date_trunc('month', c.consignment_date)::date
+        FROM {TABLE}_old AS p JOIN consignments AS c USING (consignment_id)
+    ''')).scalars().all()
+    for month in months:
+        next_month = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+        op.execute(
+            f"CREATE TABLE {TABLE}_y{month:%Y}m{month:%m} PARTITION OF {TABLE} "
+            f"FOR VALUES FROM ('{month}') TO ('{next_month}')"
+        )
+    op.execute(f'''
+        INSERT INTO {TABLE} ({COLUMNS}, consignment_date)
+        SELECT {', '.join(f'p.{name}' for name in COLUMNS.split(', '))}, c.consignment_date
+        FROM {TABLE}_old AS p JOIN consignments AS c USING (consignment_id)
+    ''')
+    op.execute(f'''
+        SELECT setval(pg_get_serial_sequence('{TABLE}', 'product_to_consignment_id'),
+                      (SELECT coalesce(max(product_to_consignment_id), 0) + 1 FROM {TABLE}_old),
+                      false)
+    ''')
+    op.drop_table(f'{TABLE}_old')
+
+
+def downgrade() -> None:
+    rename_old_table(f'{TABLE}_partitioned', 'partitioned')
+    op.create_table(
+        TABLE,
+        sa.Column('product_to_consignment_id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.String(), nullable=False),
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('is_aggregated', sa.Boolean()),
+        sa.Column('aggregated_at', sa.DateTime()),
+        sa.ForeignKeyConstraint(['consignment_id'], ['consignments.consignment_id'],
+                                name=f'fk_{TABLE}_consignment_id_consignments'),
+        sa.ForeignKeyConstraint(['product_id'], ['products.product_id'],
+                                name=f'fk_{TABLE}_product_id_products'),
+        sa.PrimaryKeyConstraint('product_to_consignment_id', name=f'pk_{TABLE}'),
+        sa.UniqueConstraint('product_id', name=f'uq_{TABLE}_product_id'),
+    )
+    create_indexes()
+    op.execute(f'INSERT INTO {TABLE} ({COLUMNS}) SELECT {COLUMNS} FROM {TABLE}_partitioned')
+    op.execute(f'''
+        SELECT setval(pg_get_serial_sequence('{TABLE}', 'product_to_consignment_id'),
+                      (SELECT coalesce(max(product_to_consignment_id), 0) + 1 FROM {TABLE}_partitioned),
+                      false)
+    ''')
+    op.drop_table(f'{TABLE}_partitioned')
@@ -0,0 +1,24 @@
+"""filter indexes
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-04-03 12:00:00
+
+Indexes of the task filters by consignment date and by completion time.
+"""
+from alembic import op
+
+revision = '0004'
+down_revision = '0003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_consignments_consignment_date', 'consignments', ['consignment_date'])
+    op.create_index('ix_shift_tasks_completed_at', 'shift_tasks', ['completed_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_shift_tasks_completed_at', 'shift_tasks')
+    op.drop_index('ix_consignments_consignment_date', 'consignments')
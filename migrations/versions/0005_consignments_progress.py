@@ -0,0 +1,46 @@
+"""consignments progress
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-04-10 12:00:00
+
+Counters of bound and aggregated products of consignments, filled from the existing
+bindings. Bindings are counted while workers do not run, they are updated by the
+statements which bind and aggregate products afterwards.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0005'
+down_revision = '0004'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'consignments_progress',
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('total_products', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('aggregated_products', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('first_aggregated_at', sa.DateTime(), nullable=True),
+        sa.Column('last_aggregated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['consignment_id'], ['consignments.consignment_id']),
+        sa.PrimaryKeyConstraint('consignment_id'),
+    )
+    op.execute('''
+        INSERT INTO consignments_progress (
+            consignment_id, total_products, aggregated_products, first_aggregated_at, last_aggregated_at
+        )
+        SELECT consignment_id,
+               count(*),
+               count(*) FILTER (WHERE is_aggregated),
+               min(aggregated_at),
+               max(aggregated_at)
+        FROM products_to_consignments
+        GROUP BY consignment_id
+    ''')
+
+
+def downgrade() -> None:
+    op.drop_table('consignments_progress')
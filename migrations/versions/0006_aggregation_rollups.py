@@ -0,0 +1,48 @@
+"""aggregation rollups
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-04-17 12:00:00
+
+Hourly rollups of aggregated products for reports, their refresh watermarks and the index
+the refresh reads new aggregations by. Rollups are filled by `python -m src.cli rollups refresh`.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0006'
+down_revision = '0005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'aggregation_rollups',
+        sa.Column('bucket', sa.DateTime(), nullable=False),
+        sa.Column('line', sa.String(), nullable=False),
+        sa.Column('shift', sa.String(), nullable=False),
+        sa.Column('brigade', sa.String(), nullable=False),
+        sa.Column('nomenclature', sa.String(), nullable=False),
+        sa.Column('aggregated_products', sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint('bucket', 'line', 'shift', 'brigade', 'nomenclature'),
+    )
+    op.create_table(
+        'rollup_watermarks',
+        sa.Column('rollup', sa.String(), nullable=False),
+        sa.Column('aggregated_at', sa.DateTime(), nullable=True),
+        sa.Column('refreshed_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('rollup'),
+    )
+    op.create_index(
+        'ix_products_to_consignments_aggregated_at',
+        'products_to_consignments',
+        ['aggregated_at'],
+        postgresql_where=sa.text('aggregated_at IS NOT NULL'),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index('ix_products_to_consignments_aggregated_at', 'products_to_consignments')
+    op.drop_table('rollup_watermarks')
+    op.drop_table('aggregation_rollups')
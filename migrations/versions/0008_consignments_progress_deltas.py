@@ -0,0 +1,58 @@
+"""consignments progress deltas
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-04-29 12:00:00
+
+Binding and aggregation only insert deltas of progress counters instead of updating the
+counters row of the consignment, `python -m src.cli progress fold` folds them. Counters
+of consignments_progress stay valid, there are no deltas to move.
+"""
+import sqlalchemy as sa
+from alembic import op
+
+revision = '0008'
+down_revision = '0007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'consignments_progress_deltas',
+        sa.Column('delta_id', sa.BigInteger(), autoincrement=True, nullable=False),
+        sa.Column('consignment_id', sa.Integer(), nullable=False),
+        sa.Column('total_products', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('aggregated_products', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('first_aggregated_at', sa.DateTime(), nullable=True),
+        sa.Column('last_aggregated_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['consignment_id'], ['consignments.consignment_id']),
+        sa.PrimaryKeyConstraint('delta_id'),
+    )
+    op.create_index(
+        'ix_consignments_progress_deltas_consignment_id',
+        'consignments_progress_deltas',
+        ['consignment_id'],
+    )
+
+
+def downgrade() -> None:
+    # Deltas not folded yet are moved into the counters first.
+    op.execute('''
+        INSERT INTO consignments_progress (
+            consignment_id, total_products, aggregated_products, first_aggregated_at, last_aggregated_at
+        )
+        SELECT consignment_id,
+               sum(total_products),
+               sum(aggregated_products),
+               min(first_aggregated_at),
+               max(last_aggregated_at)
+        FROM consignments_progress_deltas
+        GROUP BY consignment_id
+        ON CONFLICT (consignment_id) DO UPDATE
+        SET total_products = consignments_progress.total_products + excluded.total_products,
+            aggregated_products = consignments_progress.aggregated_products + excluded.aggregated_products,
+            first_aggregated_at = least(consignments_progress.first_aggregated_at, excluded.first_aggregated_at),
+            last_aggregated_at = greatest(consignments_progress.last_aggregated_at, excluded.last_aggregated_at)
+    ''')
+    op.drop_table('consignments_progress_deltas')
@@ -0,0 +1,48 @@
+from collections import OrderedDict
+from collections.abc import Hashable, Iterable
+from time import monotonic
+from typing import Any
+
+from src.adapters.metrics import CACHE_HITS, CACHE_MISSES
+
+MISSING = object()
+
+
+class LRUCache:
+    """Per-process LRU cache with expiring entries.
+    None values are negative entries, they expire after a separate TTL.
+    Hits and misses are exported by the name of the cache."""
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float, name: str) -> None:
+        self._maxsize = maxsize
+        self.ttl = ttl
+        self._negative_ttl = negative_ttl
+        self._entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._hits = CACHE_HITS.labels(name)
+        self._misses = CACHE_MISSES.labels(name)
+
+    def get(self, key: Hashable) -> Any:
+        """Returns the cached value or MISSING if the key is not cached."""
+        entry = self._entries.get(key)
+        if entry is None or entry[0] < monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self._misses.inc()
+            return MISSING
+        self._entries.move_to_end(key)
+        self._hits.inc()
+        return entry[1]
+
+    def set(self, key: Hashable, value: Any) -> None:
+        ttl = self.ttl if value is not None else self._negative_ttl
+        self._entries[key] = (monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, keys: Iterable[Hashable]) -> None:
+        for key in keys:
+            self._entries.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._entries)
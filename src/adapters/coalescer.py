@@ -0,0 +1,88 @@
+import asyncio
+import contextvars
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any
+
+from src.adapters.metrics import COALESCER_BATCH_SIZE, COALESCER_WAIT
+
+Apply = Callable[[list[Any]], Awaitable[list[Any]]]
+
+
+class Coalescer:
+    """Per-worker group commit of concurrent requests.
+
+    Items submitted within the window after the first one, or until max_items are collected,
+    are applied in one call, which returns a result per item in their order. Every caller gets
+    its own result, or the error of the call. The batch is applied by the function of the call
+    which opened it. A window of zero disables coalescing."""
+
+    def __init__(self, window_ms: float, max_items: int, name: str) -> None:
+        self.window = window_ms / 1000
+        self.max_items = max_items
+        self._batch_size = COALESCER_BATCH_SIZE.labels(name)
+        self._wait = COALESCER_WAIT.labels(name)
+        self._items: list[Any] = []
+        self._futures: list[asyncio.Future] = []
+        self._submitted_at: list[float] = []
+        self._apply: Apply | None = None
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    @property
+    def enabled(self) -> bool:
+        return self.window > 0 and self.max_items > 1
+
+    async def submit(self, item: Any, apply: Apply) -> Any:
+        """Adds the item to the open batch and waits for its result."""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        if not self._items:
+            self._apply = apply
+            # Batches are applied outside of contexts of requests, e.g. of their query stats.
+            self._timer = loop.call_later(self.window, self._flush, context=contextvars.Context())
+        self._items.append(item)
+        self._futures.append(future)
+        self._submitted_at.append(time.perf_counter())
+        if len(self._items) >= self.max_items:
+            self._flush()
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._items:
+            return
+        batch = self._items, self._futures, self._submitted_at, self._apply
+        self._items, self._futures, self._submitted_at, self._apply = [], [], [], None
+        task = asyncio.create_task(self._run(*batch), context=contextvars.Context())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _run(
+        self,
+        items: list[Any],
+        futures: list[asyncio.Future],
+        submitted_at: list[float],
+        apply: Apply,
+    ) -> None:
+        started_at = time.perf_counter()
+        self._batch_size.observe(len(items))
+        for submitted in submitted_at:
+            self._wait.observe(started_at - submitted)
+        try:
+            results = await apply(items)
+        except asyncio.CancelledError:
+            for future in futures:
+                future.cancel()
+            raise
+        except Exception as error:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(error)
+            return
+        for future, result in zip(futures, results):
+            # Callers may be cancelled while the batch is applied.
+            if not future.done():
+                future.set_result(result)
@@ -1,12 +1,17 @@
+import logging
+import time
 from contextlib import AbstractAsyncContextManager, asynccontextmanager
 from typing import Callable
+from uuid import uuid4
 
-from sqlalchemy import create_engine, AsyncAdaptedQueuePool, MetaData
+from sqlalchemy import AsyncAdaptedQueuePool, MetaData, exc
 from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.sql.ddl import CreateSchema
 
-from config import get_settings
+from src.adapters.metrics import DB_POOL_EXHAUSTED, DB_POOL_WAIT, instrument_engine
+
+logger = logging.getLogger(__name__)
 
 
 meta = MetaData(
@@ -25,18 +30,75 @@ class Base:
 
 
 Base = declarative_base(cls=Base, metadata=meta)
-autoload_engine = create_engine(get_settings().database.url)
-Base.metadata.bind = autoload_engine
 
 
 AsyncSessionManager = Callable[..., AbstractAsyncContextManager[AsyncSession]]
 
 
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    """Pool recording the time requests wait for a connection.
+    Waits of an exhausted pool longer than slow_wait are logged."""
+
+    slow_wait = 0.1
+
+    def _do_get(self):
+        exhausted = -1 < self._max_overflow <= self._overflow and not self.checkedin()
+        if exhausted:
+            DB_POOL_EXHAUSTED.inc()
+        started_at = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            logger.error('Connection pool exhausted, no connection in %.3fs: %s',
+                         time.perf_counter() - started_at, self.status())
+            raise
+        finally:
+            waited = time.perf_counter() - started_at
+            DB_POOL_WAIT.observe(waited)
+            if exhausted and waited >= self.slow_wait:
+                logger.warning('Connection pool exhausted, waited %.3fs for a connection: %s',
+                               waited, self.status())
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.slow_wait = self.slow_wait
+        return pool
+
+
 class Database:
 
-    def __init__(self, db_url: str) -> None:
+    def __init__(
+        self,
+        db_url: str,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        pool_timeout: float = 30,
+        pool_recycle: int = -1,
+        pool_pre_ping: bool = False,
+        pool_slow_wait: float = 0.1,
+        statement_cache_size: int = 100,
+        pgbouncer: bool = False,
+    ) -> None:
+        connect_args = {'prepared_statement_cache_size': statement_cache_size}
+        if pgbouncer:
+            # Statements prepared in one transaction are not found on another server connection.
+            connect_args = {
+                'prepared_statement_cache_size': 0,
+                'statement_cache_size': 0,
+                'prepared_statement_name_func': lambda: f'__asyncpg_{uuid4()}__',
+            }
         self._engine = create_async_engine(
-            db_url, poolclass=AsyncAdaptedQueuePool)
+            db_url,
+            poolclass=InstrumentedPool,
+            pool_size=pool_size,
+            max_overflow=max_overflow,
+            pool_timeout=pool_timeout,
+            pool_recycle=pool_recycle,
+            pool_pre_ping=pool_pre_ping,
+            connect_args=connect_args,
+        )
+        self._engine.sync_engine.pool.slow_wait = pool_slow_wait
+        instrument_engine(self._engine)
         self._session_factory = async_sessionmaker(
             autocommit=False,
             autoflush=False,
@@ -0,0 +1,191 @@
+"""Prometheus metrics of the service.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR and /metrics
+aggregates the files of all workers, gunicorn.conf.py removes files of exited workers.
+Without the variable samples are kept in memory of the process.
+"""
+import functools
+import inspect
+import os
+import time
+from contextvars import ContextVar
+
+from fastapi import Response
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess,
+)
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.adapters.query_stats import record_statement
+
+METRICS_PATH = '/metrics'
+UNMATCHED_ROUTE = '<unmatched>'
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+HTTP_REQUESTS = Counter(
+    'http_requests_total', 'Finished HTTP requests.', ['method', 'route', 'status'])
+HTTP_REQUEST_DURATION = Histogram(
+    'http_request_duration_seconds', 'Latency of HTTP requests.', ['method', 'route'])
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    'http_requests_in_progress', 'HTTP requests being served.', ['method'], multiprocess_mode='livesum')
+
+DB_POOL_CHECKOUTS = Counter('db_pool_checkouts_total', 'Connections checked out of the pool.')
+DB_POOL_CHECKED_OUT = Gauge(
+    'db_pool_checked_out', 'Connections checked out of the pool.', multiprocess_mode='livesum')
+DB_POOL_OVERFLOW = Gauge(
+    'db_pool_overflow', 'Connections opened above the pool size.', multiprocess_mode='livesum')
+DB_POOL_EXHAUSTED = Counter(
+    'db_pool_exhausted_total', 'Checkouts which waited for a connection of an exhausted pool.')
+DB_POOL_WAIT = Histogram(
+    'db_pool_wait_seconds', 'Time to get a connection of the pool, opening it included.', buckets=DB_BUCKETS)
+DB_QUERY_DURATION = Histogram(
+    'db_query_duration_seconds', 'Statements by the repository method which executed them.',
+    ['method'], buckets=DB_BUCKETS)
+
+COALESCER_BATCH_SIZE = Histogram(
+    'coalescer_batch_size', 'Items applied in one batch by the coalescer.',
+    ['coalescer'], buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000))
+COALESCER_WAIT = Histogram(
+    'coalescer_wait_seconds', 'Time items waited in the coalescer for their batch to be applied.',
+    ['coalescer'], buckets=DB_BUCKETS)
+
+CACHE_HITS = Counter('cache_hits_total', 'Lookups answered by the per-worker cache.', ['cache'])
+CACHE_MISSES = Counter('cache_misses_total', 'Lookups not found in the per-worker cache.', ['cache'])
+
+TASKS_INGESTED = Counter('tasks_ingested_total', 'Tasks received for ingestion.')
+PRODUCT_CODES_INGESTED = Counter(
+    'product_codes_ingested_total', 'Product codes received for ingestion by result.', ['result'])
+AGGREGATIONS = Counter('aggregations_total', 'Aggregated product codes by outcome.', ['status'])
+
+PRODUCTS_FILTER_READY = Gauge(
+    'products_filter_ready', 'Workers with a loaded products filter.', multiprocess_mode='livesum')
+PRODUCTS_FILTER_CODES = Gauge(
+    'products_filter_codes', 'Product codes added to the filter of a worker.', multiprocess_mode='livemax')
+PRODUCTS_FILTER_SIZE = Gauge(
+    'products_filter_size_bytes', 'Memory of products filters of all workers.', multiprocess_mode='livesum')
+PRODUCTS_FILTER_FALSE_POSITIVE_RATE = Gauge(
+    'products_filter_false_positive_rate', 'Estimated false positive rate of the filter of a worker.',
+    multiprocess_mode='livemax')
+
+# Repository method executing statements of the current task.
+repository_method: ContextVar[str] = ContextVar('repository_method', default='other')
+
+
+def instrument_repository(cls: type) -> type:
+    """Attributes statements executed by public coroutine and async generator
+            methods of the repository class to the method."""
+    for name, method in list(vars(cls).items()):
+        if name.startswith('_'):
+            continue
+        label = f'{cls.__name__}.{name}'
+        if inspect.isasyncgenfunction(method):
+            setattr(cls, name, _instrument_generator(method, label))
+        elif inspect.iscoroutinefunction(method):
+            setattr(cls, name, _instrument_coroutine(method, label))
+    return cls
+
+
+def _instrument_coroutine(method, label: str):
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        token = repository_method.set(label)
+        try:
+            return await method(*args, **kwargs)
+        finally:
+            repository_method.reset(token)
+
+    return wrapper
+
+
+def _instrument_generator(method, label: str):
+    # Batches may be consumed by another task, so the label is only set while a batch is fetched.
+    @functools.wraps(method)
+    async def wrapper(*args, **kwargs):
+        generator = method(*args, **kwargs)
+        while True:
+            token = repository_method.set(label)
+            try:
+                item = await generator.__anext__()
+            except StopAsyncIteration:
+                return
+            finally:
+                repository_method.reset(token)
+            yield item
+
+    return wrapper
+
+
+def instrument_engine(engine: AsyncEngine) -> None:
+    """Records durations of statements, also for the stats of the current request,
+            and usage of the connection pool."""
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context.metrics_started_at = time.perf_counter()
+
+    @event.listens_for(sync_engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - context.metrics_started_at
+        DB_QUERY_DURATION.labels(repository_method.get()).observe(duration)
+        record_statement(statement, duration)
+
+    @event.listens_for(sync_engine, 'checkout')
+    def checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_POOL_CHECKOUTS.inc()
+        pool_usage(sync_engine.pool)
+
+    @event.listens_for(sync_engine, 'checkin')
+    def checkin(dbapi_connection, connection_record):
+        pool_usage(sync_engine.pool)
+
+
+def pool_usage(pool) -> None:
+    DB_POOL_CHECKED_OUT.set(pool.checkedout())
+    DB_POOL_OVERFLOW.set(max(pool.overflow(), 0))
+
+
+class MetricsMiddleware:
+    """Records latency and status of requests by the route template, so paths
+            with identifiers do not make new series."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or scope['path'] == METRICS_PATH:
+            await self.app(scope, receive, send)
+            return
+        method = scope['method']
+        status = 500
+
+        async def send_status(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method)
+        in_progress.inc()
+        started_at = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            duration = time.perf_counter() - started_at
+            in_progress.dec()
+            # The router stores the matched route in the scope.
+            route = getattr(scope.get('route'), 'path', UNMATCHED_ROUTE)
+            HTTP_REQUEST_DURATION.labels(method, route).observe(duration)
+            HTTP_REQUESTS.labels(method, route, status).inc()
+
+
+def metrics() -> Response:
+    """Controller to export metrics of all workers."""
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,91 @@
+"""Statements executed while serving an HTTP request.
+
+The engine hooks of src.adapters.metrics add every statement to the stats of the current
+request. They are returned in the Server-Timing header and logged when the request is done.
+"""
+import json
+import logging
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# Length of the slowest statement kept for the log.
+STATEMENT_LOG_LENGTH = 500
+
+
+@dataclass
+class QueryStats:
+    statements: int = 0
+    duration: float = 0
+    slowest_duration: float = 0
+    slowest_statement: str | None = None
+
+    def add(self, statement: str, duration: float) -> None:
+        self.statements += 1
+        self.duration += duration
+        if duration > self.slowest_duration:
+            self.slowest_duration = duration
+            self.slowest_statement = statement
+
+    def server_timing(self, elapsed: float) -> str:
+        return (
+            f'db;dur={self.duration * 1000:.3f};desc="{self.statements} statements", '
+            f'db-slowest;dur={self.slowest_duration * 1000:.3f}, '
+            f'app;dur={elapsed * 1000:.3f}'
+        )
+
+
+# Stats of the request being served, child tasks share them with the request.
+query_stats: ContextVar[QueryStats | None] = ContextVar('query_stats', default=None)
+
+
+def record_statement(statement: str, duration: float) -> None:
+    stats = query_stats.get()
+    if stats is not None:
+        stats.add(statement, duration)
+
+
+class QueryStatsMiddleware:
+    """Adds statements of the request to the Server-Timing header and logs them with
+            the request. Statements of a streamed body are only logged."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+        token = query_stats.set(stats)
+        started_at = time.perf_counter()
+        status = 500
+
+        async def send_timing(message: Message) -> None:
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                MutableHeaders(scope=message).append(
+                    'Server-Timing', stats.server_timing(time.perf_counter() - started_at))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_timing)
+        finally:
+            query_stats.reset(token)
+            logger.info(json.dumps({
+                'method': scope['method'],
+                'path': scope['path'],
+                'route': getattr(scope.get('route'), 'path', None),
+                'status': status,
+                'duration_ms': round((time.perf_counter() - started_at) * 1000, 3),
+                'db_statements': stats.statements,
+                'db_duration_ms': round(stats.duration * 1000, 3),
+                'db_slowest_ms': round(stats.slowest_duration * 1000, 3),
+                'db_slowest_statement': (stats.slowest_statement or '')[:STATEMENT_LOG_LENGTH] or None,
+            }, ensure_ascii=False))
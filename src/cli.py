@@ -0,0 +1,87 @@
+"""Maintenance commands, they run outside of the request-serving workers.
+
+    python -m src.cli partitions create   # creates partitions of products ahead
+    python -m src.cli partitions archive  # detaches and archives old closed partitions
+    python -m src.cli rollups refresh     # adds new aggregations to the analytics rollups
+    python -m src.cli progress fold       # moves deltas of progress counters into the counters
+    python -m src.cli idempotency prune   # deletes stored responses older than the retention
+"""
+import argparse
+import asyncio
+import logging
+
+from config import get_settings
+from src.containers import AdaptersContainer, RepositoriesContainer, ServicesContainer
+
+
+def build_services() -> ServicesContainer:
+    adapters = AdaptersContainer()
+    adapters.config.from_dict(get_settings().model_dump())
+    repositories = RepositoriesContainer(adapters=adapters)
+    return ServicesContainer(adapters=adapters, repositories=repositories)
+
+
+async def create_partitions(services: ServicesContainer) -> None:
+    await services.partitions_service().create_ahead()
+
+
+async def archive_partitions(services: ServicesContainer) -> None:
+    await services.partitions_service().archive()
+
+
+async def refresh_rollups(services: ServicesContainer) -> None:
+    await services.analytics_service().refresh()
+
+
+async def fold_progress(services: ServicesContainer) -> None:
+    await services.tasks_service().fold_progress()
+
+
+async def prune_idempotency(services: ServicesContainer) -> None:
+    await services.idempotency_service().prune()
+
+
+async def run(command) -> None:
+    services = build_services()
+    try:
+        await command(services)
+    finally:
+        await services.adapters.database().engine.dispose()
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(prog='python -m src.cli')
+    groups = parser.add_subparsers(required=True)
+    partitions = groups.add_parser('partitions', help="Partitions of products.").add_subparsers(required=True)
+    partitions.add_parser(
+        'create',
+        help="Creates partitions up to PARTITIONS_MONTHS_AHEAD months ahead.",
+    ).set_defaults(command=create_partitions)
+    partitions.add_parser(
+        'archive',
+        help="Archives closed partitions older than PARTITIONS_ARCHIVE_HORIZON_MONTHS months.",
+    ).set_defaults(command=archive_partitions)
+    rollups = groups.add_parser('rollups', help="Rollups of analytics.").add_subparsers(required=True)
+    rollups.add_parser(
+        'refresh',
+        help="Adds products aggregated since the last refresh to the rollups.",
+    ).set_defaults(command=refresh_rollups)
+    progress = groups.add_parser('progress', help="Progress counters of consignments.").add_subparsers(
+        required=True)
+    progress.add_parser(
+        'fold',
+        help="Moves deltas of progress counters into the counters of their consignments.",
+    ).set_defaults(command=fold_progress)
+    idempotency = groups.add_parser('idempotency', help="Stored responses of ingestion.").add_subparsers(
+        required=True)
+    idempotency.add_parser(
+        'prune',
+        help="Deletes responses stored more than IDEMPOTENCY_RETENTION seconds ago.",
+    ).set_defaults(command=prune_idempotency)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    asyncio.run(run(args.command))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,52 +1,132 @@
 from dependency_injector import containers, providers
 
+from src.adapters.cache import LRUCache
+from src.adapters.coalescer import Coalescer
 from src.adapters.database import Database
+from src.modules.analytics.repository import AnalyticsRepository
+from src.modules.analytics.service import AnalyticsService
+from src.modules.idempotency.repository import IdempotencyRepository
+from src.modules.idempotency.service import IdempotencyService
+from src.modules.partitions.repository import PartitionsRepository
+from src.modules.partitions.service import PartitionsService
+from src.modules.tasks.products_filter import ProductsFilter
 from src.modules.tasks.repository import TasksRepository
 from src.modules.tasks.service import TasksService
 
 
 class AdaptersContainer(containers.DeclarativeContainer):
 
-    wiring_config = containers.WiringConfiguration(
-        modules=[
-            "src.db_models",
-        ],
-    )
     config = providers.Configuration()
     database = providers.Singleton(
         Database,
-        db_url=config.database.url
+        db_url=config.database.url,
+        pool_size=config.database.pool_size,
+        max_overflow=config.database.max_overflow,
+        pool_timeout=config.database.pool_timeout,
+        pool_recycle=config.database.pool_recycle,
+        pool_pre_ping=config.database.pool_pre_ping,
+        pool_slow_wait=config.database.pool_slow_wait,
+        statement_cache_size=config.database.statement_cache_size,
+        pgbouncer=config.database.pgbouncer,
     )
     session = database.provided.async_session
+    consignments_cache = providers.Singleton(
+        LRUCache,
+        maxsize=config.cache.consignments_size,
+        ttl=config.cache.consignments_ttl,
+        negative_ttl=config.cache.consignments_negative_ttl,
+        name='consignments',
+    )
+    # Dates by consignment ID, unknown IDs are not cached.
+    consignment_dates_cache = providers.Singleton(
+        LRUCache,
+        maxsize=config.cache.consignment_dates_size,
+        ttl=config.cache.consignment_dates_ttl,
+        negative_ttl=0,
+        name='consignment_dates',
+    )
+    closed_tasks_cache = providers.Singleton(
+        LRUCache,
+        maxsize=config.cache.closed_tasks_size,
+        ttl=config.cache.closed_tasks_ttl,
+        negative_ttl=0,
+        name='closed_tasks',
+    )
+    aggregation_coalescer = providers.Singleton(
+        Coalescer,
+        window_ms=config.aggregation_coalescer.window_ms,
+        max_items=config.aggregation_coalescer.max_items,
+        name='aggregations',
+    )
 
 
 class RepositoriesContainer(containers.DeclarativeContainer):
 
-    wiring_config = containers.WiringConfiguration(
-        modules=[
-            "src.db_models", "src.modules"
-        ],
-    )
     adapters: AdaptersContainer = providers.Container(container_cls=AdaptersContainer)
     tasks_repository: TasksRepository = providers.Factory(
         TasksRepository,
+        consignments_cache=adapters.consignments_cache,
+        consignment_dates_cache=adapters.consignment_dates_cache,
+    )
+    partitions_repository: PartitionsRepository = providers.Factory(
+        PartitionsRepository,
+    )
+    analytics_repository: AnalyticsRepository = providers.Factory(
+        AnalyticsRepository,
+    )
+    idempotency_repository: IdempotencyRepository = providers.Factory(
+        IdempotencyRepository,
     )
 
 
 class ServicesContainer(containers.DeclarativeContainer):
+    # Only modules with Provide markers are wired, scanning packages slows the start of workers.
     wiring_config = containers.WiringConfiguration(
-        packages=['src.db_models', 'src.modules'],
         modules=[
-            "src.db_models",
-            "src.modules",
+            "src.modules.tasks.controllers",
+            "src.modules.analytics.controllers",
         ],
     )
     adapters: AdaptersContainer = providers.Container(container_cls=AdaptersContainer)
     repositories: RepositoriesContainer = providers.Container(
         RepositoriesContainer,
     )
+    products_filter: ProductsFilter = providers.Singleton(
+        ProductsFilter,
+        database=adapters.database,
+        tasks_repository=repositories.tasks_repository,
+        capacity=adapters.config.products_filter.capacity,
+        error_rate=adapters.config.products_filter.error_rate,
+        settle=adapters.config.products_filter.settle,
+    )
     tasks_service: TasksService = providers.Factory(
         TasksService,
         tasks_repository=repositories.tasks_repository,
         session_factory=adapters.session,
+        products_filter=products_filter,
+        closed_tasks_cache=adapters.closed_tasks_cache,
+        aggregation_coalescer=adapters.aggregation_coalescer,
+    )
+    partitions_service: PartitionsService = providers.Factory(
+        PartitionsService,
+        partitions_repository=repositories.partitions_repository,
+        session_factory=adapters.session,
+        months_ahead=adapters.config.partitions.months_ahead,
+        archive_horizon_months=adapters.config.partitions.archive_horizon_months,
+        archive_schema=adapters.config.partitions.archive_schema,
+    )
+    analytics_service: AnalyticsService = providers.Factory(
+        AnalyticsService,
+        analytics_repository=repositories.analytics_repository,
+        session_factory=adapters.session,
+        refresh_lag=adapters.config.rollups.refresh_lag,
+        refresh_step_hours=adapters.config.rollups.refresh_step_hours,
+    )
+    idempotency_service: IdempotencyService = providers.Factory(
+        IdempotencyService,
+        idempotency_repository=repositories.idempotency_repository,
+        session_factory=adapters.session,
+        retention=adapters.config.idempotency.retention,
+        hash_retention=adapters.config.idempotency.hash_retention,
+        prune_batch_size=adapters.config.idempotency.prune_batch_size,
     )
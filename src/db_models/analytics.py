@@ -0,0 +1,27 @@
+from datetime import datetime
+
+from sqlalchemy import Column, String, Integer, DateTime
+
+from src.adapters.database import Base
+
+
+class AggregationRollups(Base):
+    """Aggregated products by hour of aggregation and by line, shift, brigade and nomenclature
+    of their tasks. Reports read them instead of products_to_consignments."""
+    __tablename__ = "aggregation_rollups"
+
+    bucket: datetime = Column(DateTime, primary_key=True, nullable=False)
+    line: str = Column(String, primary_key=True, nullable=False)
+    shift: str = Column(String, primary_key=True, nullable=False)
+    brigade: str = Column(String, primary_key=True, nullable=False)
+    nomenclature: str = Column(String, primary_key=True, nullable=False)
+    aggregated_products: int = Column(Integer, nullable=False)
+
+
+class RollupWatermarks(Base):
+    """Products aggregated up to aggregated_at are counted in the rollup."""
+    __tablename__ = "rollup_watermarks"
+
+    rollup: str = Column(String, primary_key=True, nullable=False)
+    aggregated_at: datetime = Column(DateTime)
+    refreshed_at: datetime = Column(DateTime)
@@ -0,0 +1,23 @@
+from datetime import datetime
+
+from sqlalchemy import Column, String, Integer, LargeBinary, DateTime, Index
+
+from src.adapters.database import Base
+
+
+class IdempotencyKeys(Base):
+    """Responses of ingestion requests by their Idempotency-Key or by the hash of the request,
+    shared by all workers. Responses are replayed until expires_at, expired rows are deleted
+    by `python -m src.cli idempotency prune`."""
+    __tablename__ = "idempotency_keys"
+
+    key: str = Column(String, primary_key=True, nullable=False)
+    request_hash: str = Column(String, nullable=False)
+    status_code: int = Column(Integer, nullable=False)
+    media_type: str = Column(String)
+    body: bytes = Column(LargeBinary, nullable=False)
+    created_at: datetime = Column(DateTime, nullable=False)
+    expires_at: datetime = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+            Index('ix_idempotency_keys_expires_at', 'expires_at'),)
@@ -1,6 +1,8 @@
 from datetime import date, datetime
 
-from sqlalchemy import Column, Boolean, String, Integer, Date, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import (
+    Column, Boolean, String, Integer, BigInteger, Date, ForeignKey, DateTime, UniqueConstraint, Index, text, event, DDL,
+)
 from sqlalchemy.orm import Mapped, relationship
 
 from src.adapters.database import Base
@@ -13,6 +15,7 @@ class Consignments(Base):
     consignment_id: int = Column(Integer, primary_key=True, index=True, nullable=False)
     consignment_number: int = Column(Integer, nullable=False)
     consignment_date: date = Column(Date, nullable=False)
+    version: int = Column(Integer, nullable=False, default=1, server_default='1')
 
     tasks: Mapped[list["ShiftTasks"]] = relationship(
         back_populates="consignment",
@@ -26,7 +29,8 @@ class Consignments(Base):
 
     __table_args__ = (
             UniqueConstraint('consignment_number',
-                             'consignment_date'),)
+                             'consignment_date'),
+            Index('ix_consignments_consignment_date', 'consignment_date'),)
 
 
 class ShiftTasks(Base):
@@ -45,17 +49,81 @@ class ShiftTasks(Base):
     completed_at: datetime = Column(DateTime)
     consignment_id: int = Column(Integer, ForeignKey(Consignments.consignment_id), nullable=False)
     closed_at: datetime = Column(DateTime)
+    version: int = Column(Integer, nullable=False, default=1, server_default='1')
+    updated_at: datetime = Column(DateTime, default=datetime.now)
 
     consignment: Mapped["Consignments"] = relationship(
         back_populates="tasks",
     )
 
+    __table_args__ = (
+            UniqueConstraint('consignment_id'),
+            Index('ix_shift_tasks_started_at_task_id', 'started_at', 'task_id'),
+            Index('ix_shift_tasks_close_status_started_at_task_id', 'close_status', 'started_at', 'task_id'),
+            Index('ix_shift_tasks_completed_at', 'completed_at'),)
+
 
 class ProductsToConsignments(Base):
+    """Bindings of products to consignments, partitioned by month of the consignment date.
+    Product codes are unique across partitions through the products table."""
     __tablename__ = "products_to_consignments"
 
-    product_to_consignment_id: int = Column(Integer, primary_key=True, nullable=False)
+    product_to_consignment_id: int = Column(Integer, primary_key=True, autoincrement=True, nullable=False)
     product_id: str = Column(String, ForeignKey(Products.product_id), nullable=False)
     consignment_id: int = Column(Integer, ForeignKey(Consignments.consignment_id), nullable=False)
+    consignment_date: date = Column(Date, primary_key=True, nullable=False)
     is_aggregated: bool = Column(Boolean, default=False)
     aggregated_at: datetime = Column(DateTime, default=None)
+
+    __table_args__ = (
+            UniqueConstraint('product_id', 'consignment_date'),
+            Index('ix_products_to_consignments_consignment_id_product_id', 'consignment_id', 'product_id'),
+            Index('ix_products_to_consignments_not_aggregated', 'consignment_id', 'product_id',
+                  postgresql_where=text('is_aggregated = false')),
+            # Rollups read products aggregated since their last refresh.
+            Index('ix_products_to_consignments_aggregated_at', 'aggregated_at',
+                  postgresql_where=text('aggregated_at IS NOT NULL')),
+            {'postgresql_partition_by': 'RANGE (consignment_date)'},)
+
+
+class ConsignmentsProgress(Base):
+    """Counters of products bound to consignments and aggregated, folded from their deltas."""
+    __tablename__ = "consignments_progress"
+
+    consignment_id: int = Column(Integer, ForeignKey(Consignments.consignment_id), primary_key=True, nullable=False)
+    total_products: int = Column(Integer, nullable=False, default=0, server_default='0')
+    aggregated_products: int = Column(Integer, nullable=False, default=0, server_default='0')
+    first_aggregated_at: datetime = Column(DateTime)
+    last_aggregated_at: datetime = Column(DateTime)
+
+
+class ConsignmentsProgressDeltas(Base):
+    """Changes of progress counters. The statements which bind and aggregate products only insert
+    them, so scans of a consignment never wait for its counters row. They are moved into
+    consignments_progress by `python -m src.cli progress fold`."""
+    __tablename__ = "consignments_progress_deltas"
+    # Reads of progress sum deltas of their consignments only.
+    __table_args__ = (Index('ix_consignments_progress_deltas_consignment_id', 'consignment_id'),)
+
+    delta_id: int = Column(BigInteger, primary_key=True, autoincrement=True, nullable=False)
+    consignment_id: int = Column(Integer, ForeignKey(Consignments.consignment_id), nullable=False)
+    total_products: int = Column(Integer, nullable=False, default=0, server_default='0')
+    aggregated_products: int = Column(Integer, nullable=False, default=0, server_default='0')
+    first_aggregated_at: datetime = Column(DateTime)
+    last_aggregated_at: datetime = Column(DateTime)
+
+
+PRODUCTS_DEFAULT_PARTITION = f'{ProductsToConsignments.__tablename__}_default'
+
+
+def is_products_partition(name: str) -> bool:
+    """Tells if the table is a partition of products_to_consignments."""
+    return name.startswith(f'{ProductsToConsignments.__tablename__}_')
+
+
+# Rows of months without a partition yet land in the default one.
+event.listen(
+    ProductsToConsignments.__table__,
+    'after_create',
+    DDL(f'CREATE TABLE {PRODUCTS_DEFAULT_PARTITION} PARTITION OF {ProductsToConsignments.__tablename__} DEFAULT'),
+)
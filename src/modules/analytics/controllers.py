@@ -0,0 +1,50 @@
+from datetime import datetime
+
+from dependency_injector.wiring import inject, Provide
+from fastapi import APIRouter, Depends, Query
+
+from src.containers import ServicesContainer
+from src.modules.analytics.schemas import Dimension, Granularity, ThroughputRow
+from src.modules.analytics.service import AnalyticsService
+from src.modules.responses import ModelsResponse
+
+router_analytics = APIRouter(prefix='/v1/analytics', tags=['Analytics'])
+
+
+@inject
+async def get_throughput(
+    service: AnalyticsService = Depends(Provide[ServicesContainer.analytics_service]),
+    group_by: list[Dimension] = Query([]),
+    granularity: Granularity = Query(Granularity.hour),
+    start: datetime | None = Query(None),
+    end: datetime | None = Query(None),
+    line: str | None = Query(None),
+    shift: str | None = Query(None),
+    brigade: str | None = Query(None),
+    nomenclature: str | None = Query(None),
+) -> list[ThroughputRow]:
+    """Controller to get aggregated products by time buckets, lines, shifts, brigades and nomenclatures.
+            Only rollups are read, products aggregated up to the X-Rollup-Watermark header are counted."""
+    filters = {
+        Dimension.line: line,
+        Dimension.shift: shift,
+        Dimension.brigade: brigade,
+        Dimension.nomenclature: nomenclature,
+    }
+    report = await service.get_throughput(
+        group_by=group_by,
+        granularity=granularity,
+        start=start,
+        end=end,
+        filters={dimension: value for dimension, value in filters.items() if value is not None},
+    )
+    headers = {'X-Rollup-Watermark': report.watermark.isoformat()} if report.watermark else None
+    return ModelsResponse(report.rows, headers=headers)
+
+
+router_analytics.add_api_route(
+    path='/throughput',
+    endpoint=get_throughput,
+    summary="Gets aggregated products from hourly rollups.",
+    methods=['GET'],
+)
@@ -0,0 +1,132 @@
+from datetime import datetime
+
+from sqlalchemy import select, update, func, literal_column
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.adapters.metrics import instrument_repository
+from src.db_models.analytics import AggregationRollups, RollupWatermarks
+from src.db_models.tasks import ShiftTasks, ProductsToConsignments
+from src.modules.analytics.schemas import Dimension, Granularity, ThroughputRow
+
+AGGREGATIONS_ROLLUP = AggregationRollups.__tablename__
+
+
+@instrument_repository
+class AnalyticsRepository:
+
+    async def lock_watermark(
+        self,
+        session: AsyncSession,
+        rollup: str,
+    ) -> datetime | None:
+        """Locks the watermark of the rollup until the end of the transaction, so refreshes
+                do not run concurrently, and returns it. None if the rollup was never refreshed."""
+        await session.execute(pg_insert(RollupWatermarks).values(rollup=rollup).on_conflict_do_nothing())
+        stmt = (
+            select(RollupWatermarks.aggregated_at)
+            .where(RollupWatermarks.rollup == rollup)
+            .with_for_update()
+        )
+        return (await session.execute(stmt)).scalar()
+
+    async def get_watermark(
+        self,
+        session: AsyncSession,
+        rollup: str,
+    ) -> datetime | None:
+        """Gets the time products are counted in the rollup up to."""
+        stmt = select(RollupWatermarks.aggregated_at).where(RollupWatermarks.rollup == rollup)
+        return (await session.execute(stmt)).scalar()
+
+    async def set_watermark(
+        self,
+        session: AsyncSession,
+        rollup: str,
+        aggregated_at: datetime,
+    ) -> None:
+        """Moves the watermark of the locked rollup."""
+        stmt = (
+            update(RollupWatermarks)
+            .values(aggregated_at=aggregated_at,
+                    refreshed_at=datetime.now())
+            .where(RollupWatermarks.rollup == rollup)
+        )
+        await session.execute(stmt)
+
+    async def get_first_aggregation(
+        self,
+        session: AsyncSession,
+    ) -> datetime | None:
+        """Gets the time of the earliest aggregation."""
+        return (await session.execute(select(func.min(ProductsToConsignments.aggregated_at)))).scalar()
+
+    async def add_aggregations(
+        self,
+        session: AsyncSession,
+        after: datetime,
+        until: datetime,
+    ) -> int:
+        """Adds products aggregated in (after, until] to hourly rollups by dimensions of their tasks
+                with one statement. Returns the number of added products."""
+        dimensions = [dimension.value for dimension in Dimension]
+        # Task columns are nullable, rollups keep them as parts of the primary key.
+        aggregated = (
+            select(func.date_trunc(literal_column("'hour'"), ProductsToConsignments.aggregated_at).label('bucket'),
+                   *(func.coalesce(getattr(ShiftTasks, dimension), '').label(dimension) for dimension in dimensions))
+            .join(ShiftTasks, ShiftTasks.consignment_id == ProductsToConsignments.consignment_id)
+            .where(ProductsToConsignments.aggregated_at > after,
+                   ProductsToConsignments.aggregated_at <= until)
+            .subquery('aggregated')
+        )
+        keys = [aggregated.c.bucket, *(aggregated.c[dimension] for dimension in dimensions)]
+        counts = (
+            select(*keys, func.count().label('aggregated_products'))
+            .group_by(*keys)
+            .cte('counts')
+        )
+        added = pg_insert(AggregationRollups).from_select(
+            ['bucket', *dimensions, 'aggregated_products'],
+            select(counts),
+        )
+        added = (
+            added.on_conflict_do_update(
+                index_elements=[AggregationRollups.bucket, *dimensions],
+                set_={'aggregated_products': (
+                    AggregationRollups.aggregated_products + added.excluded.aggregated_products
+                )},
+            )
+            .returning(AggregationRollups.bucket)
+            .cte('added')
+        )
+        stmt = select(func.coalesce(func.sum(counts.c.aggregated_products), 0)).add_cte(added)
+        return (await session.execute(stmt)).scalar()
+
+    async def get_throughput(
+        self,
+        session: AsyncSession,
+        group_by: list[Dimension],
+        granularity: Granularity = Granularity.hour,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        filters: dict[Dimension, str] | None = None,
+    ) -> list[ThroughputRow]:
+        """Sums rollups of buckets starting in [start, end) by buckets of the granularity
+                and by the dimensions."""
+        bucket = AggregationRollups.bucket
+        if granularity != Granularity.hour:
+            bucket = func.date_trunc(literal_column(f"'{granularity.value}'"), AggregationRollups.bucket)
+        columns = [getattr(AggregationRollups, dimension) for dimension in group_by]
+        stmt = select(
+            bucket.label('bucket'),
+            *columns,
+            func.sum(AggregationRollups.aggregated_products).label('aggregated_products'),
+        )
+        if start:
+            stmt = stmt.where(AggregationRollups.bucket >= start)
+        if end:
+            stmt = stmt.where(AggregationRollups.bucket < end)
+        for dimension, value in (filters or {}).items():
+            stmt = stmt.where(getattr(AggregationRollups, dimension) == value)
+        stmt = stmt.group_by(bucket, *columns).order_by(bucket, *columns)
+        return [ThroughputRow(**row._mapping) for row in await session.execute(stmt)]
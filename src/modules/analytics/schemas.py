@@ -0,0 +1,30 @@
+from datetime import datetime
+from enum import StrEnum
+
+from pydantic import BaseModel
+
+
+class Dimension(StrEnum):
+    line = 'line'
+    shift = 'shift'
+    brigade = 'brigade'
+    nomenclature = 'nomenclature'
+
+
+class Granularity(StrEnum):
+    hour = 'hour'
+    day = 'day'
+
+
+class ThroughputRow(BaseModel):
+    bucket: datetime
+    line: str | None = None
+    shift: str | None = None
+    brigade: str | None = None
+    nomenclature: str | None = None
+    aggregated_products: int
+
+
+class ThroughputReport(BaseModel):
+    watermark: datetime | None
+    rows: list[ThroughputRow]
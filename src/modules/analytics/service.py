@@ -0,0 +1,84 @@
+import logging
+from datetime import datetime, timedelta
+
+from src.adapters.database import AsyncSessionManager
+from src.base_service import BaseService
+from src.modules.analytics.repository import AnalyticsRepository, AGGREGATIONS_ROLLUP
+from src.modules.analytics.schemas import Dimension, Granularity, ThroughputReport
+
+logger = logging.getLogger(__name__)
+
+
+class AnalyticsService(BaseService):
+    """Reports on aggregated products. They are served from rollups, which are refreshed
+            outside of the request-serving workers."""
+
+    def __init__(
+        self,
+        session_factory: AsyncSessionManager,
+        analytics_repository: AnalyticsRepository,
+        refresh_lag: float,
+        refresh_step_hours: int,
+    ):
+        super().__init__(session_factory)
+        self.analytics_repository = analytics_repository
+        self.refresh_lag = timedelta(seconds=refresh_lag)
+        self.refresh_step = timedelta(hours=refresh_step_hours)
+
+    async def refresh(self, now: datetime | None = None) -> int:
+        """Adds products aggregated since the watermark to the rollups. Aggregation times are set
+                before commit, so products aggregated in the last refresh_lag seconds are left
+                to the next refresh. Windows of refresh_step hours are committed one by one.
+                Returns the number of added products."""
+        until = (now or datetime.now()) - self.refresh_lag
+        added = 0
+        while True:
+            async with self.session_factory() as session:
+                after = await self.analytics_repository.lock_watermark(
+                    session=session,
+                    rollup=AGGREGATIONS_ROLLUP,
+                )
+                if after is None:
+                    first = await self.analytics_repository.get_first_aggregation(session=session)
+                    after = first - timedelta(microseconds=1) if first else until
+                window_end = min(after + self.refresh_step, until)
+                if window_end > after:
+                    added += await self.analytics_repository.add_aggregations(
+                        session=session,
+                        after=after,
+                        until=window_end,
+                    )
+                await self.analytics_repository.set_watermark(
+                    session=session,
+                    rollup=AGGREGATIONS_ROLLUP,
+                    aggregated_at=max(after, window_end),
+                )
+            if window_end >= until:
+                break
+        logger.info('Added %s aggregated products to rollups up to %s', added, until)
+        return added
+
+    async def get_throughput(
+        self,
+        group_by: list[Dimension],
+        granularity: Granularity = Granularity.hour,
+        start: datetime | None = None,
+        end: datetime | None = None,
+        filters: dict[Dimension, str] | None = None,
+    ) -> ThroughputReport:
+        """Gets aggregated products by time buckets and dimensions of tasks from the rollups
+                with the watermark they are complete up to."""
+        async with self.session_factory() as session:
+            watermark = await self.analytics_repository.get_watermark(
+                session=session,
+                rollup=AGGREGATIONS_ROLLUP,
+            )
+            rows = await self.analytics_repository.get_throughput(
+                session=session,
+                group_by=list(dict.fromkeys(group_by)),
+                granularity=granularity,
+                start=start.replace(tzinfo=None) if start else None,
+                end=end.replace(tzinfo=None) if end else None,
+                filters=filters,
+            )
+        return ThroughputReport(watermark=watermark, rows=rows)
@@ -0,0 +1,15 @@
+from hashlib import sha1
+
+
+def make_etag(*parts) -> str:
+    """Builds a weak ETag from the values the representation depends on."""
+    digest = sha1(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """Checks the If-None-Match header against the ETag with the weak comparison."""
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+    return '*' in tags or etag.removeprefix('W/') in tags
@@ -23,3 +23,14 @@ class HTTPBadRequestError(HTTPException):
     ):
         super().__init__(
             status_code=status_code, detail=detail)
+
+
+class HTTPConflictError(HTTPException):
+
+    def __init__(
+        self,
+        status_code: int = 409,
+        detail: Any = "Conflict",
+    ):
+        super().__init__(
+            status_code=status_code, detail=detail)
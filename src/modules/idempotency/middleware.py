@@ -0,0 +1,117 @@
+"""Repeated ingestion requests answered with the stored response.
+
+A request is identified by its Idempotency-Key header, or by the hash of its method, path
+and raw body when the header is missing. The first successful response of a request is
+stored in PostgreSQL and shared by all workers, a repeated request gets it back without
+parsing the body or running the route. Responses of requests without the header are only
+kept for the short retry window: an identical batch sent later, e.g. once the consignments
+of its products exist, is ingested again. Ingestion stays idempotent by itself, a request
+repeated before the response of the first one is stored runs again.
+"""
+import hashlib
+import logging
+from collections.abc import Callable, Mapping
+
+from starlette.datastructures import Headers
+from starlette.responses import JSONResponse, Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.modules.idempotency.service import IdempotencyService
+
+logger = logging.getLogger(__name__)
+
+KEY_HEADER = 'idempotency-key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+
+# Decides by the body of a 2xx response whether it may be replayed.
+Storable = Callable[[bytes], bool]
+
+
+def always(body: bytes) -> bool:
+    return True
+
+
+class IdempotencyMiddleware:
+    """Stores 2xx responses of the routes, given as (method, path), which their Storable
+            accepts and replays them. Register it inside CORSMiddleware, replays need its headers."""
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        service_factory: Callable[[], IdempotencyService],
+        routes: Mapping[tuple[str, str], Storable],
+    ) -> None:
+        self.app = app
+        self.service_factory = service_factory
+        self.routes = routes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http' or (scope['method'], scope['path']) not in self.routes:
+            await self.app(scope, receive, send)
+            return
+        storable = self.routes[scope['method'], scope['path']]
+        body = await read_body(receive)
+        request_hash = hashlib.sha256(f"{scope['method']} {scope['path']}\n".encode() + body).hexdigest()
+        idempotency_key = Headers(scope=scope).get(KEY_HEADER)
+        key = f'key:{idempotency_key}' if idempotency_key else f'hash:{request_hash}'
+        service = self.service_factory()
+
+        stored = await service.get_response(key)
+        if stored is not None:
+            if stored.request_hash != request_hash:
+                response = JSONResponse(
+                    {'detail': "Idempotency-Key was already used with another request"}, status_code=422)
+            else:
+                response = Response(
+                    stored.body,
+                    status_code=stored.status_code,
+                    media_type=stored.media_type,
+                    headers={REPLAYED_HEADER: 'true'},
+                )
+            await response(scope, receive, send)
+            return
+
+        body_sent = False
+
+        async def replay_body() -> Message:
+            nonlocal body_sent
+            if body_sent:
+                return await receive()
+            body_sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+
+        status = 500
+        media_type = None
+        chunks = []
+
+        async def capture(message: Message) -> None:
+            nonlocal status, media_type
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                media_type = Headers(raw=message['headers']).get('content-type')
+            elif message['type'] == 'http.response.body':
+                chunks.append(message.get('body', b''))
+            await send(message)
+
+        await self.app(scope, replay_body, capture)
+        response_body = b''.join(chunks)
+        if not 200 <= status < 300 or not storable(response_body):
+            return
+        try:
+            await service.save_response(
+                key, request_hash, status, media_type, response_body, keyed=idempotency_key is not None)
+        except Exception:
+            # The response is sent already, the request runs again when it is repeated.
+            logger.exception('Failed to store the response of %s %s', scope['method'], scope['path'])
+
+
+async def read_body(receive: Receive) -> bytes:
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] != 'http.request':
+            break
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            break
+    return b''.join(chunks)
@@ -0,0 +1,75 @@
+from datetime import datetime
+
+from sqlalchemy import Row, select, delete
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.adapters.metrics import instrument_repository
+from src.db_models.idempotency import IdempotencyKeys
+
+
+@instrument_repository
+class IdempotencyRepository:
+
+    async def get_response(
+        self,
+        session: AsyncSession,
+        key: str,
+        now: datetime,
+    ) -> Row | None:
+        """Gets the stored response of the key unless it expired."""
+        stmt = (
+            select(IdempotencyKeys.request_hash,
+                   IdempotencyKeys.status_code,
+                   IdempotencyKeys.media_type,
+                   IdempotencyKeys.body)
+            .where(IdempotencyKeys.key == key,
+                   IdempotencyKeys.expires_at > now)
+        )
+        return (await session.execute(stmt)).one_or_none()
+
+    async def save_response(
+        self,
+        session: AsyncSession,
+        key: str,
+        request_hash: str,
+        status_code: int,
+        media_type: str | None,
+        body: bytes,
+        now: datetime,
+        expires_at: datetime,
+    ) -> None:
+        """Stores the response of the key. A response stored by a concurrent request is kept
+                unless it expired."""
+        stmt = pg_insert(IdempotencyKeys).values(
+            key=key,
+            request_hash=request_hash,
+            status_code=status_code,
+            media_type=media_type,
+            body=body,
+            created_at=now,
+            expires_at=expires_at,
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[IdempotencyKeys.key],
+            set_={column: stmt.excluded[column]
+                  for column in ('request_hash', 'status_code', 'media_type', 'body', 'created_at', 'expires_at')},
+            where=IdempotencyKeys.expires_at <= now,
+        )
+        await session.execute(stmt)
+
+    async def delete_expired(
+        self,
+        session: AsyncSession,
+        now: datetime,
+        limit: int,
+    ) -> int:
+        """Deletes up to limit expired responses. Returns the number of deleted ones."""
+        expired = (
+            select(IdempotencyKeys.key)
+            .where(IdempotencyKeys.expires_at <= now)
+            .limit(limit)
+            .scalar_subquery()
+        )
+        result = await session.execute(delete(IdempotencyKeys).where(IdempotencyKeys.key.in_(expired)))
+        return result.rowcount
@@ -0,0 +1,78 @@
+import logging
+from datetime import datetime, timedelta
+
+from sqlalchemy import Row
+
+from src.adapters.database import AsyncSessionManager
+from src.base_service import BaseService
+from src.modules.idempotency.repository import IdempotencyRepository
+
+logger = logging.getLogger(__name__)
+
+
+class IdempotencyService(BaseService):
+
+    def __init__(
+        self,
+        session_factory: AsyncSessionManager,
+        idempotency_repository: IdempotencyRepository,
+        retention: float,
+        hash_retention: float,
+        prune_batch_size: int,
+    ):
+        super().__init__(session_factory)
+        self.idempotency_repository = idempotency_repository
+        self.retention = timedelta(seconds=retention)
+        self.hash_retention = timedelta(seconds=hash_retention)
+        self.prune_batch_size = prune_batch_size
+
+    async def get_response(self, key: str) -> Row | None:
+        """Gets the response stored for the key unless it expired."""
+        async with self.session_factory() as session:
+            return await self.idempotency_repository.get_response(
+                session=session,
+                key=key,
+                now=datetime.now(),
+            )
+
+    async def save_response(
+        self,
+        key: str,
+        request_hash: str,
+        status_code: int,
+        media_type: str | None,
+        body: bytes,
+        keyed: bool,
+    ) -> None:
+        """Stores the response for the key. Responses of requests without an Idempotency-Key
+                are only kept for the retry window of hash_retention."""
+        now = datetime.now()
+        async with self.session_factory() as session:
+            await self.idempotency_repository.save_response(
+                session=session,
+                key=key,
+                request_hash=request_hash,
+                status_code=status_code,
+                media_type=media_type,
+                body=body,
+                now=now,
+                expires_at=now + (self.retention if keyed else self.hash_retention),
+            )
+
+    async def prune(self, now: datetime | None = None) -> int:
+        """Deletes expired responses in batches, every batch is committed on its own.
+                Returns the number of deleted responses."""
+        now = now or datetime.now()
+        pruned = 0
+        while True:
+            async with self.session_factory() as session:
+                deleted = await self.idempotency_repository.delete_expired(
+                    session=session,
+                    now=now,
+                    limit=self.prune_batch_size,
+                )
+            pruned += deleted
+            if deleted < self.prune_batch_size:
+                break
+        logger.info('Pruned %s idempotency keys expired before %s', pruned, now)
+        return pruned
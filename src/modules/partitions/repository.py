@@ -0,0 +1,97 @@
+import re
+from datetime import date
+
+from sqlalchemy import select, text, exists
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.adapters.metrics import instrument_repository
+from src.db_models.tasks import ShiftTasks, Consignments, ProductsToConsignments, PRODUCTS_DEFAULT_PARTITION
+
+PARTITIONED_TABLE = ProductsToConsignments.__tablename__
+MONTH_PARTITION = re.compile(rf'^{PARTITIONED_TABLE}_y(\d{{4}})m(\d{{2}})$')
+
+
+def add_months(month: date, months: int) -> date:
+    """Returns the first day of the month shifted by the number of months."""
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f'{PARTITIONED_TABLE}_y{month:%Y}m{month:%m}'
+
+
+@instrument_repository
+class PartitionsRepository:
+
+    async def get_partitions(
+        self,
+        session: AsyncSession,
+    ) -> dict[date, str]:
+        """Gets attached monthly partitions of products by their first day."""
+        stmt = text('''
+            SELECT c.relname
+            FROM pg_inherits AS i JOIN pg_class AS c ON c.oid = i.inhrelid
+            WHERE i.inhparent = CAST(:table AS regclass)
+        ''')
+        partitions = {}
+        for name in (await session.execute(stmt, {'table': PARTITIONED_TABLE})).scalars():
+            if match := MONTH_PARTITION.match(name):
+                partitions[date(int(match[1]), int(match[2]), 1)] = name
+        return partitions
+
+    async def create_partition(
+        self,
+        session: AsyncSession,
+        month: date,
+    ) -> str:
+        """Creates the partition of products of the month. Rows of the month that already
+                landed in the default partition are moved into it before it is attached.
+                The default partition is locked against writes first, rows of the month bound
+                between the move and the attach would make the attach fail."""
+        name = partition_name(month)
+        start, end = month, add_months(month, 1)
+        await session.execute(text(f'CREATE TABLE {name} (LIKE {PARTITIONED_TABLE} INCLUDING DEFAULTS)'))
+        await session.execute(text(f'LOCK TABLE {PRODUCTS_DEFAULT_PARTITION} IN SHARE ROW EXCLUSIVE MODE'))
+        await session.execute(
+            text(f'''
+                WITH moved AS (
+                    DELETE FROM {PRODUCTS_DEFAULT_PARTITION}
+                    WHERE consignment_date >= :start AND consignment_date < :end
+                    RETURNING *
+                )
+                INSERT INTO {name} SELECT * FROM moved
+            '''),
+            {'start': start, 'end': end},
+        )
+        await session.execute(text(
+            f"ALTER TABLE {PARTITIONED_TABLE} ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+        ))
+        return name
+
+    async def has_open_tasks(
+        self,
+        session: AsyncSession,
+        month: date,
+    ) -> bool:
+        """Checks if consignments of the month have tasks that are not closed."""
+        stmt = select(exists(
+            select(ShiftTasks.task_id)
+            .join(ShiftTasks.consignment)
+            .where(Consignments.consignment_date >= month,
+                   Consignments.consignment_date < add_months(month, 1),
+                   ShiftTasks.close_status.is_not(True))
+        ))
+        return (await session.execute(stmt)).scalar()
+
+    async def archive_partition(
+        self,
+        session: AsyncSession,
+        name: str,
+        schema: str,
+    ) -> None:
+        """Detaches the partition and moves it to the archive schema."""
+        await session.execute(text(f'CREATE SCHEMA IF NOT EXISTS {schema}'))
+        await session.execute(text(f'ALTER TABLE {PARTITIONED_TABLE} DETACH PARTITION {name}'))
+        await session.execute(text(f'ALTER TABLE {name} SET SCHEMA {schema}'))
@@ -0,0 +1,66 @@
+import logging
+from datetime import date
+
+from src.adapters.database import AsyncSessionManager
+from src.base_service import BaseService
+from src.modules.partitions.repository import PartitionsRepository, add_months
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionsService(BaseService):
+    """Maintains monthly partitions of products, runs outside of the request-serving workers."""
+
+    def __init__(
+        self,
+        session_factory: AsyncSessionManager,
+        partitions_repository: PartitionsRepository,
+        months_ahead: int,
+        archive_horizon_months: int,
+        archive_schema: str,
+    ):
+        super().__init__(session_factory)
+        self.partitions_repository = partitions_repository
+        self.months_ahead = months_ahead
+        self.archive_horizon_months = archive_horizon_months
+        self.archive_schema = archive_schema
+
+    async def create_ahead(self, today: date | None = None) -> list[str]:
+        """Creates missing partitions from the current month to months_ahead months ahead.
+                Returns names of created partitions."""
+        current = (today or date.today()).replace(day=1)
+        created = []
+        async with self.session_factory() as session:
+            partitions = await self.partitions_repository.get_partitions(session=session)
+            for month in (add_months(current, months) for months in range(self.months_ahead + 1)):
+                if month not in partitions:
+                    created.append(await self.partitions_repository.create_partition(
+                        session=session,
+                        month=month,
+                    ))
+        logger.info('created partitions: %s', created)
+        return created
+
+    async def archive(self, today: date | None = None) -> list[str]:
+        """Detaches partitions older than archive_horizon_months whose tasks are all closed
+                and moves them to archive_schema. Returns names of archived partitions."""
+        horizon = add_months((today or date.today()).replace(day=1), -self.archive_horizon_months)
+        async with self.session_factory() as session:
+            partitions = await self.partitions_repository.get_partitions(session=session)
+        archived = []
+        for month, name in sorted(partitions.items()):
+            if add_months(month, 1) > horizon:
+                break
+            # Detaching locks the whole table, every partition is committed separately.
+            async with self.session_factory() as session:
+                if await self.partitions_repository.has_open_tasks(session=session, month=month):
+                    logger.info('partition %s has open tasks, skipped', name)
+                    continue
+                await self.partitions_repository.archive_partition(
+                    session=session,
+                    name=name,
+                    schema=self.archive_schema,
+                )
+            archived.append(name)
+        logger.info('archived partitions: %s', archived)
+        return archived
@@ -0,0 +1,16 @@
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+
+
+def _fields(model: BaseModel) -> dict:
+    # Models are validated when they are built, their fields are serialized as they are.
+    return model.__dict__
+
+
+class ModelsResponse(JSONResponse):
+    """Serializes validated models and lists of them with orjson. FastAPI returns responses
+            of controllers as they are, so the response model of the route is only documented."""
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, default=_fields)
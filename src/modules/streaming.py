@@ -0,0 +1,56 @@
+import csv
+import io
+import zlib
+from collections.abc import AsyncIterator
+
+from pydantic import BaseModel
+
+NDJSON_MEDIA_TYPE = 'application/x-ndjson'
+CSV_MEDIA_TYPE = 'text/csv'
+
+
+async def ndjson(batches: AsyncIterator[list[BaseModel]]) -> AsyncIterator[bytes]:
+    """Encodes batches of models as newline delimited JSON, one chunk per batch."""
+    async for batch in batches:
+        yield b''.join(model.model_dump_json().encode() + b'\n' for model in batch)
+
+
+async def csv_rows(
+    batches: AsyncIterator[list[BaseModel]],
+    fields: list[str],
+) -> AsyncIterator[bytes]:
+    """Encodes batches of models as CSV with a header, one chunk per batch."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    include = set(fields)
+    async for batch in batches:
+        writer.writerows(
+            [model.model_dump(mode='json', include=include)[field] for field in fields]
+            for model in batch
+        )
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+async def gzipped(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Compresses chunks into a gzip stream on the fly."""
+    compressor = zlib.compressobj(wbits=31)
+    async for chunk in chunks:
+        if data := compressor.compress(chunk):
+            yield data
+    yield compressor.flush()
+
+
+async def lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Splits a stream of chunks into lines."""
+    tail = b''
+    async for chunk in chunks:
+        *complete, tail = (tail + chunk).split(b'\n')
+        for line in complete:
+            yield line
+    if tail:
+        yield tail
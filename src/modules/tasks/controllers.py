@@ -1,10 +1,18 @@
 from datetime import date
 
 from dependency_injector.wiring import inject, Provide
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Body, Depends, Header, Query, Request, Response
+from fastapi.responses import StreamingResponse
 
 from src.containers import ServicesContainer
-from src.modules.tasks.schemas import AddTaskModel, Task, AddProductModel, UpdateTaskModel
+from src.modules.responses import ModelsResponse
+from src.modules.streaming import ndjson, csv_rows, gzipped, lines, NDJSON_MEDIA_TYPE, CSV_MEDIA_TYPE
+from src.modules.tasks.schemas import (
+    AddTaskModel, Task, AddProductModel, UpdateTaskModel, AddProductsResult, AggregatedProduct,
+    AggregateProductModel, AggregationResult, ProductsInclusion, TaskProduct, ExportFormat, ConsignmentProgress,
+    LineProgress,
+)
+from src.modules.tasks.repository import MAX_AGGREGATION_BATCH
 from src.modules.tasks.service import TasksService
 
 router_tasks = APIRouter(prefix='/v1/tasks', tags=['Tasks'])
@@ -37,11 +45,15 @@ async def get_tasks(
     consignment_date: date | None = Query(None),
     start_date: date | None = Query(None),
     end_date: date | None = Query(None),
-    offset: int = 0,
-    limit: int = 30,
+    offset: int = Query(0, ge=0),
+    limit: int = Query(30, ge=1, le=1000),
+    cursor: str | None = Query(None),
+    include_products: ProductsInclusion = Query(ProductsInclusion.full),
+    if_none_match: str | None = Header(None),
 ) -> list[Task]:
-    """Controller to get tasks."""
-    return await service.get_tasks(
+    """Controller to get tasks. The cursor of the next page is returned in the X-Next-Cursor header.
+            Responds with 304 if the page ETag matches If-None-Match."""
+    page = await service.get_tasks(
         close_status=close_status,
         consignment_number=consignment_number,
         consignment_date=consignment_date,
@@ -49,7 +61,16 @@ async def get_tasks(
         end_date=end_date,
         offset=offset,
         limit=limit,
+        cursor=cursor,
+        include_products=include_products,
+        if_none_match=if_none_match,
     )
+    headers = {'ETag': page.etag, 'Cache-Control': 'no-cache'}
+    if page.next_cursor:
+        headers['X-Next-Cursor'] = page.next_cursor
+    if page.tasks is None:
+        return Response(status_code=304, headers=headers)
+    return ModelsResponse(page.tasks, headers=headers)
 
 
 router_tasks.add_api_route(
@@ -60,13 +81,115 @@ router_tasks.add_api_route(
 )
 
 
+@inject
+async def export_tasks(
+    service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+    close_status: bool | None = Query(None),
+    consignment_number: int | None = Query(None),
+    consignment_date: date | None = Query(None),
+    start_date: date | None = Query(None),
+    end_date: date | None = Query(None),
+    export_format: ExportFormat = Query(ExportFormat.ndjson, alias='format'),
+    compress: bool = Query(False, alias='gzip'),
+) -> StreamingResponse:
+    """Controller to export all filtered tasks as newline delimited JSON or CSV."""
+    batches = service.export_tasks(
+        close_status=close_status,
+        consignment_number=consignment_number,
+        consignment_date=consignment_date,
+        start_date=start_date,
+        end_date=end_date,
+    )
+    if export_format == ExportFormat.csv:
+        fields = [field for field in Task.model_fields if field not in ('products', 'products_count')]
+        content, media_type = csv_rows(batches, fields=fields), CSV_MEDIA_TYPE
+    else:
+        content, media_type = ndjson(batches), NDJSON_MEDIA_TYPE
+    headers = {'Content-Disposition': f'attachment; filename="tasks.{export_format}"'}
+    if compress:
+        content = gzipped(content)
+        headers['Content-Encoding'] = 'gzip'
+    return StreamingResponse(content, media_type=media_type, headers=headers)
+
+
+router_tasks.add_api_route(
+    path='/export',
+    endpoint=export_tasks,
+    summary="Exports tasks.",
+    methods=['GET'],
+)
+
+
+@inject
+async def get_consignments_progress(
+    service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+    close_status: bool | None = Query(None),
+    consignment_number: int | None = Query(None),
+    consignment_date: date | None = Query(None),
+    start_date: date | None = Query(None),
+    end_date: date | None = Query(None),
+    line: str | None = Query(None),
+    cursor: int | None = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+) -> list[ConsignmentProgress]:
+    """Controller to get aggregated and total products of consignments of filtered tasks.
+            The cursor of the next page is returned in the X-Next-Cursor header."""
+    page = await service.get_consignments_progress(
+        close_status=close_status,
+        consignment_number=consignment_number,
+        consignment_date=consignment_date,
+        start_date=start_date,
+        end_date=end_date,
+        line=line,
+        cursor=cursor,
+        limit=limit,
+    )
+    headers = {'X-Next-Cursor': str(page.next_cursor)} if page.next_cursor else None
+    return ModelsResponse(page.consignments, headers=headers)
+
+
+router_tasks.add_api_route(
+    path='/progress',
+    endpoint=get_consignments_progress,
+    summary="Gets aggregation progress of consignments.",
+    methods=['GET'],
+)
+
+
+@inject
+async def get_lines_progress(
+    service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+    close_status: bool | None = Query(None),
+    consignment_number: int | None = Query(None),
+    consignment_date: date | None = Query(None),
+    start_date: date | None = Query(None),
+    end_date: date | None = Query(None),
+) -> list[LineProgress]:
+    """Controller to get aggregated and total products of lines of filtered tasks."""
+    return ModelsResponse(await service.get_lines_progress(
+        close_status=close_status,
+        consignment_number=consignment_number,
+        consignment_date=consignment_date,
+        start_date=start_date,
+        end_date=end_date,
+    ))
+
+
+router_tasks.add_api_route(
+    path='/progress/lines',
+    endpoint=get_lines_progress,
+    summary="Gets aggregation progress of lines.",
+    methods=['GET'],
+)
+
+
 @inject
 async def add_products_to_consignment(
     products: list[AddProductModel],
     service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
-):
+) -> AddProductsResult:
     """Controller to add products to the consignment."""
-    await service.add_products_to_consignment(
+    return await service.add_products_to_consignment(
         products=products,
     )
 
@@ -79,13 +202,47 @@ router_tasks.add_api_route(
 )
 
 
+@inject
+async def add_products_stream(
+    request: Request,
+    service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+) -> AddProductsResult:
+    """Controller to add products to consignments from newline delimited JSON."""
+    return await service.add_products_stream(lines=lines(request.stream()))
+
+
+router_tasks.add_api_route(
+    path='/products/stream',
+    endpoint=add_products_stream,
+    summary="Adds products to consignments from a newline delimited JSON stream.",
+    methods=['POST'],
+    openapi_extra={
+        'requestBody': {
+            'content': {NDJSON_MEDIA_TYPE: {'schema': {'type': 'string'}}},
+            'required': True,
+        },
+    },
+)
+
+
 @inject
 async def get_task(
     task_id: int,
     service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+    include_products: ProductsInclusion = Query(ProductsInclusion.full),
+    if_none_match: str | None = Header(None),
 ) -> Task:
-    """Controller to get a task."""
-    return await service.get_task(task_id=task_id)
+    """Controller to get a task. Responds with 304 if the task ETag matches If-None-Match."""
+    versioned_task = await service.get_task(
+        task_id=task_id,
+        include_products=include_products,
+        if_none_match=if_none_match,
+    )
+    # Closed tasks still change when they are overwritten or given products, clients revalidate them.
+    headers = {'ETag': versioned_task.etag, 'Cache-Control': 'no-cache'}
+    if versioned_task.task is None:
+        return Response(status_code=304, headers=headers)
+    return ModelsResponse(versioned_task.task, headers=headers)
 
 
 router_tasks.add_api_route(
@@ -96,6 +253,41 @@ router_tasks.add_api_route(
 )
 
 
+@inject
+async def get_task_products(
+    task_id: int,
+    service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+    aggregated: bool | None = Query(None),
+    cursor: str | None = Query(None),
+    limit: int = Query(1000, ge=1, le=10000),
+    stream: bool = False,
+) -> list[TaskProduct]:
+    """Controller to get products of a task.
+            The cursor of the next page is returned in the X-Next-Cursor header.
+            With stream=true all products are streamed as newline delimited JSON."""
+    if stream:
+        return StreamingResponse(
+            ndjson(await service.stream_task_products(task_id=task_id, aggregated=aggregated)),
+            media_type=NDJSON_MEDIA_TYPE,
+        )
+    page = await service.get_task_products(
+        task_id=task_id,
+        aggregated=aggregated,
+        cursor=cursor,
+        limit=limit,
+    )
+    headers = {'X-Next-Cursor': page.next_cursor} if page.next_cursor else None
+    return ModelsResponse(page.products, headers=headers)
+
+
+router_tasks.add_api_route(
+    path='/{task_id}/products',
+    endpoint=get_task_products,
+    summary="Gets products of a shift task.",
+    methods=['GET'],
+)
+
+
 @inject
 async def update_task(
     task_id: int,
@@ -103,7 +295,7 @@ async def update_task(
     service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
 ) -> Task:
     """Controller to update a task."""
-    return await service.update_task(task_id=task_id, data=data)
+    return ModelsResponse(await service.update_task(task_id=task_id, data=data))
 
 
 router_tasks.add_api_route(
@@ -119,7 +311,7 @@ async def aggregate_products(
     consignment_id: int,
     product_id: str,
     service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
-) -> None:
+) -> AggregatedProduct:
     """Controller to aggregate products."""
     return await service.aggregate_products(
         consignment_id=consignment_id,
@@ -133,3 +325,20 @@ router_tasks.add_api_route(
     summary="Aggregates products.",
     methods=['POST'],
 )
+
+
+@inject
+async def aggregate_products_batch(
+    products: list[AggregateProductModel] = Body(..., max_length=MAX_AGGREGATION_BATCH),
+    service: TasksService = Depends(Provide[ServicesContainer.tasks_service]),
+) -> list[AggregationResult]:
+    """Controller to aggregate a batch of up to MAX_AGGREGATION_BATCH products."""
+    return await service.aggregate_products_batch(products=products)
+
+
+router_tasks.add_api_route(
+    path='/products/aggregate',
+    endpoint=aggregate_products_batch,
+    summary="Aggregates a batch of products.",
+    methods=['POST'],
+)
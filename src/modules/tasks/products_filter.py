@@ -0,0 +1,160 @@
+import asyncio
+import logging
+from collections.abc import Iterable
+from time import monotonic
+
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from src.adapters.bloom import BloomFilter
+from src.adapters.database import Database
+from src.adapters.metrics import (
+    PRODUCTS_FILTER_CODES, PRODUCTS_FILTER_FALSE_POSITIVE_RATE, PRODUCTS_FILTER_READY, PRODUCTS_FILTER_SIZE,
+)
+from src.modules.tasks.repository import TasksRepository, PRODUCTS_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+# Seconds to wait before reloading the filter after a failure.
+RELOAD_DELAY = 5
+
+
+class ProductsFilter:
+    """Per-worker Bloom filter of bound product codes.
+
+    The filter is loaded from the database on start and then follows bindings added
+    by all workers through PRODUCTS_CHANNEL notifications. Negative answers are trusted
+    without a lookup, so they are only given while the filter is loaded, has no notified
+    bindings left to load and got no notification within the last `settle` seconds:
+    during ingestion bindings committed by other workers may not be notified yet.
+    Codes are hashed in a thread, one batch at a time, so the event loop keeps serving."""
+
+    def __init__(
+        self,
+        database: Database,
+        tasks_repository: TasksRepository,
+        capacity: int,
+        error_rate: float,
+        settle: float = 2,
+    ) -> None:
+        self._database = database
+        self._tasks_repository = tasks_repository
+        self._capacity = capacity
+        self._error_rate = error_rate
+        self._settle = settle
+        self._notified_at = float('-inf')
+        self.bloom: BloomFilter | None = None
+        self._connection: AsyncConnection | None = None
+        self._ready = False
+        self._pending = 0
+        self._failed = asyncio.Event()
+        # Bits are set by one thread at a time, concurrent updates of a byte would lose bits.
+        self._adding = asyncio.Lock()
+        self._tasks: set[asyncio.Task] = set()
+
+    def definitely_missing(self, product_id: str) -> bool:
+        """Tells if the product is certainly not bound to any consignment."""
+        return (
+            self._ready
+            and not self._pending
+            and monotonic() - self._notified_at >= self._settle
+            and product_id not in self.bloom
+        )
+
+    async def add(self, product_ids: Iterable[str]) -> None:
+        bloom = self.bloom
+        if bloom is not None:
+            async with self._adding:
+                await asyncio.to_thread(bloom.update, list(product_ids))
+            self._export()
+
+    def stats(self) -> dict:
+        return {
+            'ready': self._ready,
+            'codes': self.bloom.count if self.bloom else 0,
+            'size_bytes': self.bloom.size_bytes if self.bloom else 0,
+            'false_positive_rate': self.bloom.false_positive_rate if self.bloom else 0.0,
+        }
+
+    def _export(self) -> None:
+        stats = self.stats()
+        PRODUCTS_FILTER_READY.set(stats['ready'])
+        PRODUCTS_FILTER_CODES.set(stats['codes'])
+        PRODUCTS_FILTER_SIZE.set(stats['size_bytes'])
+        PRODUCTS_FILTER_FALSE_POSITIVE_RATE.set(stats['false_positive_rate'])
+
+    async def start(self) -> None:
+        """Starts loading and following the filter in the background."""
+        self._spawn(self._run())
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._close()
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self._load()
+                await self._failed.wait()
+            except Exception:
+                logger.exception('Products filter failed')
+            self._ready = False
+            self._export()
+            await self._close()
+            await asyncio.sleep(RELOAD_DELAY)
+
+    async def _load(self) -> None:
+        self._failed.clear()
+        self.bloom = BloomFilter(self._capacity, self._error_rate)
+        # Listening starts before loading, so no bindings are missed in between.
+        self._connection = await self._database.engine.connect()
+        driver_connection = (await self._connection.get_raw_connection()).driver_connection
+        driver_connection.add_termination_listener(self._on_termination)
+        await driver_connection.add_listener(PRODUCTS_CHANNEL, self._on_notification)
+        async with self._database.session() as session:
+            async for product_ids in self._tasks_repository.stream_product_codes(session=session):
+                await self.add(product_ids)
+        self._ready = True
+        self._export()
+        logger.info('Products filter loaded: %s', self.stats())
+
+    async def _load_range(self, first_id: int, last_id: int) -> None:
+        try:
+            async with self._database.session() as session:
+                async for product_ids in self._tasks_repository.stream_product_codes(
+                    session=session,
+                    first_id=first_id,
+                    last_id=last_id,
+                ):
+                    await self.add(product_ids)
+        except Exception:
+            logger.exception('Failed to load notified products')
+            self._ready = False
+            self._failed.set()
+        finally:
+            self._pending -= 1
+
+    def _on_notification(self, connection, pid, channel, payload: str) -> None:
+        first_id, last_id = map(int, payload.split(':'))
+        self._notified_at = monotonic()
+        self._pending += 1
+        self._spawn(self._load_range(first_id, last_id))
+
+    def _on_termination(self, connection) -> None:
+        self._ready = False
+        self._export()
+        self._failed.set()
+
+    def _spawn(self, coroutine) -> None:
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _close(self) -> None:
+        if self._connection is not None:
+            connection, self._connection = self._connection, None
+            try:
+                await connection.close()
+            except Exception:
+                logger.exception('Failed to close the products filter connection')
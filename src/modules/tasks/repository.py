@@ -1,74 +1,185 @@
-from datetime import date, datetime
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from datetime import date, datetime, time, timedelta
 
-from sqlalchemy import insert, select, cast, Date, update
+from sqlalchemy import (
+    Row, select, Date, update, delete, literal, tuple_, text, true, false, func, values, Table, MetaData, Column, String,
+    Integer,
+)
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import contains_eager
+from sqlalchemy.sql.ddl import CreateTable
 
-from src.db_models.tasks import Consignments, ShiftTasks, ProductsToConsignments
-from src.modules.tasks.schemas import AddTaskModel, Task
+from src.adapters.cache import LRUCache, MISSING
+from src.adapters.metrics import instrument_repository
+from src.db_models.products import Products
+from src.db_models.tasks import (
+    Consignments, ConsignmentsProgress, ConsignmentsProgressDeltas, ShiftTasks, ProductsToConsignments,
+)
+from src.modules.tasks.schemas import (
+    AddTaskModel, Task, TasksCursor, ProductsInclusion, TaskProduct, ConsignmentProgress, LineProgress,
+)
 
+# asyncpg does not accept more bind parameters in a single statement.
+MAX_BIND_PARAMS = 32767
+# Products of a batch aggregation, its statements bind up to four parameters per product.
+MAX_AGGREGATION_BATCH = 5000
+# Number of rows fetched from a server-side cursor at once.
+STREAM_BATCH_SIZE = 5000
+# Channel notified of new product bindings.
+PRODUCTS_CHANNEL = 'products_ingested'
 
+
+def chunks(rows: list[dict]):
+    """Splits rows of a multi-row statement to fit the bind parameters limit."""
+    if not rows:
+        return
+    size = MAX_BIND_PARAMS // len(rows[0])
+    for start in range(0, len(rows), size):
+        yield rows[start:start + size]
+
+
+products_staging = Table(
+    'products_staging',
+    MetaData(),
+    Column('product_id', String, nullable=False),
+    Column('consignment_id', Integer, nullable=False),
+    prefixes=['TEMPORARY'],
+    postgresql_on_commit='DROP',
+)
+
+
+@instrument_repository
 class TasksRepository:
 
-    def __init__(self):
+    def __init__(
+        self,
+        consignments_cache: LRUCache | None = None,
+        consignment_dates_cache: LRUCache | None = None,
+    ):
         super().__init__()
+        self.consignments_cache = consignments_cache
+        self.consignment_dates_cache = consignment_dates_cache
 
-    async def get_consignment(
+    async def upsert_tasks(
         self,
         session: AsyncSession,
-        consignment_number: int,
-        consignment_date: date,
-    ) -> int:
-        """Gets the consignment by params."""
-        stmt = (
-            select(Consignments.consignment_id)
-            .where(Consignments.consignment_number == consignment_number,
-                   Consignments.consignment_date == consignment_date)
+        tasks: list[AddTaskModel],
+    ) -> None:
+        """Creates tasks in bulk. A task of an already existing consignment is overwritten."""
+        unique_tasks = {
+            (task.consignment_number, task.consignment_date): task
+            for task in tasks
+        }
+        if not unique_tasks:
+            return
+        # Rows are locked in the same order by every request, so overlapping batches do not deadlock.
+        consignment_ids = await self.upsert_consignments(
+            session=session,
+            consignments=sorted(unique_tasks),
         )
-        return (await session.execute(stmt)).scalar()
+        rows = [
+            {
+                'close_status': task.close_status,
+                'name': task.name,
+                'line': task.line,
+                'shift': task.shift,
+                'brigade': task.brigade,
+                'nomenclature': task.nomenclature,
+                'code': task.code,
+                'identifier': task.identifier,
+                'started_at': task.started_at,
+                'completed_at': task.completed_at,
+                'consignment_id': consignment_ids[key],
+                'closed_at': None,
+            }
+            for key, task in sorted(unique_tasks.items())
+        ]
+        for chunk in chunks(rows):
+            stmt = pg_insert(ShiftTasks).values(chunk)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[ShiftTasks.consignment_id],
+                set_={
+                    **{
+                        column: stmt.excluded[column]
+                        for column in rows[0]
+                        if column != 'consignment_id'
+                    },
+                    'version': ShiftTasks.version + 1,
+                    'updated_at': datetime.now(),
+                },
+            )
+            await session.execute(stmt)
 
-    async def add_consignment(
+    async def upsert_consignments(
         self,
         session: AsyncSession,
-        consignment_number: int,
-        consignment_date: date,
-    ) -> int:
-        """Creates a new consignment."""
-        stmt = (
-            insert(Consignments)
-            .values(consignment_number=consignment_number,
-                    consignment_date=consignment_date)
-            .returning(Consignments.consignment_id)
-        )
-        return (await session.execute(stmt)).scalar()
+        consignments: list[tuple[int, date]],
+    ) -> dict[tuple[int, date], int]:
+        """Creates missing consignments and returns IDs of all given ones by (number, date).
+                Their cached lookups have to be invalidated once the transaction commits."""
+        consignment_ids = {}
+        rows = [
+            {'consignment_number': number, 'consignment_date': consignment_date}
+            for number, consignment_date in consignments
+        ]
+        for chunk in chunks(rows):
+            stmt = pg_insert(Consignments).values(chunk)
+            # A no-op update instead of DO NOTHING makes RETURNING include already existing rows.
+            stmt = (
+                stmt.on_conflict_do_update(
+                    index_elements=[Consignments.consignment_number,
+                                    Consignments.consignment_date],
+                    set_={'consignment_number': stmt.excluded.consignment_number},
+                )
+                .returning(Consignments.consignment_id,
+                           Consignments.consignment_number,
+                           Consignments.consignment_date)
+            )
+            for row in await session.execute(stmt):
+                consignment_ids[(row.consignment_number, row.consignment_date)] = row.consignment_id
+        return consignment_ids
 
-    async def add_task(
+    def invalidate_consignments(self, consignments: list[tuple[int, date]]) -> None:
+        """Drops cached lookups of consignments by (number, date), e.g. negative ones of created consignments.
+                Called after commit, so concurrent lookups can not cache the state before it again."""
+        if self.consignments_cache is not None:
+            self.consignments_cache.invalidate(consignments)
+
+    async def get_tasks(
         self,
         session: AsyncSession,
-        task: AddTaskModel,
-        consignment_id: int,
-    ):
-        """Creates a new task."""
-        stmt = (
-            insert(ShiftTasks)
-            .values(
-                close_status=task.close_status,
-                name=task.name,
-                line=task.line,
-                shift=task.shift,
-                brigade=task.brigade,
-                nomenclature=task.nomenclature,
-                code=task.code,
-                identifier=task.identifier,
-                started_at=task.started_at,
-                completed_at=task.completed_at,
-                consignment_id=consignment_id,
-                closed_at=None,
-            )
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        offset: int = 0,
+        limit: int = 30,
+        cursor: TasksCursor | None = None,
+        include_products: ProductsInclusion = ProductsInclusion.full,
+    ) -> list[Task]:
+        """Gets filtered tasks ordered by start time.
+                Tasks are paginated by the cursor if it is given and by the offset otherwise."""
+        tasks = await self.get_task_rows(
+            session=session,
+            close_status=close_status,
+            consignment_number=consignment_number,
+            consignment_date=consignment_date,
+            start_date=start_date,
+            end_date=end_date,
+            offset=offset,
+            limit=limit,
+            cursor=cursor,
+        )
+        return await self.build_tasks(
+            session=session,
+            tasks=tasks,
+            include_products=include_products,
         )
-        await session.execute(stmt)
 
-    async def get_tasks(
+    async def get_task_rows(
         self,
         session: AsyncSession,
         close_status: bool | None = None,
@@ -78,14 +189,47 @@ class TasksRepository:
         end_date: date | None = None,
         offset: int = 0,
         limit: int = 30,
-    ):
-        """Gets filtered tasks."""
+        cursor: TasksCursor | None = None,
+    ) -> list[ShiftTasks]:
+        """Gets filtered task rows with their consignments but without products.
+                Rows are refreshed in the session as their versions make ETags."""
+        stmt = (
+            select(ShiftTasks)
+            .join(ShiftTasks.consignment)
+            .options(contains_eager(ShiftTasks.consignment))
+            .execution_options(populate_existing=True)
+        )
+        stmt = self.filter(
+            stmt=stmt,
+            close_status=close_status,
+            consignment_number=consignment_number,
+            consignment_date=consignment_date,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        stmt = stmt.order_by(ShiftTasks.started_at, ShiftTasks.task_id)
+        if cursor:
+            stmt = stmt.where(
+                tuple_(ShiftTasks.started_at, ShiftTasks.task_id) > (cursor.started_at, cursor.task_id))
+        else:
+            stmt = stmt.offset(offset)
+        return list((await session.execute(stmt.limit(limit))).scalars())
+
+    async def stream_tasks(
+        self,
+        session: AsyncSession,
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> AsyncIterator[list[Task]]:
+        """Streams filtered tasks without products in batches through a server-side cursor."""
         stmt = (
             select(ShiftTasks)
             .join(ShiftTasks.consignment)
-            .join(Consignments.products, isouter=True)
-            .options(contains_eager(ShiftTasks.consignment),
-                     contains_eager(ShiftTasks.consignment).contains_eager(Consignments.products))
+            .options(contains_eager(ShiftTasks.consignment))
+            .execution_options(populate_existing=True)
         )
         stmt = self.filter(
             stmt=stmt,
@@ -95,25 +239,172 @@ class TasksRepository:
             start_date=start_date,
             end_date=end_date,
         )
-        result = (await session.execute(stmt.offset(offset).limit(limit))).unique().scalars()
-        return [Task.from_orm_task(task) for task in result]
+        stmt = stmt.order_by(ShiftTasks.started_at, ShiftTasks.task_id)
+        result = await session.stream_scalars(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for tasks in result.partitions():
+            yield [Task.from_orm_task(task) for task in tasks]
 
     async def get_task(
         self,
         session: AsyncSession,
         task_id: int,
+        include_products: ProductsInclusion = ProductsInclusion.full,
     ) -> Task | None:
         """Gets a task by ID."""
+        task = await self.get_task_row(session=session, task_id=task_id)
+        if not task:
+            return None
+        return (await self.build_tasks(
+            session=session,
+            tasks=[task],
+            include_products=include_products,
+        ))[0]
+
+    async def get_task_row(
+        self,
+        session: AsyncSession,
+        task_id: int,
+    ) -> ShiftTasks | None:
+        """Gets a task row with its consignment but without products by ID."""
         stmt = (
             select(ShiftTasks)
             .join(ShiftTasks.consignment)
-            .join(Consignments.products, isouter=True)
-            .options(contains_eager(ShiftTasks.consignment),
-                     contains_eager(ShiftTasks.consignment).contains_eager(Consignments.products))
+            .options(contains_eager(ShiftTasks.consignment))
+            .execution_options(populate_existing=True)
             .where(ShiftTasks.task_id == task_id)
         )
-        task = (await session.execute(stmt)).unique().scalar_one_or_none()
-        return Task.from_orm_task(task) if task else None
+        return (await session.execute(stmt)).scalar_one_or_none()
+
+    async def build_tasks(
+        self,
+        session: AsyncSession,
+        tasks: list[ShiftTasks],
+        include_products: ProductsInclusion = ProductsInclusion.full,
+    ) -> list[Task]:
+        """Builds tasks with products of their consignments loaded in one query."""
+        consignment_ids = [task.consignment_id for task in tasks]
+        if include_products == ProductsInclusion.full:
+            products = await self.get_products_by_consignments(
+                session=session, consignment_ids=consignment_ids)
+            return [
+                Task.from_orm_task(task, products=products.get(task.consignment_id, []))
+                for task in tasks
+            ]
+        if include_products == ProductsInclusion.count:
+            counts = await self.count_products_by_consignments(
+                session=session, consignment_ids=consignment_ids)
+            return [
+                Task.from_orm_task(task, products_count=counts.get(task.consignment_id, 0))
+                for task in tasks
+            ]
+        return [Task.from_orm_task(task) for task in tasks]
+
+    async def get_products_by_consignments(
+        self,
+        session: AsyncSession,
+        consignment_ids: list[int],
+    ) -> dict[int, list[str]]:
+        """Gets product IDs of consignments."""
+        products = defaultdict(list)
+        if not consignment_ids:
+            return products
+        stmt = (
+            select(ProductsToConsignments.consignment_id,
+                   ProductsToConsignments.product_id)
+            .where(ProductsToConsignments.consignment_id.in_(consignment_ids),
+                   await self.consignments_partitions(session, consignment_ids))
+            .order_by(ProductsToConsignments.consignment_id,
+                      ProductsToConsignments.product_id)
+        )
+        for row in await session.execute(stmt):
+            products[row.consignment_id].append(row.product_id)
+        return products
+
+    async def count_products_by_consignments(
+        self,
+        session: AsyncSession,
+        consignment_ids: list[int],
+    ) -> dict[int, int]:
+        """Counts products of consignments."""
+        if not consignment_ids:
+            return {}
+        stmt = (
+            select(ProductsToConsignments.consignment_id,
+                   func.count())
+            .where(ProductsToConsignments.consignment_id.in_(consignment_ids),
+                   await self.consignments_partitions(session, consignment_ids))
+            .group_by(ProductsToConsignments.consignment_id)
+        )
+        return dict((await session.execute(stmt)).tuples().all())
+
+    async def get_task_consignment_id(
+        self,
+        session: AsyncSession,
+        task_id: int,
+    ) -> int | None:
+        """Gets the consignment ID of a task."""
+        stmt = (
+            select(ShiftTasks.consignment_id)
+            .where(ShiftTasks.task_id == task_id)
+        )
+        return (await session.execute(stmt)).scalar()
+
+    async def get_consignment_products(
+        self,
+        session: AsyncSession,
+        consignment_id: int,
+        aggregated: bool | None = None,
+        cursor: str | None = None,
+        limit: int = 1000,
+    ) -> list[TaskProduct]:
+        """Gets products of a consignment ordered by product ID.
+                Products are paginated by the last product ID of the previous page."""
+        stmt = await self.consignment_products_query(
+            session=session,
+            consignment_id=consignment_id,
+            aggregated=aggregated,
+        )
+        if cursor:
+            stmt = stmt.where(ProductsToConsignments.product_id > cursor)
+        return [
+            TaskProduct(**row._mapping)
+            for row in await session.execute(stmt.limit(limit))
+        ]
+
+    async def stream_consignment_products(
+        self,
+        session: AsyncSession,
+        consignment_id: int,
+        aggregated: bool | None = None,
+    ) -> AsyncIterator[list[TaskProduct]]:
+        """Streams products of a consignment in batches through a server-side cursor."""
+        stmt = await self.consignment_products_query(
+            session=session,
+            consignment_id=consignment_id,
+            aggregated=aggregated,
+        )
+        result = await session.stream(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for rows in result.partitions():
+            yield [TaskProduct(**row._mapping) for row in rows]
+
+    async def consignment_products_query(
+        self,
+        session: AsyncSession,
+        consignment_id: int,
+        aggregated: bool | None = None,
+    ):
+        """Builds the query of consignment products."""
+        stmt = (
+            select(ProductsToConsignments.product_id,
+                   ProductsToConsignments.is_aggregated,
+                   ProductsToConsignments.aggregated_at)
+            .where(ProductsToConsignments.consignment_id == consignment_id,
+                   await self.consignments_partitions(session, [consignment_id]))
+            .order_by(ProductsToConsignments.product_id)
+        )
+        if aggregated is not None:
+            stmt = stmt.where(ProductsToConsignments.is_aggregated == aggregated)
+        return stmt
 
     async def update_task(
         self,
@@ -126,7 +417,9 @@ class TasksRepository:
         stmt = (
             update(ShiftTasks)
             .values(**data,
-                    closed_at=closed_at)
+                    closed_at=closed_at,
+                    version=ShiftTasks.version + 1,
+                    updated_at=datetime.now())
             .where(ShiftTasks.task_id == task_id)
             .returning(ShiftTasks)
         )
@@ -153,68 +446,415 @@ class TasksRepository:
         for option, column in filter_options:
             if option is not None:
                 stmt = stmt.where(column == option)
+        # Days are compared as ranges of timestamps, so indexes of the columns can serve them.
         if start_date:
-            stmt = stmt.where(cast(ShiftTasks.started_at, Date) >= start_date)
+            stmt = stmt.where(ShiftTasks.started_at >= datetime.combine(start_date, time.min))
         if end_date:
-            stmt = stmt.where(cast(ShiftTasks.completed_at, Date) <= end_date)
+            stmt = stmt.where(ShiftTasks.completed_at < datetime.combine(end_date + timedelta(days=1), time.min))
         return stmt
 
-    async def add_products_to_consignment(
+    async def get_consignments(
         self,
         session: AsyncSession,
-        consignment_id: int,
-        product_id: str,
-    ) -> int:
-        """Binds a product to a consignment."""
+        consignments: list[tuple[int, date]],
+    ) -> dict[tuple[int, date], int]:
+        """Gets IDs of existing consignments by (number, date) in one query.
+                Consignments found in the cache, including unknown ones, are not queried."""
+        consignment_ids = {}
+        missing = consignments
+        if self.consignments_cache is not None:
+            missing = []
+            for key in consignments:
+                consignment_id = self.consignments_cache.get(key)
+                if consignment_id is MISSING:
+                    missing.append(key)
+                elif consignment_id is not None:
+                    consignment_ids[key] = consignment_id
+        if not missing:
+            return consignment_ids
         stmt = (
-            insert(ProductsToConsignments)
-            .values(consignment_id=consignment_id,
-                    product_id=product_id,
-                    is_aggregated=True,
-                    aggregated_at=datetime.now())
-            .returning(ProductsToConsignments.product_to_consignment_id)
+            select(Consignments.consignment_id,
+                   Consignments.consignment_number,
+                   Consignments.consignment_date)
+            .where(tuple_(Consignments.consignment_number,
+                          Consignments.consignment_date).in_(missing))
         )
-        return (await session.execute(stmt)).scalar()
+        found = {
+            (row.consignment_number, row.consignment_date): row.consignment_id
+            for row in await session.execute(stmt)
+        }
+        if self.consignments_cache is not None:
+            for key in missing:
+                self.consignments_cache.set(key, found.get(key))
+        return {**consignment_ids, **found}
 
-    async def get_product_to_consignment(
+    async def get_consignment_dates(
         self,
         session: AsyncSession,
-        consignment_id: int,
-        product_id: str,
-    ) -> bool | None:
-        """Gets data from ProductsToConsignments table by product and consignment IDs."""
+        consignment_ids: list[int],
+    ) -> dict[int, date]:
+        """Gets dates of existing consignments by ID. Dates never change, they are cached
+                by consignment ID. Unknown IDs are not cached, the consignment may be created
+                by the next request."""
+        consignment_dates = {}
+        missing = consignment_ids
+        if self.consignment_dates_cache is not None:
+            missing = []
+            for consignment_id in consignment_ids:
+                consignment_date = self.consignment_dates_cache.get(consignment_id)
+                if consignment_date is MISSING:
+                    missing.append(consignment_id)
+                else:
+                    consignment_dates[consignment_id] = consignment_date
+        if not missing:
+            return consignment_dates
         stmt = (
-            select(ProductsToConsignments.is_aggregated)
-            .where(ProductsToConsignments.product_id == product_id,
-                   ProductsToConsignments.consignment_id == consignment_id)
+            select(Consignments.consignment_id,
+                   Consignments.consignment_date)
+            .where(Consignments.consignment_id.in_(missing))
         )
-        return (await session.execute(stmt)).scalar()
+        found = dict((await session.execute(stmt)).tuples().all())
+        if self.consignment_dates_cache is not None:
+            for consignment_id, consignment_date in found.items():
+                self.consignment_dates_cache.set(consignment_id, consignment_date)
+        return {**consignment_dates, **found}
 
-    async def get_consignments_by_product(
+    async def consignments_partitions(
         self,
         session: AsyncSession,
-        product_id: str,
-    ) -> list[int] | None:
-        """Gets a consignment from ProductsToConsignments by product ID."""
+        consignment_ids: list[int],
+    ):
+        """Builds a condition on dates of the consignments, so only their partitions are planned."""
+        consignment_dates = await self.get_consignment_dates(session, consignment_ids)
+        return ProductsToConsignments.consignment_date.in_(set(consignment_dates.values()))
+
+    async def add_products_to_consignments(
+        self,
+        session: AsyncSession,
+        bindings: dict[str, int],
+    ) -> int:
+        """Binds products to consignments. Products are staged with COPY and merged
+                with one statement, already existing products are ignored.
+                Increments versions of consignments that got new products and adds deltas of their counters.
+                Notifies PRODUCTS_CHANNEL of the ID range of new bindings and returns their number."""
+        if not bindings:
+            return 0
+        await session.execute(CreateTable(products_staging, if_not_exists=True))
+        await session.execute(text('TRUNCATE products_staging'))
+        connection = await (await session.connection()).get_raw_connection()
+        await connection.driver_connection.copy_records_to_table(
+            'products_staging',
+            records=bindings.items(),
+            columns=['product_id', 'consignment_id'],
+        )
+        # Bindings are partitioned by date, codes are unique through the products table.
+        new_products = (
+            pg_insert(Products)
+            .from_select(['product_id'], select(products_staging.c.product_id))
+            .on_conflict_do_nothing()
+            .returning(Products.product_id)
+            .cte('new_products')
+        )
+        inserted = (
+            pg_insert(ProductsToConsignments)
+            .from_select(
+                ['product_id', 'consignment_id', 'consignment_date', 'is_aggregated'],
+                select(products_staging.c.product_id,
+                       products_staging.c.consignment_id,
+                       Consignments.consignment_date,
+                       false())
+                .join(new_products, new_products.c.product_id == products_staging.c.product_id)
+                .join(Consignments, Consignments.consignment_id == products_staging.c.consignment_id),
+            )
+            .returning(ProductsToConsignments.product_to_consignment_id,
+                       ProductsToConsignments.consignment_id)
+            .cte('inserted')
+        )
+        versioned = (
+            update(Consignments)
+            .values(version=Consignments.version + 1)
+            .where(Consignments.consignment_id.in_(select(inserted.c.consignment_id)))
+            .returning(Consignments.consignment_id)
+            .cte('versioned')
+        )
+        counted = (
+            pg_insert(ConsignmentsProgressDeltas)
+            .from_select(
+                ['consignment_id', 'total_products', 'aggregated_products'],
+                select(inserted.c.consignment_id, func.count(), literal(0))
+                .group_by(inserted.c.consignment_id),
+            )
+            .returning(ConsignmentsProgressDeltas.delta_id)
+            .cte('counted')
+        )
+        stmt = select(
+            func.count(),
+            func.min(inserted.c.product_to_consignment_id),
+            func.max(inserted.c.product_to_consignment_id),
+        ).add_cte(versioned).add_cte(counted)
+        count, first_id, last_id = (await session.execute(stmt)).one()
+        if count:
+            # Delivered on commit, tells other workers which bindings were added.
+            await session.execute(select(func.pg_notify(PRODUCTS_CHANNEL, f'{first_id}:{last_id}')))
+        return count
+
+    async def stream_product_codes(
+        self,
+        session: AsyncSession,
+        first_id: int | None = None,
+        last_id: int | None = None,
+    ) -> AsyncIterator[list[str]]:
+        """Streams bound product IDs in batches, optionally within a range of binding IDs."""
+        stmt = select(ProductsToConsignments.product_id)
+        if first_id is not None:
+            stmt = stmt.where(ProductsToConsignments.product_to_consignment_id >= first_id)
+        if last_id is not None:
+            stmt = stmt.where(ProductsToConsignments.product_to_consignment_id <= last_id)
+        result = await session.stream_scalars(stmt.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for product_ids in result.partitions():
+            yield product_ids
+
+    async def get_product_bindings(
+        self,
+        session: AsyncSession,
+        product_ids: list[str],
+    ) -> dict[str, Row]:
+        """Gets bindings of products to consignments by product IDs."""
         stmt = (
-            select(ProductsToConsignments.consignment_id)
-            .where(ProductsToConsignments.product_id == product_id)
+            select(ProductsToConsignments.product_id,
+                   ProductsToConsignments.consignment_id,
+                   ProductsToConsignments.is_aggregated,
+                   ProductsToConsignments.aggregated_at)
+            .where(ProductsToConsignments.product_id.in_(product_ids))
         )
-        return list((await session.execute(stmt)).scalars())
+        return {row.product_id: row for row in await session.execute(stmt)}
 
     async def aggregate(
         self,
         session: AsyncSession,
         consignment_id: int,
         product_id: str,
-    ) -> None:
-        """Aggregates products."""
-        stmt = (
+    ) -> datetime | None:
+        """Aggregates the product if it is bound to the consignment and was not aggregated yet.
+                Returns the aggregation time or None if nothing was aggregated."""
+        consignment_dates = await self.get_consignment_dates(session, [consignment_id])
+        if consignment_id not in consignment_dates:
+            return None
+        aggregated = (
             update(ProductsToConsignments)
             .values(is_aggregated=True,
                     aggregated_at=datetime.now())
             .where(ProductsToConsignments.product_id == product_id,
-                   ProductsToConsignments.consignment_id == consignment_id)
-            .returning(ProductsToConsignments.product_to_consignment_id)
+                   ProductsToConsignments.consignment_id == consignment_id,
+                   ProductsToConsignments.consignment_date == consignment_dates[consignment_id],
+                   ProductsToConsignments.is_aggregated == false())
+            .returning(ProductsToConsignments.consignment_id,
+                       ProductsToConsignments.aggregated_at)
+            .cte('aggregated')
+        )
+        stmt = select(aggregated.c.aggregated_at).add_cte(self.count_aggregated(aggregated))
+        return (await session.execute(stmt)).scalar()
+
+    async def aggregate_many(
+        self,
+        session: AsyncSession,
+        products: list[tuple[str, int]],
+    ) -> dict[str, Row]:
+        """Aggregates products bound to given consignments that were not aggregated yet
+                with one statement. Returns bindings of aggregated products by product ID."""
+        consignment_dates = await self.get_consignment_dates(
+            session,
+            list({consignment_id for _, consignment_id in products}),
+        )
+        bindings = [
+            (product_id, consignment_id, consignment_dates[consignment_id])
+            for product_id, consignment_id in products
+            if consignment_id in consignment_dates
+        ]
+        if not bindings:
+            return {}
+        pairs = values(
+            Column('product_id', String),
+            Column('consignment_id', Integer),
+            Column('consignment_date', Date),
+            name='pairs',
+        ).data(bindings)
+        aggregated = (
+            update(ProductsToConsignments)
+            .values(is_aggregated=True,
+                    aggregated_at=datetime.now())
+            .where(ProductsToConsignments.product_id == pairs.c.product_id,
+                   ProductsToConsignments.consignment_id == pairs.c.consignment_id,
+                   ProductsToConsignments.consignment_date == pairs.c.consignment_date,
+                   ProductsToConsignments.consignment_date.in_(set(consignment_dates.values())),
+                   ProductsToConsignments.is_aggregated == false())
+            .returning(ProductsToConsignments.product_id,
+                       ProductsToConsignments.consignment_id,
+                       ProductsToConsignments.aggregated_at)
+            .cte('aggregated')
+        )
+        stmt = select(aggregated).add_cte(self.count_aggregated(aggregated))
+        return {row.product_id: row for row in await session.execute(stmt)}
+
+    @staticmethod
+    def count_aggregated(aggregated):
+        """Builds the CTE inserting deltas of counters of consignments of the aggregating CTE."""
+        return (
+            pg_insert(ConsignmentsProgressDeltas)
+            .from_select(
+                ['consignment_id', 'total_products', 'aggregated_products', 'first_aggregated_at',
+                 'last_aggregated_at'],
+                select(aggregated.c.consignment_id,
+                       literal(0),
+                       func.count(),
+                       func.min(aggregated.c.aggregated_at),
+                       func.max(aggregated.c.aggregated_at))
+                .group_by(aggregated.c.consignment_id),
+            )
+            .returning(ConsignmentsProgressDeltas.delta_id)
+            .cte('counted')
+        )
+
+    @staticmethod
+    def progress_columns():
+        """Builds counters of consignments with their deltas not folded yet, the query has to join
+                ConsignmentsProgress by consignment ID and the returned lateral subquery of deltas on true.
+                Deltas are summed by the index for each consignment of the query only."""
+        pending = (
+            select(func.sum(ConsignmentsProgressDeltas.total_products).label('total_products'),
+                   func.sum(ConsignmentsProgressDeltas.aggregated_products).label('aggregated_products'),
+                   func.min(ConsignmentsProgressDeltas.first_aggregated_at).label('first_aggregated_at'),
+                   func.max(ConsignmentsProgressDeltas.last_aggregated_at).label('last_aggregated_at'))
+            .where(ConsignmentsProgressDeltas.consignment_id == ShiftTasks.consignment_id)
+            .lateral('pending')
+        )
+        columns = (
+            func.coalesce(ConsignmentsProgress.total_products, 0) + func.coalesce(pending.c.total_products, 0),
+            func.coalesce(ConsignmentsProgress.aggregated_products, 0) + func.coalesce(pending.c.aggregated_products, 0),
+            # least and greatest ignore NULLs.
+            func.least(ConsignmentsProgress.first_aggregated_at, pending.c.first_aggregated_at),
+            func.greatest(ConsignmentsProgress.last_aggregated_at, pending.c.last_aggregated_at),
+        )
+        return pending, columns
+
+    async def fold_progress(
+        self,
+        session: AsyncSession,
+    ) -> int:
+        """Moves deltas of counters into counters of their consignments with one statement.
+                Returns the number of folded deltas."""
+        folded = (
+            delete(ConsignmentsProgressDeltas)
+            .returning(ConsignmentsProgressDeltas.consignment_id,
+                       ConsignmentsProgressDeltas.total_products,
+                       ConsignmentsProgressDeltas.aggregated_products,
+                       ConsignmentsProgressDeltas.first_aggregated_at,
+                       ConsignmentsProgressDeltas.last_aggregated_at)
+            .cte('folded')
+        )
+        # Counters are locked in the order of consignment IDs, so overlapping folds do not deadlock.
+        added = pg_insert(ConsignmentsProgress).from_select(
+            ['consignment_id', 'total_products', 'aggregated_products', 'first_aggregated_at', 'last_aggregated_at'],
+            select(folded.c.consignment_id,
+                   func.sum(folded.c.total_products),
+                   func.sum(folded.c.aggregated_products),
+                   func.min(folded.c.first_aggregated_at),
+                   func.max(folded.c.last_aggregated_at))
+            .group_by(folded.c.consignment_id)
+            .order_by(folded.c.consignment_id),
+        )
+        counted = (
+            added.on_conflict_do_update(
+                index_elements=[ConsignmentsProgress.consignment_id],
+                set_={
+                    'total_products': ConsignmentsProgress.total_products + added.excluded.total_products,
+                    'aggregated_products': (ConsignmentsProgress.aggregated_products
+                                            + added.excluded.aggregated_products),
+                    'first_aggregated_at': func.least(ConsignmentsProgress.first_aggregated_at,
+                                                      added.excluded.first_aggregated_at),
+                    'last_aggregated_at': func.greatest(ConsignmentsProgress.last_aggregated_at,
+                                                        added.excluded.last_aggregated_at),
+                },
+            )
+            .returning(ConsignmentsProgress.consignment_id)
+            .cte('counted')
+        )
+        stmt = select(func.count()).select_from(folded).add_cte(counted)
+        return (await session.execute(stmt)).scalar()
+
+    async def get_consignments_progress(
+        self,
+        session: AsyncSession,
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        line: str | None = None,
+        cursor: int | None = None,
+        limit: int = 1000,
+    ) -> list[ConsignmentProgress]:
+        """Gets product counters of consignments of filtered tasks ordered by consignment ID.
+                Consignments are paginated by the last consignment ID of the previous page."""
+        pending, (total, aggregated, first_aggregated_at, last_aggregated_at) = self.progress_columns()
+        stmt = (
+            select(ShiftTasks.consignment_id,
+                   Consignments.consignment_number,
+                   Consignments.consignment_date,
+                   ShiftTasks.task_id,
+                   ShiftTasks.line,
+                   total.label('total_products'),
+                   aggregated.label('aggregated_products'),
+                   first_aggregated_at.label('first_aggregated_at'),
+                   last_aggregated_at.label('last_aggregated_at'))
+            .join(ShiftTasks.consignment)
+            .outerjoin(ConsignmentsProgress, ConsignmentsProgress.consignment_id == ShiftTasks.consignment_id)
+            .outerjoin(pending, true())
+        )
+        stmt = self.filter(
+            stmt=stmt,
+            close_status=close_status,
+            consignment_number=consignment_number,
+            consignment_date=consignment_date,
+            start_date=start_date,
+            end_date=end_date,
+        )
+        if line is not None:
+            stmt = stmt.where(ShiftTasks.line == line)
+        if cursor:
+            stmt = stmt.where(ShiftTasks.consignment_id > cursor)
+        stmt = stmt.order_by(ShiftTasks.consignment_id).limit(limit)
+        return [ConsignmentProgress(**row._mapping) for row in await session.execute(stmt)]
+
+    async def get_lines_progress(
+        self,
+        session: AsyncSession,
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> list[LineProgress]:
+        """Sums product counters of consignments of filtered tasks by line."""
+        pending, (total, aggregated, first_aggregated_at, last_aggregated_at) = self.progress_columns()
+        stmt = (
+            select(ShiftTasks.line,
+                   func.count().label('consignments'),
+                   func.sum(total).label('total_products'),
+                   func.sum(aggregated).label('aggregated_products'),
+                   func.min(first_aggregated_at).label('first_aggregated_at'),
+                   func.max(last_aggregated_at).label('last_aggregated_at'))
+            .join(ShiftTasks.consignment)
+            .outerjoin(ConsignmentsProgress, ConsignmentsProgress.consignment_id == ShiftTasks.consignment_id)
+            .outerjoin(pending, true())
+        )
+        stmt = self.filter(
+            stmt=stmt,
+            close_status=close_status,
+            consignment_number=consignment_number,
+            consignment_date=consignment_date,
+            start_date=start_date,
+            end_date=end_date,
         )
-        await session.execute(stmt)
+        stmt = stmt.group_by(ShiftTasks.line).order_by(ShiftTasks.line)
+        return [LineProgress(**row._mapping) for row in await session.execute(stmt)]
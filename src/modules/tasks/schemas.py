@@ -1,4 +1,6 @@
+from base64 import urlsafe_b64decode, urlsafe_b64encode
 from datetime import date, datetime
+from enum import StrEnum
 
 from pydantic import BaseModel, Field, field_validator
 
@@ -28,7 +30,57 @@ class AddProductModel(BaseModel):
     consignment_date: date = Field(validation_alias='ДатаПартии')
 
 
+class ProductsInclusion(StrEnum):
+    none = 'none'
+    count = 'count'
+    full = 'full'
+
+
+class ExportFormat(StrEnum):
+    ndjson = 'ndjson'
+    csv = 'csv'
+
+
+class AddProductsResult(BaseModel):
+    inserted: int
+    ignored_duplicates: int
+    ignored_unknown_consignment: int
+
+    @property
+    def complete(self) -> bool:
+        """Every product was bound, nothing was ignored."""
+        return not (self.ignored_duplicates or self.ignored_unknown_consignment)
+
+
+class AggregatedProduct(BaseModel):
+    product_id: str
+    consignment_id: int
+    aggregated_at: datetime
+
+
+class AggregateProductModel(BaseModel):
+    product_id: str
+    consignment_id: int
+
+
+class AggregationStatus(StrEnum):
+    aggregated = 'aggregated'
+    already_used = 'already_used'
+    wrong_batch = 'wrong_batch'
+    not_found = 'not_found'
+    # The binding was not aggregated but the update missed it, e.g. it was committed concurrently.
+    conflict = 'conflict'
+
+
+class AggregationResult(BaseModel):
+    product_id: str
+    consignment_id: int
+    status: AggregationStatus
+    aggregated_at: datetime | None = None
+
+
 class Task(BaseModel):
+    task_id: int
     close_status: bool
     name: str
     line: str
@@ -42,11 +94,18 @@ class Task(BaseModel):
     started_at: datetime
     completed_at: datetime
     closed_at: datetime | None
-    products: list[str]
+    products: list[str] | None = None
+    products_count: int | None = None
 
     @classmethod
-    def from_orm_task(cls, task):
+    def from_orm_task(
+        cls,
+        task,
+        products: list[str] | None = None,
+        products_count: int | None = None,
+    ):
         return cls(
+            task_id=task.task_id,
             close_status=task.close_status,
             name=task.name,
             line=task.line,
@@ -60,13 +119,72 @@ class Task(BaseModel):
             started_at=task.started_at,
             completed_at=task.completed_at,
             closed_at=task.closed_at,
-            products=[
-                product.product_id
-                for product in task.consignment.products
-            ]
+            products=products,
+            products_count=products_count,
         )
 
 
+class TaskProduct(BaseModel):
+    product_id: str
+    is_aggregated: bool
+    aggregated_at: datetime | None
+
+
+class TaskProductsPage(BaseModel):
+    products: list[TaskProduct]
+    next_cursor: str | None
+
+
+class ConsignmentProgress(BaseModel):
+    consignment_id: int
+    consignment_number: int
+    consignment_date: date
+    task_id: int
+    line: str
+    total_products: int
+    aggregated_products: int
+    first_aggregated_at: datetime | None
+    last_aggregated_at: datetime | None
+
+
+class ConsignmentsProgressPage(BaseModel):
+    consignments: list[ConsignmentProgress]
+    next_cursor: int | None
+
+
+class LineProgress(BaseModel):
+    line: str
+    consignments: int
+    total_products: int
+    aggregated_products: int
+    first_aggregated_at: datetime | None
+    last_aggregated_at: datetime | None
+
+
+class TasksCursor(BaseModel):
+    started_at: datetime
+    task_id: int
+
+    def encode(self) -> str:
+        return urlsafe_b64encode(self.model_dump_json().encode()).decode()
+
+    @classmethod
+    def decode(cls, cursor: str):
+        return cls.model_validate_json(urlsafe_b64decode(cursor))
+
+
+class TasksPage(BaseModel):
+    etag: str
+    next_cursor: str | None
+    tasks: list[Task] | None = None
+
+
+class VersionedTask(BaseModel):
+    etag: str
+    close_status: bool
+    task: Task | None = None
+
+
 class UpdateTaskModel(BaseModel):
     close_status: bool | None = Field(default=None)
     name: str | None = Field(default=None)
@@ -1,10 +1,31 @@
+import logging
+from collections.abc import AsyncIterator
 from datetime import date, datetime
 
+from pydantic import ValidationError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.adapters.cache import LRUCache, MISSING
+from src.adapters.coalescer import Coalescer
 from src.adapters.database import AsyncSessionManager
+from src.adapters.metrics import AGGREGATIONS, PRODUCT_CODES_INGESTED, TASKS_INGESTED
 from src.base_service import BaseService
-from src.modules.exceptions import HTTPNotFoundError, HTTPBadRequestError
+from src.modules.etags import make_etag, etag_matches
+from src.modules.exceptions import HTTPNotFoundError, HTTPBadRequestError, HTTPConflictError
+from src.modules.tasks.products_filter import ProductsFilter
 from src.modules.tasks.repository import TasksRepository
-from src.modules.tasks.schemas import AddTaskModel, Task, AddProductModel, UpdateTaskModel
+from src.modules.tasks.schemas import (
+    AddTaskModel, Task, AddProductModel, UpdateTaskModel, AddProductsResult, AggregatedProduct,
+    AggregateProductModel, AggregationResult, AggregationStatus, TasksCursor, TasksPage,
+    ProductsInclusion, TaskProduct, TaskProductsPage, VersionedTask, ConsignmentsProgressPage, LineProgress,
+)
+
+logger = logging.getLogger(__name__)
+
+# Number of streamed products flushed to the database at once.
+PRODUCTS_BATCH_SIZE = 10000
+# The binding is not aggregated yet the update missed it, e.g. it was committed meanwhile.
+CONFLICT_DETAIL = "unique code was not aggregated, retry the request"
 
 
 class TasksService(BaseService):
@@ -14,27 +35,24 @@ class TasksService(BaseService):
         *,
         session_factory: AsyncSessionManager,
         tasks_repository: TasksRepository,
+        products_filter: ProductsFilter | None = None,
+        closed_tasks_cache: LRUCache | None = None,
+        aggregation_coalescer: Coalescer | None = None,
     ):
         super().__init__(session_factory)
         self.tasks_repository = tasks_repository
+        self.products_filter = products_filter
+        self.closed_tasks_cache = closed_tasks_cache
+        self.aggregation_coalescer = aggregation_coalescer
 
     async def add_task(self, tasks: list[AddTaskModel]):
-        """Creates a new task. Checks if the consignment exists and creates it if not."""
+        """Creates new tasks in bulk. Consignments are created if they do not exist,
+                tasks of existing consignments are overwritten."""
         async with self.session_factory() as session:
-            for task in tasks:
-                consignment_id = await self.tasks_repository.get_consignment(
-                    session=session,
-                    consignment_number=task.consignment_number,
-                    consignment_date=task.consignment_date,
-                )
-                if not consignment_id:
-                    consignment_id = await self.tasks_repository.add_consignment(
-                        session=session,
-                        consignment_number=task.consignment_number,
-                        consignment_date=task.consignment_date,
-                    )
-                await self.tasks_repository.add_task(
-                    session=session, task=task, consignment_id=consignment_id)
+            await self.tasks_repository.upsert_tasks(session=session, tasks=tasks)
+        self.tasks_repository.invalidate_consignments(
+            [(task.consignment_number, task.consignment_date) for task in tasks])
+        TASKS_INGESTED.inc(len(tasks))
 
     async def get_tasks(
         self,
@@ -45,10 +63,18 @@ class TasksService(BaseService):
         end_date: date | None = None,
         offset: int = 0,
         limit: int = 30,
-    ) -> list[Task]:
-        """Gets filtered tasks."""
+        cursor: str | None = None,
+        include_products: ProductsInclusion = ProductsInclusion.full,
+        if_none_match: str | None = None,
+    ) -> TasksPage:
+        """Gets filtered tasks. Returns the cursor of the next page if the page is full.
+                Tasks are not built if the page ETag matches If-None-Match."""
+        try:
+            tasks_cursor = TasksCursor.decode(cursor) if cursor else None
+        except ValueError:
+            raise HTTPBadRequestError(detail="invalid cursor")
         async with self.session_factory() as session:
-            return await self.tasks_repository.get_tasks(
+            rows = await self.tasks_repository.get_task_rows(
                 session=session,
                 close_status=close_status,
                 consignment_number=consignment_number,
@@ -57,21 +83,198 @@ class TasksService(BaseService):
                 end_date=end_date,
                 offset=offset,
                 limit=limit,
+                cursor=tasks_cursor,
+            )
+            next_cursor = None
+            if rows and len(rows) == limit:
+                next_cursor = TasksCursor(
+                    started_at=rows[-1].started_at,
+                    task_id=rows[-1].task_id,
+                ).encode()
+            etag = make_etag(include_products, *(
+                (row.task_id, row.version, row.consignment.version)
+                for row in rows
+            ))
+            page = TasksPage(etag=etag, next_cursor=next_cursor)
+            if etag_matches(if_none_match, etag):
+                return page
+            page.tasks = await self.tasks_repository.build_tasks(
+                session=session,
+                tasks=rows,
+                include_products=include_products,
             )
+            return page
+
+    async def export_tasks(
+        self,
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> AsyncIterator[list[Task]]:
+        """Streams all filtered tasks in batches. Logs the number of exported tasks."""
+        exported = 0
+        async with self.session_factory() as session:
+            async for tasks in self.tasks_repository.stream_tasks(
+                session=session,
+                close_status=close_status,
+                consignment_number=consignment_number,
+                consignment_date=consignment_date,
+                start_date=start_date,
+                end_date=end_date,
+            ):
+                exported += len(tasks)
+                yield tasks
+        logger.info('Exported %s tasks', exported)
+
+    async def get_consignments_progress(
+        self,
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+        line: str | None = None,
+        cursor: int | None = None,
+        limit: int = 1000,
+    ) -> ConsignmentsProgressPage:
+        """Gets aggregation progress of consignments of filtered tasks from their counters.
+                Returns the cursor of the next page if the page is full."""
+        async with self.session_factory() as session:
+            consignments = await self.tasks_repository.get_consignments_progress(
+                session=session,
+                close_status=close_status,
+                consignment_number=consignment_number,
+                consignment_date=consignment_date,
+                start_date=start_date,
+                end_date=end_date,
+                line=line,
+                cursor=cursor,
+                limit=limit,
+            )
+        next_cursor = consignments[-1].consignment_id if consignments and len(consignments) == limit else None
+        return ConsignmentsProgressPage(consignments=consignments, next_cursor=next_cursor)
+
+    async def get_lines_progress(
+        self,
+        close_status: bool | None = None,
+        consignment_number: int | None = None,
+        consignment_date: date | None = None,
+        start_date: date | None = None,
+        end_date: date | None = None,
+    ) -> list[LineProgress]:
+        """Gets aggregation progress of lines summed from counters of consignments of filtered tasks."""
+        async with self.session_factory() as session:
+            return await self.tasks_repository.get_lines_progress(
+                session=session,
+                close_status=close_status,
+                consignment_number=consignment_number,
+                consignment_date=consignment_date,
+                start_date=start_date,
+                end_date=end_date,
+            )
+
+    async def fold_progress(self) -> int:
+        """Moves deltas of progress counters into counters of consignments."""
+        async with self.session_factory() as session:
+            folded = await self.tasks_repository.fold_progress(session=session)
+        logger.info('Folded %s deltas of progress counters', folded)
+        return folded
 
     async def get_task(
         self,
         task_id: int,
-    ) -> Task:
-        """Gets a task by ID."""
+        include_products: ProductsInclusion = ProductsInclusion.full,
+        if_none_match: str | None = None,
+    ) -> VersionedTask:
+        """Gets a task by ID. The task is not built if its ETag matches If-None-Match.
+                Closed tasks are cached in the worker and served while their ETag is current,
+                so tasks overwritten or given products by any worker are built again."""
         async with self.session_factory() as session:
-            task = await self.tasks_repository.get_task(
+            row = await self.tasks_repository.get_task_row(
                 session=session,
                 task_id=task_id,
             )
-            if not task:
+            if not row:
                 raise HTTPNotFoundError
-            return task
+            versioned_task = VersionedTask(
+                etag=make_etag(task_id, row.version, row.consignment.version, include_products),
+                close_status=bool(row.close_status),
+            )
+            if etag_matches(if_none_match, versioned_task.etag):
+                return versioned_task
+            key = (task_id, include_products)
+            cached = self.closed_tasks_cache.get(key) if self.closed_tasks_cache is not None else MISSING
+            if cached is not MISSING and cached.etag == versioned_task.etag:
+                return cached
+            versioned_task.task = (await self.tasks_repository.build_tasks(
+                session=session,
+                tasks=[row],
+                include_products=include_products,
+            ))[0]
+        if self.closed_tasks_cache is not None:
+            if versioned_task.close_status:
+                self.closed_tasks_cache.set(key, versioned_task)
+            else:
+                self.closed_tasks_cache.invalidate([key])
+        return versioned_task
+
+    async def get_task_products(
+        self,
+        task_id: int,
+        aggregated: bool | None = None,
+        cursor: str | None = None,
+        limit: int = 1000,
+    ) -> TaskProductsPage:
+        """Gets products of a task. Returns the cursor of the next page if the page is full."""
+        async with self.session_factory() as session:
+            consignment_id = await self.tasks_repository.get_task_consignment_id(
+                session=session,
+                task_id=task_id,
+            )
+            if not consignment_id:
+                raise HTTPNotFoundError
+            products = await self.tasks_repository.get_consignment_products(
+                session=session,
+                consignment_id=consignment_id,
+                aggregated=aggregated,
+                cursor=cursor,
+                limit=limit,
+            )
+        next_cursor = products[-1].product_id if products and len(products) == limit else None
+        return TaskProductsPage(products=products, next_cursor=next_cursor)
+
+    async def stream_task_products(
+        self,
+        task_id: int,
+        aggregated: bool | None = None,
+    ) -> AsyncIterator[list[TaskProduct]]:
+        """Checks that the task exists and returns a stream of its products in batches."""
+        async with self.session_factory() as session:
+            consignment_id = await self.tasks_repository.get_task_consignment_id(
+                session=session,
+                task_id=task_id,
+            )
+        if not consignment_id:
+            raise HTTPNotFoundError
+        return self._stream_consignment_products(
+            consignment_id=consignment_id,
+            aggregated=aggregated,
+        )
+
+    async def _stream_consignment_products(
+        self,
+        consignment_id: int,
+        aggregated: bool | None = None,
+    ) -> AsyncIterator[list[TaskProduct]]:
+        async with self.session_factory() as session:
+            async for products in self.tasks_repository.stream_consignment_products(
+                session=session,
+                consignment_id=consignment_id,
+                aggregated=aggregated,
+            ):
+                yield products
 
     async def update_task(
         self,
@@ -96,57 +299,206 @@ class TasksService(BaseService):
             )
             if not task:
                 raise HTTPNotFoundError
-            return task
+        return task
 
     async def add_products_to_consignment(
         self,
         products: list[AddProductModel],
-    ):
-        """Binds products to the consignment."""
+    ) -> AddProductsResult:
+        """Binds products to the consignment. Products with unknown consignments
+                and products that already exist are ignored."""
         async with self.session_factory() as session:
-            for product in products:
-                consignment_id = await self.tasks_repository.get_consignment(
-                    session=session,
-                    consignment_number=product.consignment_number,
-                    consignment_date=product.consignment_date,
-                )
-                if not consignment_id:
+            return await self._add_products(session=session, products=products)
+
+    async def add_products_stream(
+        self,
+        lines: AsyncIterator[bytes],
+    ) -> AddProductsResult:
+        """Binds products read from newline delimited JSON. Products are validated one by one
+                and flushed in fixed-size batches, so memory use does not depend on the upload size."""
+        result = AddProductsResult(inserted=0, ignored_duplicates=0, ignored_unknown_consignment=0)
+        async with self.session_factory() as session:
+            batch = []
+            line_number = 0
+            async for line in lines:
+                line_number += 1
+                if not line.strip():
                     continue
-                await self.tasks_repository.add_products_to_consignment(
-                    session=session,
-                    consignment_id=consignment_id,
-                    product_id=product.product_id,
-                )
+                try:
+                    batch.append(AddProductModel.model_validate_json(line))
+                except ValidationError as error:
+                    raise HTTPBadRequestError(
+                        detail=f"invalid product at line {line_number}: {error.errors()}")
+                if len(batch) == PRODUCTS_BATCH_SIZE:
+                    self._add_result(result, await self._add_products(session=session, products=batch))
+                    batch = []
+            self._add_result(result, await self._add_products(session=session, products=batch))
+        logger.info(
+            'Streamed products: %s inserted, %s duplicates, %s with unknown consignments',
+            result.inserted, result.ignored_duplicates, result.ignored_unknown_consignment,
+        )
+        return result
+
+    async def _add_products(
+        self,
+        session: AsyncSession,
+        products: list[AddProductModel],
+    ) -> AddProductsResult:
+        consignment_ids = await self.tasks_repository.get_consignments(
+            session=session,
+            consignments=list({
+                (product.consignment_number, product.consignment_date)
+                for product in products
+            }),
+        )
+        bindings = {}
+        unknown_consignment = 0
+        for product in products:
+            consignment_id = consignment_ids.get(
+                (product.consignment_number, product.consignment_date))
+            if not consignment_id:
+                unknown_consignment += 1
+                continue
+            bindings.setdefault(product.product_id, consignment_id)
+        inserted = await self.tasks_repository.add_products_to_consignments(
+            session=session,
+            bindings=bindings,
+        )
+        if self.products_filter:
+            await self.products_filter.add(bindings)
+        result = AddProductsResult(
+            inserted=inserted,
+            ignored_duplicates=len(products) - unknown_consignment - inserted,
+            ignored_unknown_consignment=unknown_consignment,
+        )
+        PRODUCT_CODES_INGESTED.labels('inserted').inc(result.inserted)
+        PRODUCT_CODES_INGESTED.labels('duplicate').inc(result.ignored_duplicates)
+        PRODUCT_CODES_INGESTED.labels('unknown_consignment').inc(result.ignored_unknown_consignment)
+        return result
+
+    @staticmethod
+    def _add_result(result: AddProductsResult, batch_result: AddProductsResult) -> None:
+        result.inserted += batch_result.inserted
+        result.ignored_duplicates += batch_result.ignored_duplicates
+        result.ignored_unknown_consignment += batch_result.ignored_unknown_consignment
 
     async def aggregate_products(
         self,
         consignment_id: int,
         product_id: str,
-    ) -> None:
+    ) -> AggregatedProduct:
         """Aggregates products within given consignment.
                 Raises errors if the products were already aggregated,
                 if the products are binded to another consignment
-                and if the consignment for the products are not found."""
-        async with self.session_factory() as session:
-            is_aggregated = (
-                await self.tasks_repository.get_product_to_consignment(
-                    session=session,
-                    consignment_id=consignment_id,
-                    product_id=product_id,
-                )
+                and if the consignment for the products are not found.
+                With the coalescer concurrent aggregations are applied in batches."""
+        if self.products_filter and self.products_filter.definitely_missing(product_id):
+            AGGREGATIONS.labels(AggregationStatus.not_found).inc()
+            raise HTTPNotFoundError
+        if self.aggregation_coalescer and self.aggregation_coalescer.enabled:
+            result = await self.aggregation_coalescer.submit(
+                AggregateProductModel(product_id=product_id, consignment_id=consignment_id),
+                apply=self.aggregate_products_batch,
             )
-            if is_aggregated is True:
-                raise HTTPBadRequestError(detail="unique code already used at {aggregated_at}")
-            if is_aggregated is None:
-                consignments = await self.tasks_repository.get_consignments_by_product(
-                    session=session,
+            if result.status == AggregationStatus.aggregated:
+                return AggregatedProduct(
                     product_id=product_id,
+                    consignment_id=consignment_id,
+                    aggregated_at=result.aggregated_at,
                 )
-                if consignments:
-                    raise HTTPBadRequestError(detail="unique code is attached to another batch")
+            if result.status == AggregationStatus.not_found:
                 raise HTTPNotFoundError
-            await self.tasks_repository.aggregate(
+            if result.status == AggregationStatus.wrong_batch:
+                raise HTTPBadRequestError(detail="unique code is attached to another batch")
+            if result.status == AggregationStatus.conflict:
+                raise HTTPConflictError(detail=CONFLICT_DETAIL)
+            raise HTTPBadRequestError(detail=f"unique code already used at {result.aggregated_at}")
+        async with self.session_factory() as session:
+            aggregated_at = await self.tasks_repository.aggregate(
                 session=session,
                 consignment_id=consignment_id,
                 product_id=product_id,
             )
+            if aggregated_at:
+                AGGREGATIONS.labels(AggregationStatus.aggregated).inc()
+                return AggregatedProduct(
+                    product_id=product_id,
+                    consignment_id=consignment_id,
+                    aggregated_at=aggregated_at,
+                )
+            bindings = await self.tasks_repository.get_product_bindings(
+                session=session,
+                product_ids=[product_id],
+            )
+            binding = bindings.get(product_id)
+            if not binding:
+                AGGREGATIONS.labels(AggregationStatus.not_found).inc()
+                raise HTTPNotFoundError
+            if binding.consignment_id != consignment_id:
+                AGGREGATIONS.labels(AggregationStatus.wrong_batch).inc()
+                raise HTTPBadRequestError(detail="unique code is attached to another batch")
+            if not binding.is_aggregated:
+                AGGREGATIONS.labels(AggregationStatus.conflict).inc()
+                raise HTTPConflictError(detail=CONFLICT_DETAIL)
+            AGGREGATIONS.labels(AggregationStatus.already_used).inc()
+            raise HTTPBadRequestError(detail=f"unique code already used at {binding.aggregated_at}")
+
+    async def aggregate_products_batch(
+        self,
+        products: list[AggregateProductModel],
+    ) -> list[AggregationResult]:
+        """Aggregates a batch of products within their consignments.
+                Every product gets its own status, so invalid products do not fail the batch."""
+        missing = set()
+        if self.products_filter:
+            missing = {
+                product.product_id
+                for product in products
+                if self.products_filter.definitely_missing(product.product_id)
+            }
+        known_products = [product for product in products if product.product_id not in missing]
+        async with self.session_factory() as session:
+            aggregated = await self.tasks_repository.aggregate_many(
+                session=session,
+                products=list(dict.fromkeys(
+                    (product.product_id, product.consignment_id)
+                    for product in known_products
+                )),
+            )
+            not_aggregated = [
+                product.product_id
+                for product in known_products
+                if product.product_id not in aggregated
+            ]
+            bindings = dict(aggregated)
+            if not_aggregated:
+                bindings.update(await self.tasks_repository.get_product_bindings(
+                    session=session,
+                    product_ids=not_aggregated,
+                ))
+        results = []
+        newly_aggregated = set(aggregated)
+        for product in products:
+            binding = bindings.get(product.product_id)
+            aggregated_at = None
+            if not binding:
+                status = AggregationStatus.not_found
+            elif binding.consignment_id != product.consignment_id:
+                status = AggregationStatus.wrong_batch
+            elif product.product_id in newly_aggregated:
+                newly_aggregated.remove(product.product_id)
+                aggregated_at = binding.aggregated_at
+                status = AggregationStatus.aggregated
+            elif product.product_id in aggregated or binding.is_aggregated:
+                aggregated_at = binding.aggregated_at
+                status = AggregationStatus.already_used
+            else:
+                status = AggregationStatus.conflict
+            AGGREGATIONS.labels(status).inc()
+            results.append(AggregationResult(
+                product_id=product.product_id,
+                consignment_id=product.consignment_id,
+                status=status,
+                aggregated_at=aggregated_at,
+            ))
+        return results
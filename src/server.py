@@ -2,8 +2,13 @@ from fastapi import FastAPI
 from starlette.middleware.cors import CORSMiddleware
 
 from config import get_settings
+from src.adapters.metrics import METRICS_PATH, MetricsMiddleware, metrics
+from src.adapters.query_stats import QueryStatsMiddleware
 from src.containers import AdaptersContainer, RepositoriesContainer, ServicesContainer
+from src.modules.analytics.controllers import router_analytics
+from src.modules.idempotency.middleware import IdempotencyMiddleware, always
 from src.modules.tasks.controllers import router_tasks
+from src.modules.tasks.schemas import AddProductsResult
 
 settings = get_settings()
 
@@ -15,23 +20,44 @@ services = ServicesContainer(adapters=adapters_container, repositories=repositor
 
 app = FastAPI()
 app.include_router(router_tasks)
+app.include_router(router_analytics)
+app.add_api_route(METRICS_PATH, metrics, include_in_schema=False)
 
 
 app.adapters_container = adapters_container
 app.repositories_container = repositories
 app.services_container = services
 
+# Added first to run inside CORSMiddleware, replayed responses get its headers too.
+if settings.idempotency.enabled:
+    app.add_middleware(
+        IdempotencyMiddleware,
+        service_factory=services.idempotency_service,
+        routes={
+            ('POST', '/v1/tasks'): always,
+            # Products ignored for unknown consignments may be bound by a later identical batch.
+            ('POST', '/v1/tasks/products'): lambda body: AddProductsResult.model_validate_json(body).complete,
+        },
+    )
 app.add_middleware(
     CORSMiddleware,
     allow_origins=settings.cors.origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=settings.cors.headers,
+    # Cursors of the next pages are returned in a header.
+    expose_headers=['X-Next-Cursor'],
 )
-
-db = adapters_container.database()
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 
 @app.on_event('startup')
 async def startup():
-    await db.create_database()
+    if settings.products_filter.enabled:
+        await services.products_filter().start()
+
+
+@app.on_event('shutdown')
+async def shutdown():
+    await services.products_filter().stop()
@@ -0,0 +1,25 @@
+from src.adapters.bloom import BloomFilter
+
+
+def test_bloom_filter():
+    """Tests that added items are always found and other items rarely are."""
+    bloom = BloomFilter(capacity=10000, error_rate=0.01)
+    for i in range(10000):
+        bloom.add(f'added-{i}')
+    assert all(f'added-{i}' in bloom for i in range(10000))
+    false_positives = sum(f'other-{i}' in bloom for i in range(10000))
+    assert false_positives < 200
+    assert 0.005 < bloom.false_positive_rate < 0.02
+    assert bloom.size_bytes == 11982
+
+
+def test_bloom_filter_update():
+    """Tests that adding items in bulk sets the same bits as adding them one by one."""
+    items = [f'added-{i}' for i in range(1000)]
+    one_by_one = BloomFilter(capacity=1000, error_rate=0.01)
+    for item in items:
+        one_by_one.add(item)
+    bulk = BloomFilter(capacity=1000, error_rate=0.01)
+    bulk.update(items)
+    assert bulk._bits == one_by_one._bits
+    assert bulk.count == one_by_one.count == 1000
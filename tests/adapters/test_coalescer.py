@@ -0,0 +1,37 @@
+import asyncio
+
+import pytest
+
+from src.adapters.coalescer import Coalescer
+
+
+@pytest.mark.asyncio
+async def test_coalescer_batches_concurrent_items():
+    """Tests that items of the window are applied together and every caller gets its result."""
+    batches = []
+
+    async def apply(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    coalescer = Coalescer(window_ms=20, max_items=3, name='test')
+    results = await asyncio.gather(*(coalescer.submit(item, apply) for item in range(5)))
+    assert results == [0, 2, 4, 6, 8]
+    # The batch is applied when it is full, the rest waits for the window.
+    assert batches == [[0, 1, 2], [3, 4]]
+
+
+@pytest.mark.asyncio
+async def test_coalescer_fails_every_caller_of_the_batch():
+    """Tests that the error of a batch is raised to all of its callers."""
+    async def apply(items):
+        raise RuntimeError('batch failed')
+
+    coalescer = Coalescer(window_ms=1, max_items=10, name='test')
+    results = await asyncio.gather(*(coalescer.submit(item, apply) for item in range(2)), return_exceptions=True)
+    assert [str(result) for result in results] == ['batch failed', 'batch failed']
+
+
+def test_zero_window_disables_coalescing():
+    assert not Coalescer(window_ms=0, max_items=200, name='test').enabled
+    assert Coalescer(window_ms=2, max_items=200, name='test').enabled
@@ -0,0 +1,88 @@
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from src.db_models.analytics import AggregationRollups
+
+
+@pytest_asyncio.fixture()
+async def aggregated_products(
+    generic_task,
+    db_products_factory,
+    db_product_to_consignment_factory,
+):
+    """Products of the generic task aggregated at 10:15, 10:45 and 11:05, and one not aggregated."""
+    for aggregated_at in (datetime(2024, 1, 1, 10, 15), datetime(2024, 1, 1, 10, 45), datetime(2024, 1, 1, 11, 5), None):
+        product = await db_products_factory()
+        await db_product_to_consignment_factory(
+            product_id=product.product_id,
+            is_aggregated=aggregated_at is not None,
+            aggregated_at=aggregated_at,
+        )
+    return generic_task
+
+
+async def rollups(test_session):
+    stmt = (
+        select(AggregationRollups.bucket,
+               AggregationRollups.line,
+               AggregationRollups.aggregated_products)
+        .order_by(AggregationRollups.bucket)
+    )
+    return (await test_session.execute(stmt)).tuples().all()
+
+
+@pytest.mark.asyncio
+async def test_refresh_is_incremental(
+    analytics_service,
+    test_session,
+    aggregated_products,
+):
+    """Tests that refreshes count every aggregation once and leave the lag to the next refresh."""
+    line = aggregated_products.line
+    # The lag of the service is a minute, aggregations up to 11:00 are counted.
+    assert await analytics_service.refresh(now=datetime(2024, 1, 1, 11, 1)) == 2
+    assert await rollups(test_session) == [(datetime(2024, 1, 1, 10), line, 2)]
+    # Windows of an hour are refreshed one by one.
+    assert await analytics_service.refresh(now=datetime(2024, 1, 1, 14)) == 1
+    assert await analytics_service.refresh(now=datetime(2024, 1, 1, 15)) == 0
+    assert await rollups(test_session) == [
+        (datetime(2024, 1, 1, 10), line, 2),
+        (datetime(2024, 1, 1, 11), line, 1),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_endpoint_throughput(
+    async_client,
+    test_app,
+    analytics_service,
+    aggregated_products,
+    query_budget,
+):
+    """Tests reports grouped by dimensions and buckets of a day."""
+    await analytics_service.refresh(now=datetime(2024, 1, 2))
+    with test_app.services_container.analytics_service.override(analytics_service):
+        with query_budget(2):
+            response = await async_client.get('/v1/analytics/throughput', params={
+                'group_by': ['line', 'shift'],
+                'granularity': 'day',
+                'start': '2024-01-01T00:00:00',
+                'end': '2024-01-02T00:00:00',
+            })
+        assert response.status_code == 200
+        assert response.headers['X-Rollup-Watermark'] == '2024-01-01T23:59:00'
+        assert response.json() == [{
+            'bucket': '2024-01-01T00:00:00',
+            'line': aggregated_products.line,
+            'shift': aggregated_products.shift,
+            'brigade': None,
+            'nomenclature': None,
+            'aggregated_products': 3,
+        }]
+        response = await async_client.get('/v1/analytics/throughput', params={
+            'brigade': aggregated_products.brigade + '1',
+        })
+        assert response.json() == []
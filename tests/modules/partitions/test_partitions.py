@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+from sqlalchemy import text
+
+
+async def partition_of(test_session, product_id):
+    stmt = text('SELECT tableoid::regclass::text FROM products_to_consignments WHERE product_id = :product_id')
+    return (await test_session.execute(stmt, {'product_id': product_id})).scalar()
+
+
+@pytest.mark.asyncio()
+async def test_create_partitions_ahead(
+    partitions_service,
+    test_session,
+    generic_product_to_consignment,
+):
+    """Tests that partitions are created ahead and take rows from the default partition."""
+    today = generic_product_to_consignment.consignment_date
+    assert await partition_of(test_session, generic_product_to_consignment.product_id) == (
+        'products_to_consignments_default'
+    )
+    created = await partitions_service.create_ahead(today=today)
+    assert created == [
+        f'products_to_consignments_y{today:%Y}m{today:%m}',
+        f'products_to_consignments_y{today.year + today.month // 12}m{today.month % 12 + 1:02}',
+    ]
+    assert await partition_of(test_session, generic_product_to_consignment.product_id) == created[0]
+    assert await partitions_service.create_ahead(today=today) == []
+    # Rows bound concurrently would land in the default partition after the move.
+    stmt = text('''
+        SELECT mode FROM pg_locks
+        WHERE pid = pg_backend_pid() AND relation = CAST('products_to_consignments_default' AS regclass)
+    ''')
+    assert 'ShareRowExclusiveLock' in (await test_session.execute(stmt)).scalars().all()
+
+
+@pytest.mark.asyncio()
+async def test_archive_partitions(
+    partitions_service,
+    test_session,
+    db_consignments_factory,
+    db_tasks_factory,
+    db_products_factory,
+    db_product_to_consignment_factory,
+):
+    """Tests that only old partitions with closed tasks are archived."""
+    for consignment_date, close_status in ((date(2023, 1, 10), True), (date(2023, 2, 10), False)):
+        consignment = await db_consignments_factory(consignment_date=consignment_date)
+        await db_tasks_factory(consignment_id=consignment.consignment_id, close_status=close_status)
+        product = await db_products_factory()
+        await db_product_to_consignment_factory(
+            product_id=product.product_id,
+            consignment_id=consignment.consignment_id,
+            consignment_date=consignment_date,
+        )
+        await partitions_service.create_ahead(today=consignment_date)
+
+    archived = await partitions_service.archive(today=date(2024, 3, 1))
+    assert archived == ['products_to_consignments_y2023m01']
+    assert await partition_of(test_session, product.product_id) == 'products_to_consignments_y2023m02'
+    stmt = text('SELECT count(*) FROM archive.products_to_consignments_y2023m01')
+    assert (await test_session.execute(stmt)).scalar() == 1
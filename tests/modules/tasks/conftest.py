@@ -4,6 +4,7 @@ import pytest
 import pytest_asyncio
 from sqlalchemy import select
 
+from src.db_models.products import Products
 from src.db_models.tasks import ProductsToConsignments, Consignments, ShiftTasks
 from src.modules.tasks.schemas import Task
 
@@ -16,6 +17,7 @@ def assert_task(
 ):
     def check(task):
         expected = Task(
+            task_id=generic_task.task_id,
             close_status=generic_task.close_status,
             name=generic_task.name,
             line=generic_task.line,
@@ -103,3 +105,24 @@ async def assert_created_task(task_data, test_session):
         assert data.nomenclature == task_data['Номенклатура']
         assert data.brigade == task_data['Бригада']
     return check
+
+
+@pytest_asyncio.fixture()
+async def assert_added_products(test_session, generic_consignment):
+    async def check(product_ids):
+        stmt = (
+            select(Products.product_id,
+                   ProductsToConsignments.consignment_id,
+                   ProductsToConsignments.is_aggregated,
+                   ProductsToConsignments.aggregated_at)
+            .join(ProductsToConsignments,
+                  ProductsToConsignments.product_id == Products.product_id)
+            .where(Products.product_id.in_(product_ids))
+        )
+        data = (await test_session.execute(stmt)).all()
+        assert len(data) == len(product_ids)
+        for row in data:
+            assert row.consignment_id == generic_consignment.consignment_id
+            assert row.is_aggregated is False
+            assert row.aggregated_at is None
+    return check
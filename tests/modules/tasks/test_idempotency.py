@@ -0,0 +1,113 @@
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from src.db_models.idempotency import IdempotencyKeys
+from src.db_models.tasks import ShiftTasks
+
+
+@pytest.fixture()
+def ingestion(test_app, tasks_service, idempotency_service):
+    with (test_app.services_container.tasks_service.override(tasks_service),
+          test_app.services_container.idempotency_service.override(idempotency_service)):
+        yield
+
+
+@pytest.mark.asyncio
+async def test_repeated_batch_is_replayed(
+    async_client,
+    ingestion,
+    test_session,
+    task_data,
+    query_budget,
+):
+    """Tests that a repeated batch gets the stored response without touching the tables."""
+    first = await async_client.post('/v1/tasks', json=[task_data])
+    assert first.status_code == 200
+    with query_budget(1) as executed:
+        repeated = await async_client.post('/v1/tasks', json=[task_data], headers={'Origin': 'http://erp'})
+    assert 'idempotency_keys' in executed[0]
+    assert repeated.status_code == 200
+    assert repeated.headers['Idempotent-Replayed'] == 'true'
+    assert 'access-control-allow-origin' in repeated.headers
+    assert repeated.content == first.content
+    assert await test_session.scalar(select(func.count()).select_from(ShiftTasks)) == 1
+
+
+@pytest.mark.asyncio
+async def test_idempotency_key(
+    async_client,
+    ingestion,
+    task_data,
+):
+    """Tests that a key is replayed with its request and rejected with another one."""
+    headers = {'Idempotency-Key': 'batch-1'}
+    assert (await async_client.post('/v1/tasks', json=[task_data], headers=headers)).status_code == 200
+    repeated = await async_client.post('/v1/tasks', json=[task_data], headers=headers)
+    assert repeated.headers['Idempotent-Replayed'] == 'true'
+    other = await async_client.post('/v1/tasks', json=[{**task_data, 'Смена': 'other'}], headers=headers)
+    assert other.status_code == 422
+    # Failed requests are not stored.
+    for _ in range(2):
+        invalid = await async_client.post('/v1/tasks', json=[{}])
+        assert invalid.status_code == 422
+        assert 'Idempotent-Replayed' not in invalid.headers
+
+
+@pytest.mark.asyncio
+async def test_incomplete_products_are_not_replayed(
+    async_client,
+    ingestion,
+    task_data,
+):
+    """Tests that a batch with products of unknown consignments is ingested again once they exist."""
+    products = [{
+        'УникальныйКодПродукта': 'code-1',
+        'НомерПартии': task_data['НомерПартии'],
+        'ДатаПартии': task_data['ДатаПартии'],
+    }]
+    ignored = await async_client.post('/v1/tasks/products', json=products)
+    assert ignored.json()['ignored_unknown_consignment'] == 1
+    await async_client.post('/v1/tasks', json=[task_data])
+    bound = await async_client.post('/v1/tasks/products', json=products)
+    assert 'Idempotent-Replayed' not in bound.headers
+    assert bound.json()['inserted'] == 1
+    replayed = await async_client.post('/v1/tasks/products', json=products)
+    assert replayed.headers['Idempotent-Replayed'] == 'true'
+    assert replayed.json()['inserted'] == 1
+
+
+@pytest.mark.asyncio
+async def test_hash_retention(
+    idempotency_service,
+    test_session,
+):
+    """Tests that responses without an Idempotency-Key are only kept for the retry window."""
+    await idempotency_service.save_response('key:a', 'hash', 200, None, b'null', keyed=True)
+    await idempotency_service.save_response('hash:b', 'hash', 200, None, b'null', keyed=False)
+    stmt = select(IdempotencyKeys.key, IdempotencyKeys.expires_at - IdempotencyKeys.created_at).order_by('key')
+    assert (await test_session.execute(stmt)).tuples().all() == [
+        ('hash:b', timedelta(minutes=1)),
+        ('key:a', timedelta(hours=1)),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_prune(
+    idempotency_service,
+    test_session,
+):
+    """Tests that expired responses are pruned in batches and are not replayed."""
+    for key in ('a', 'b', 'c', 'd'):
+        await idempotency_service.save_response(key, 'hash', 200, 'application/json', b'null', keyed=True)
+    await test_session.execute(
+        update(IdempotencyKeys)
+        .where(IdempotencyKeys.key != 'd')
+        .values(expires_at=datetime.now() - timedelta(seconds=1))
+    )
+    assert await idempotency_service.get_response('a') is None
+    assert await idempotency_service.prune() == 3
+    keys = (await test_session.execute(select(IdempotencyKeys.key))).scalars().all()
+    assert keys == ['d']
+    assert (await idempotency_service.get_response('d')).body == b'null'
@@ -0,0 +1,96 @@
+import asyncio
+from datetime import date
+
+import pytest
+from prometheus_client import REGISTRY
+
+from src.modules.exceptions import HTTPBadRequestError, HTTPNotFoundError
+from src.modules.tasks.products_filter import ProductsFilter
+from src.modules.tasks.repository import TasksRepository
+from src.modules.tasks.schemas import AggregateProductModel, AggregationStatus
+from src.modules.tasks.service import TasksService
+
+
+async def wait_for(condition):
+    for _ in range(500):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise TimeoutError
+
+
+@pytest.mark.asyncio()
+async def test_products_filter_follows_ingestion(database, task_data):
+    """Tests that the filter learns products ingested and committed by any worker
+    and does not answer negatively right after a notification."""
+    repository = TasksRepository()
+    products_filter = ProductsFilter(
+        database=database,
+        tasks_repository=repository,
+        capacity=1000,
+        error_rate=0.01,
+        settle=60,
+    )
+    await products_filter.start()
+    try:
+        await wait_for(lambda: products_filter.stats()['ready'])
+        assert products_filter.definitely_missing('new-code')
+        assert REGISTRY.get_sample_value('products_filter_ready') == 1
+        assert REGISTRY.get_sample_value('products_filter_size_bytes') == products_filter.stats()['size_bytes']
+        async with database.async_session() as session:
+            consignment_ids = await repository.upsert_consignments(
+                session,
+                consignments=[(task_data['НомерПартии'], date.fromisoformat(task_data['ДатаПартии']))],
+            )
+            await repository.add_products_to_consignments(
+                session,
+                bindings={'new-code': next(iter(consignment_ids.values()))},
+            )
+        await wait_for(lambda: products_filter.stats()['codes'] == 1)
+        assert not products_filter.definitely_missing('new-code')
+        assert not products_filter.definitely_missing('other-code')
+        assert REGISTRY.get_sample_value('products_filter_codes') == 1
+    finally:
+        await products_filter.stop()
+
+
+class KnownCodesFilter:
+    """Filter of a worker which knows the given codes only."""
+
+    def __init__(self, product_ids) -> None:
+        self.product_ids = set(product_ids)
+
+    def definitely_missing(self, product_id: str) -> bool:
+        return product_id not in self.product_ids
+
+    async def add(self, product_ids) -> None:
+        self.product_ids.update(product_ids)
+
+
+@pytest.mark.asyncio()
+async def test_unknown_codes_are_not_looked_up(
+    session_manager,
+    tasks_repository,
+    generic_product_to_consignment,
+    query_budget,
+):
+    """Tests that codes missing from the filter are reported missing without statements."""
+    product_id = generic_product_to_consignment.product_id
+    consignment_id = generic_product_to_consignment.consignment_id
+    service = TasksService(
+        session_factory=session_manager,
+        tasks_repository=tasks_repository,
+        products_filter=KnownCodesFilter([product_id]),
+    )
+    with query_budget(0):
+        with pytest.raises(HTTPNotFoundError):
+            await service.aggregate_products(consignment_id=consignment_id, product_id='unknown')
+    # Dates of consignments and the aggregating update, the unknown code is not looked up.
+    with query_budget(2):
+        results = await service.aggregate_products_batch([
+            AggregateProductModel(product_id=product_id, consignment_id=consignment_id),
+            AggregateProductModel(product_id='unknown', consignment_id=consignment_id),
+        ])
+    assert [result.status for result in results] == [AggregationStatus.aggregated, AggregationStatus.not_found]
+    with pytest.raises(HTTPBadRequestError):
+        await service.aggregate_products(consignment_id=consignment_id, product_id=product_id)
@@ -0,0 +1,118 @@
+import pytest
+import pytest_asyncio
+
+# Requests are batched, so the budgets do not depend on the size of the request.
+BATCH = 50
+
+
+@pytest.fixture()
+def consignment_of(generic_consignment):
+    return {
+        'НомерПартии': generic_consignment.consignment_number,
+        'ДатаПартии': generic_consignment.consignment_date.isoformat(),
+    }
+
+
+@pytest.mark.asyncio
+async def test_ingestion_budgets(
+    async_client,
+    test_app,
+    tasks_service,
+    idempotency_service,
+    task_data,
+    consignment_of,
+    query_budget,
+):
+    """Tests statements of task and product ingestion, two of them look up and store the response."""
+    with (test_app.services_container.tasks_service.override(tasks_service),
+          test_app.services_container.idempotency_service.override(idempotency_service)):
+        with query_budget(4):
+            response = await async_client.post(
+                '/v1/tasks',
+                json=[{**task_data, 'НомерПартии': number} for number in range(BATCH)],
+            )
+        assert response.status_code == 200
+        with query_budget(7):
+            response = await async_client.post(
+                '/v1/tasks/products',
+                json=[{'УникальныйКодПродукта': f'code-{i}', **consignment_of} for i in range(BATCH)],
+            )
+        assert response.json()['inserted'] == BATCH
+
+
+@pytest_asyncio.fixture()
+async def tasks_with_products(
+    db_consignments_factory,
+    db_tasks_factory,
+    db_products_factory,
+    db_product_to_consignment_factory,
+):
+    """Tasks of BATCH consignments and bindings of two products to every consignment."""
+    tasks, bindings = [], []
+    # Numbers are out of the range of generated ones, so they do not clash with the generic consignment.
+    for number in range(100_000, 100_000 + BATCH):
+        consignment = await db_consignments_factory(consignment_number=number)
+        tasks.append(await db_tasks_factory(consignment_id=consignment.consignment_id))
+        for _ in range(2):
+            product = await db_products_factory()
+            bindings.append(await db_product_to_consignment_factory(
+                product_id=product.product_id,
+                consignment_id=consignment.consignment_id,
+                consignment_date=consignment.consignment_date,
+            ))
+    return tasks, bindings
+
+
+@pytest.mark.asyncio
+async def test_read_budgets(
+    async_client,
+    test_app,
+    tasks_service,
+    tasks_with_products,
+    query_budget,
+):
+    """Tests statements of task reads with their products."""
+    tasks, _ = tasks_with_products
+    task_id = tasks[0].task_id
+    with test_app.services_container.tasks_service.override(tasks_service):
+        for include_products, statements in (('none', 1), ('count', 3), ('full', 3)):
+            with query_budget(statements):
+                response = await async_client.get(
+                    '/v1/tasks', params={'limit': BATCH, 'include_products': include_products})
+            assert len(response.json()) == BATCH
+        with query_budget(3):
+            response = await async_client.get(f'/v1/tasks/{task_id}')
+        assert len(response.json()['products']) == 2
+        with query_budget(3):
+            response = await async_client.get(f'/v1/tasks/{task_id}/products')
+        assert response.status_code == 200
+        with query_budget(1):
+            response = await async_client.get('/v1/tasks/progress', params={'limit': BATCH})
+        assert len(response.json()) == BATCH
+        with query_budget(1):
+            response = await async_client.get('/v1/tasks/progress/lines')
+        assert response.status_code == 200
+
+
+@pytest.mark.asyncio
+async def test_aggregation_budgets(
+    async_client,
+    test_app,
+    tasks_service,
+    tasks_with_products,
+    query_budget,
+):
+    """Tests statements of single and batch aggregation."""
+    _, bindings = tasks_with_products
+    with test_app.services_container.tasks_service.override(tasks_service):
+        binding = bindings[0]
+        with query_budget(2):
+            response = await async_client.post(
+                f'/v1/tasks/products/{binding.product_id}/consignments/{binding.consignment_id}')
+        assert response.status_code == 200
+        with query_budget(3):
+            response = await async_client.post('/v1/tasks/products/aggregate', json=[
+                {'product_id': binding.product_id, 'consignment_id': binding.consignment_id}
+                for binding in bindings
+            ])
+        assert len(response.json()) == len(bindings)
@@ -0,0 +1,195 @@
+from datetime import date, timedelta
+from itertools import combinations
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import event, text
+
+from src.modules.tasks.schemas import ProductsInclusion
+
+CONSIGNMENTS = 10000
+PRODUCTS_PER_CONSIGNMENT = 5
+FIRST_DATE = date(2024, 1, 1)
+SEEDED_TABLES = {
+    'consignments', 'shift_tasks', 'products', 'products_to_consignments_default', 'consignments_progress_deltas',
+}
+# Selective values of the filters and the columns they are applied to.
+FILTERS = {
+    'close_status': (True, 'close_status'),
+    'consignment_number': (123, 'consignment_number'),
+    'consignment_date': (FIRST_DATE + timedelta(days=100), 'consignment_date'),
+    'start_date': (FIRST_DATE + timedelta(days=360), 'started_at'),
+    'end_date': (FIRST_DATE, 'completed_at'),
+}
+
+
+@pytest_asyncio.fixture()
+async def seeded_tasks(test_session):
+    """Seeds tasks of a year with products of their consignments and refreshes statistics."""
+    for statement in (
+        f'''INSERT INTO consignments (consignment_number, consignment_date)
+            SELECT g, DATE '{FIRST_DATE}' + g % 365 FROM generate_series(1, {CONSIGNMENTS}) AS g''',
+        '''INSERT INTO shift_tasks (consignment_id, close_status, name, line, shift, brigade,
+                                   nomenclature, code, identifier, started_at, completed_at)
+           SELECT consignment_id, consignment_id % 10 = 0, 'task', 'line', 'shift', 'brigade',
+                  'nomenclature', 'code', 'identifier',
+                  consignment_date + TIME '08:00', consignment_date + TIME '16:00'
+           FROM consignments''',
+        f'''INSERT INTO products
+            SELECT consignment_id || '-' || k FROM consignments, generate_series(1, {PRODUCTS_PER_CONSIGNMENT}) AS k''',
+        f'''INSERT INTO products_to_consignments (product_id, consignment_id, consignment_date, is_aggregated)
+            SELECT consignment_id || '-' || k, consignment_id, consignment_date, k = 1
+            FROM consignments, generate_series(1, {PRODUCTS_PER_CONSIGNMENT}) AS k''',
+        'ANALYZE consignments, shift_tasks, products, products_to_consignments',
+    ):
+        await test_session.execute(text(statement))
+    return (await test_session.execute(text('SELECT min(consignment_id) FROM consignments'))).scalar()
+
+
+@pytest_asyncio.fixture()
+async def explain(test_session):
+    """Captures statements of the repository and returns their plans."""
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    connection = await test_session.connection()
+    event.listen(connection.sync_connection, 'before_cursor_execute', capture)
+
+    async def plans(query):
+        statements.clear()
+        await query
+        event.remove(connection.sync_connection, 'before_cursor_execute', capture)
+        try:
+            return [
+                (await connection.exec_driver_sql(
+                    f'EXPLAIN (FORMAT JSON) {statement}', parameters,
+                )).scalar()[0]['Plan']
+                for statement, parameters in statements
+            ]
+        finally:
+            event.listen(connection.sync_connection, 'before_cursor_execute', capture)
+
+    yield plans
+    event.remove(connection.sync_connection, 'before_cursor_execute', capture)
+
+
+def nodes(plan):
+    yield plan
+    for child in plan.get('Plans', []):
+        yield from nodes(child)
+
+
+def assert_plan(plan, max_rows, relations=(), index_columns=()):
+    """Checks that seeded tables are read through indexes and the estimate fits the budget.
+    Some of index_columns must be searched in an index rather than filtered after the scan."""
+    scans = {
+        node['Relation Name']: node['Node Type']
+        for node in nodes(plan) if node.get('Relation Name') in SEEDED_TABLES
+    }
+    assert 'Seq Scan' not in scans.values(), scans
+    assert set(relations) <= set(scans), scans
+    if index_columns:
+        conditions = ' '.join(
+            node.get('Index Cond', '') + node.get('Recheck Cond', '') for node in nodes(plan)
+        )
+        assert any(column in conditions for column in index_columns), conditions
+    assert plan['Plan Rows'] <= max_rows, plan['Plan Rows']
+
+
+@pytest.mark.asyncio()
+async def test_get_tasks_plans(tasks_repository, test_session, seeded_tasks, explain):
+    """Tests that every combination of task filters is served by indexes."""
+    for size in range(len(FILTERS) + 1):
+        for names in combinations(FILTERS, size):
+            plans = await explain(tasks_repository.get_task_rows(
+                test_session,
+                limit=30,
+                **{name: FILTERS[name][0] for name in names},
+            ))
+            try:
+                assert_plan(
+                    plans[0],
+                    max_rows=30,
+                    relations=['shift_tasks', 'consignments'],
+                    index_columns=[FILTERS[name][1] for name in names],
+                )
+            except AssertionError as error:
+                raise AssertionError(f'filters {list(names)}: {error}') from None
+
+
+@pytest.mark.asyncio()
+async def test_get_task_plans(tasks_repository, test_session, seeded_tasks, explain):
+    """Tests plans of a task with its products."""
+    plans = await explain(tasks_repository.get_task(test_session, task_id=seeded_tasks))
+    assert_plan(plans[0], max_rows=1, relations=['shift_tasks', 'consignments'])
+    for plan in plans[1:]:
+        assert_plan(plan, max_rows=PRODUCTS_PER_CONSIGNMENT)
+    plans = await explain(tasks_repository.get_tasks(
+        test_session,
+        limit=30,
+        include_products=ProductsInclusion.count,
+    ))
+    for plan in plans[1:]:
+        assert_plan(plan, max_rows=30)
+
+
+@pytest.mark.asyncio()
+async def test_consignment_plans(tasks_repository, test_session, seeded_tasks, explain):
+    """Tests plans of consignment lookups and consignment products."""
+    plans = await explain(tasks_repository.get_consignments(
+        test_session,
+        consignments=[(1, FIRST_DATE + timedelta(days=1)), (2, FIRST_DATE + timedelta(days=2))],
+    ))
+    assert_plan(plans[0], max_rows=2, relations=['consignments'])
+    plans = await explain(tasks_repository.get_consignment_products(
+        test_session,
+        consignment_id=seeded_tasks,
+        aggregated=False,
+    ))
+    assert_plan(plans[0], max_rows=1, relations=['consignments'])
+    assert_plan(plans[1], max_rows=PRODUCTS_PER_CONSIGNMENT, relations=['products_to_consignments_default'])
+
+
+@pytest.mark.asyncio()
+async def test_aggregation_plans(tasks_repository, test_session, seeded_tasks, explain):
+    """Tests plans of aggregation and of the lookups explaining its failures."""
+    product_id = f'{seeded_tasks}-2'
+    plans = await explain(tasks_repository.aggregate(
+        test_session,
+        consignment_id=seeded_tasks,
+        product_id=product_id,
+    ))
+    for plan in plans:
+        assert_plan(plan, max_rows=1)
+    plans = await explain(tasks_repository.aggregate_many(
+        test_session,
+        products=[(f'{seeded_tasks + i}-3', seeded_tasks + i) for i in range(10)],
+    ))
+    for plan in plans:
+        assert_plan(plan, max_rows=10)
+    plans = await explain(tasks_repository.get_product_bindings(
+        test_session,
+        product_ids=[product_id, f'{seeded_tasks}-4'],
+    ))
+    assert_plan(plans[0], max_rows=2, relations=['products_to_consignments_default'])
+
+
+@pytest.mark.asyncio()
+async def test_progress_plans(tasks_repository, test_session, seeded_tasks, explain):
+    """Tests that progress sums deltas not folded yet of the page consignments only."""
+    for statement in (
+        f'''INSERT INTO consignments_progress_deltas (consignment_id, total_products, aggregated_products)
+            SELECT consignment_id, {PRODUCTS_PER_CONSIGNMENT}, 1
+            FROM consignments, generate_series(1, 3)''',
+        'ANALYZE consignments_progress_deltas',
+    ):
+        await test_session.execute(text(statement))
+    plans = await explain(tasks_repository.get_consignments_progress(test_session, limit=30))
+    assert_plan(plans[0], max_rows=30, relations=['shift_tasks', 'consignments', 'consignments_progress_deltas'])
+    plans = await explain(tasks_repository.get_lines_progress(
+        test_session,
+        consignment_date=FILTERS['consignment_date'][0],
+    ))
+    assert_plan(plans[0], max_rows=1, relations=['consignments', 'consignments_progress_deltas'])
@@ -1,6 +1,12 @@
-from datetime import timedelta, datetime
+from datetime import date, timedelta, datetime
 
 import pytest
+from prometheus_client import REGISTRY
+
+from src.adapters.cache import LRUCache, MISSING
+from src.modules.tasks.repository import TasksRepository
+from src.modules.tasks.schemas import AddTaskModel, ProductsInclusion
+from src.modules.tasks.service import TasksService
 
 
 @pytest.mark.parametrize(
@@ -66,3 +72,66 @@ async def test_get_task(
         task_id=generic_task.task_id
     )
     assert_task(task)
+
+
+@pytest.mark.asyncio()
+async def test_get_tasks_products_count(
+    tasks_repository,
+    test_session,
+    generic_task,
+    generic_product_to_consignment,
+):
+    """Tests getting tasks with the number of products instead of the products."""
+    tasks_data = await tasks_repository.get_tasks(
+        test_session,
+        include_products=ProductsInclusion.count,
+    )
+    assert [(task.task_id, task.products, task.products_count) for task in tasks_data] == [
+        (generic_task.task_id, None, 1),
+    ]
+
+
+@pytest.mark.asyncio()
+async def test_get_consignments_cached(
+    test_session,
+    session_manager,
+    generic_consignment,
+    task_data,
+):
+    """Tests that consignments are cached and invalidated once created tasks are committed."""
+    repository = TasksRepository(
+        consignments_cache=LRUCache(maxsize=10, ttl=60, negative_ttl=60, name='test_consignments'),
+    )
+    before = {
+        result: REGISTRY.get_sample_value(f'cache_{result}_total', {'cache': 'test_consignments'})
+        for result in ('hits', 'misses')
+    }
+    known = (generic_consignment.consignment_number, generic_consignment.consignment_date)
+    unknown = (task_data['НомерПартии'], date.fromisoformat(task_data['ДатаПартии']))
+    for _ in range(2):
+        consignment_ids = await repository.get_consignments(
+            test_session, consignments=[known, unknown])
+        assert consignment_ids == {known: generic_consignment.consignment_id}
+    for result in ('hits', 'misses'):
+        assert REGISTRY.get_sample_value(f'cache_{result}_total', {'cache': 'test_consignments'}) == before[result] + 2
+    service = TasksService(session_factory=session_manager, tasks_repository=repository)
+    await service.add_task([AddTaskModel(**task_data)])
+    consignment_ids = await repository.get_consignments(test_session, consignments=[unknown])
+    assert unknown in consignment_ids
+
+
+@pytest.mark.asyncio()
+async def test_unknown_consignment_dates_are_not_cached(
+    test_session,
+    generic_consignment,
+):
+    """Tests that only dates of existing consignments are cached, unknown IDs may be created later."""
+    repository = TasksRepository(
+        consignment_dates_cache=LRUCache(maxsize=10, ttl=60, negative_ttl=0, name='test_consignment_dates'),
+    )
+    unknown_id = generic_consignment.consignment_id + 1
+    consignment_dates = await repository.get_consignment_dates(
+        test_session, [generic_consignment.consignment_id, unknown_id])
+    assert consignment_dates == {generic_consignment.consignment_id: generic_consignment.consignment_date}
+    assert repository.consignment_dates_cache.get(unknown_id) is MISSING
+    assert repository.consignment_dates_cache.get(generic_consignment.consignment_id) == generic_consignment.consignment_date
@@ -1,4 +1,16 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime
+
 import pytest
+from dependency_injector import providers
+
+from src.adapters.cache import LRUCache
+from src.adapters.coalescer import Coalescer
+from src.modules.tasks.repository import TasksRepository, MAX_AGGREGATION_BATCH
+from src.modules.tasks.service import TasksService
 
 
 @pytest.mark.asyncio
@@ -18,6 +30,7 @@ async def test_endpoint_aggregate(
             f'/v1/tasks/products/{product_id}/consignments/{consignment_id}',
         )
         assert response.status_code == 200
+        assert response.json()['product_id'] == product_id
         await assert_aggregation()
 
 
@@ -57,6 +70,7 @@ async def test_endpoint_aggregate_invalid_consignment(
             f'/v1/tasks/products/{product_id}/consignments/{consignment_id}',
         )
         assert response.status_code == 400
+        assert response.json()['detail'] == 'unique code is attached to another batch'
 
 
 @pytest.mark.asyncio
@@ -73,10 +87,12 @@ async def test_endpoint_aggregate_already_aggregated(
         product_id = generic_product_to_consignment.product_id
         consignment_id = generic_product_to_consignment.consignment_id
         generic_product_to_consignment.is_aggregated = True
+        generic_product_to_consignment.aggregated_at = datetime(2024, 1, 30, 20, 0)
         response = await async_client.post(
             f'/v1/tasks/products/{product_id}/consignments/{consignment_id}',
         )
         assert response.status_code == 400
+        assert response.json()['detail'] == 'unique code already used at 2024-01-30 20:00:00'
 
 
 @pytest.mark.asyncio
@@ -96,3 +112,465 @@ async def test_endpoint_create_task(
         )
         assert response.status_code == 200
         await assert_created_task()
+
+
+@pytest.mark.asyncio
+async def test_endpoint_create_task_overwrites_consignment(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    task_data,
+    assert_created_task,
+):
+    """Tests that a task with an existing consignment overwrites the previous one."""
+    with test_app.services_container.tasks_service.override(tasks_service):
+        response = await async_client.post(
+            '/v1/tasks',
+            json=[{**task_data, 'Смена': '2'}, task_data],
+        )
+        assert response.status_code == 200
+        response = await async_client.post(
+            '/v1/tasks',
+            json=[{**task_data, 'Бригада': 'Бригада №5'}],
+        )
+        assert response.status_code == 200
+        task_data['Бригада'] = 'Бригада №5'
+        await assert_created_task()
+
+
+@pytest.mark.asyncio
+async def test_endpoint_add_products(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_consignment,
+    generic_product_to_consignment,
+    assert_added_products,
+):
+    """Tests adding products with duplicates and unknown consignments."""
+    with test_app.services_container.tasks_service.override(tasks_service):
+        consignment = {
+            'НомерПартии': generic_consignment.consignment_number,
+            'ДатаПартии': generic_consignment.consignment_date.isoformat(),
+        }
+        response = await async_client.post(
+            '/v1/tasks/products',
+            json=[
+                {'УникальныйКодПродукта': 'new-code', **consignment},
+                {'УникальныйКодПродукта': 'new-code', **consignment},
+                {'УникальныйКодПродукта': generic_product_to_consignment.product_id, **consignment},
+                {'УникальныйКодПродукта': 'unknown-code', **consignment, 'НомерПартии': 0},
+            ],
+        )
+        assert response.status_code == 200
+        assert response.json() == {
+            'inserted': 1,
+            'ignored_duplicates': 2,
+            'ignored_unknown_consignment': 1,
+        }
+        await assert_added_products(['new-code'])
+
+
+@pytest.mark.asyncio
+async def test_endpoint_aggregate_batch(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_product_to_consignment,
+    assert_aggregation,
+):
+    """Tests batch aggregation with per-product statuses."""
+    with test_app.services_container.tasks_service.override(tasks_service):
+        product_id = generic_product_to_consignment.product_id
+        consignment_id = generic_product_to_consignment.consignment_id
+        response = await async_client.post(
+            '/v1/tasks/products/aggregate',
+            json=[
+                {'product_id': product_id, 'consignment_id': consignment_id},
+                {'product_id': product_id, 'consignment_id': consignment_id},
+                {'product_id': product_id, 'consignment_id': consignment_id + 1},
+                {'product_id': product_id + '1', 'consignment_id': consignment_id},
+            ],
+        )
+        assert response.status_code == 200
+        results = response.json()
+        assert [result['status'] for result in results] == [
+            'aggregated', 'already_used', 'wrong_batch', 'not_found',
+        ]
+        assert results[0]['aggregated_at'] == results[1]['aggregated_at'] is not None
+        await assert_aggregation()
+        batch = [{'product_id': f'code-{i}', 'consignment_id': consignment_id} for i in range(MAX_AGGREGATION_BATCH)]
+        response = await async_client.post('/v1/tasks/products/aggregate', json=batch)
+        assert response.status_code == 200
+        assert {result['status'] for result in response.json()} == {'not_found'}
+        response = await async_client.post(
+            '/v1/tasks/products/aggregate',
+            json=[*batch, {'product_id': product_id, 'consignment_id': consignment_id}],
+        )
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_endpoint_aggregate_coalesced(
+    async_client,
+    services_container,
+    tasks_repository,
+    session_manager,
+    generic_product_to_consignment,
+    query_budget,
+):
+    """Tests that concurrent aggregations are applied in one batch and get their own results."""
+    service = TasksService(
+        session_factory=session_manager,
+        tasks_repository=tasks_repository,
+        aggregation_coalescer=Coalescer(window_ms=50, max_items=10, name='test'),
+    )
+    product_id = generic_product_to_consignment.product_id
+    consignment_id = generic_product_to_consignment.consignment_id
+    paths = [
+        f'/v1/tasks/products/{product_id}/consignments/{consignment_id}',
+        f'/v1/tasks/products/{product_id}/consignments/{consignment_id}',
+        f'/v1/tasks/products/{product_id}/consignments/{consignment_id + 1}',
+        f'/v1/tasks/products/{product_id}1/consignments/{consignment_id}',
+    ]
+    with services_container.tasks_service.override(providers.Object(service)):
+        with query_budget(3):
+            responses = await asyncio.gather(*(async_client.post(path) for path in paths))
+    assert [response.status_code for response in responses] == [200, 400, 400, 404]
+    aggregated_at = responses[0].json()['aggregated_at']
+    assert responses[1].json()['detail'].startswith('unique code already used at')
+    assert responses[2].json()['detail'] == 'unique code is attached to another batch'
+    assert aggregated_at is not None
+
+
+class MissingUpdateRepository(TasksRepository):
+    """Repository whose updates miss bindings, like bindings committed while they run."""
+
+    async def aggregate(self, session, consignment_id, product_id):
+        return None
+
+    async def aggregate_many(self, session, products):
+        return {}
+
+
+@pytest.mark.asyncio
+async def test_endpoint_aggregate_conflict(
+    async_client,
+    services_container,
+    session_manager,
+    generic_product_to_consignment,
+):
+    """Tests that a binding missed by the update is not reported as already used."""
+    service = TasksService(session_factory=session_manager, tasks_repository=MissingUpdateRepository())
+    product_id = generic_product_to_consignment.product_id
+    consignment_id = generic_product_to_consignment.consignment_id
+    with services_container.tasks_service.override(providers.Object(service)):
+        response = await async_client.post(
+            '/v1/tasks/products/aggregate',
+            json=[{'product_id': product_id, 'consignment_id': consignment_id}],
+        )
+        assert [(result['status'], result['aggregated_at']) for result in response.json()] == [('conflict', None)]
+        response = await async_client.post(f'/v1/tasks/products/{product_id}/consignments/{consignment_id}')
+        assert response.status_code == 409
+
+
+@pytest.mark.asyncio
+async def test_endpoint_progress(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_task,
+    generic_consignment,
+):
+    """Tests that counters of consignments follow ingestion and aggregation."""
+    with test_app.services_container.tasks_service.override(tasks_service):
+        consignment = {
+            'НомерПартии': generic_consignment.consignment_number,
+            'ДатаПартии': generic_consignment.consignment_date.isoformat(),
+        }
+        consignment_id = generic_consignment.consignment_id
+        response = await async_client.post(
+            '/v1/tasks/products',
+            json=[{'УникальныйКодПродукта': code, **consignment} for code in ('code-1', 'code-2', 'code-3')],
+        )
+        assert response.json()['inserted'] == 3
+        response = await async_client.post(f'/v1/tasks/products/code-1/consignments/{consignment_id}')
+        assert response.status_code == 200
+        response = await async_client.post(
+            '/v1/tasks/products/aggregate',
+            json=[
+                {'product_id': 'code-1', 'consignment_id': consignment_id},
+                {'product_id': 'code-2', 'consignment_id': consignment_id},
+            ],
+        )
+        assert [result['status'] for result in response.json()] == ['already_used', 'aggregated']
+
+        response = await async_client.get('/v1/tasks/progress', params={'line': generic_task.line})
+        assert response.status_code == 200
+        [progress] = response.json()
+        assert progress['consignment_id'] == consignment_id
+        assert progress['task_id'] == generic_task.task_id
+        assert (progress['total_products'], progress['aggregated_products']) == (3, 2)
+        assert progress['first_aggregated_at'] < progress['last_aggregated_at']
+
+        response = await async_client.get('/v1/tasks/progress/lines')
+        assert response.status_code == 200
+        assert response.json() == [{
+            'line': generic_task.line,
+            'consignments': 1,
+            'total_products': 3,
+            'aggregated_products': 2,
+            'first_aggregated_at': progress['first_aggregated_at'],
+            'last_aggregated_at': progress['last_aggregated_at'],
+        }]
+
+        # Folded deltas are read from the counters.
+        assert await tasks_service.fold_progress() == 3
+        assert await tasks_service.fold_progress() == 0
+        response = await async_client.get('/v1/tasks/progress', params={'line': generic_task.line})
+        assert response.json() == [progress]
+        response = await async_client.get('/v1/tasks/progress', params={'limit': 0})
+        assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_endpoint_get_tasks_by_cursor(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_task,
+    db_tasks_factory,
+    db_consignments_factory,
+):
+    """Tests walking tasks pages by the cursor."""
+    consignment = await db_consignments_factory()
+    next_task = await db_tasks_factory(
+        consignment_id=consignment.consignment_id,
+        started_at=generic_task.started_at,
+    )
+    with test_app.services_container.tasks_service.override(tasks_service):
+        response = await async_client.get('/v1/tasks', params={'limit': 1}, headers={'Origin': 'http://erp'})
+        assert response.status_code == 200
+        assert [task['task_id'] for task in response.json()] == [generic_task.task_id]
+        assert 'X-Next-Cursor' in response.headers['Access-Control-Expose-Headers']
+        response = await async_client.get(
+            '/v1/tasks',
+            params={'limit': 1, 'cursor': response.headers['X-Next-Cursor']},
+        )
+        assert [task['task_id'] for task in response.json()] == [next_task.task_id]
+        response = await async_client.get(
+            '/v1/tasks',
+            params={'limit': 1, 'cursor': response.headers['X-Next-Cursor']},
+        )
+        assert response.json() == []
+        assert 'X-Next-Cursor' not in response.headers
+        response = await async_client.get('/v1/tasks', params={'cursor': 'invalid'})
+        assert response.status_code == 400
+        for limit in (0, -1, 1001):
+            response = await async_client.get('/v1/tasks', params={'limit': limit})
+            assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_endpoint_get_task_products(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_task,
+    generic_product_to_consignment,
+    db_products_factory,
+    db_product_to_consignment_factory,
+):
+    """Tests paginated and streamed products of a task."""
+    product = await db_products_factory()
+    await db_product_to_consignment_factory(
+        product_id=product.product_id,
+        is_aggregated=True,
+        aggregated_at=datetime(2024, 1, 30, 20, 0),
+    )
+    product_ids = sorted([generic_product_to_consignment.product_id, product.product_id])
+    with test_app.services_container.tasks_service.override(tasks_service):
+        url = f'/v1/tasks/{generic_task.task_id}/products'
+        response = await async_client.get(url, params={'limit': 1})
+        assert [item['product_id'] for item in response.json()] == product_ids[:1]
+        response = await async_client.get(
+            url,
+            params={'limit': 1, 'cursor': response.headers['X-Next-Cursor']},
+        )
+        assert [item['product_id'] for item in response.json()] == product_ids[1:]
+        response = await async_client.get(url, params={'aggregated': True})
+        assert [item['product_id'] for item in response.json()] == [product.product_id]
+        for limit in (0, 10001):
+            response = await async_client.get(url, params={'limit': limit})
+            assert response.status_code == 422
+        response = await async_client.get(url, params={'stream': True})
+        assert response.headers['content-type'] == 'application/x-ndjson'
+        lines = response.text.splitlines()
+        assert [json.loads(line)['product_id'] for line in lines] == product_ids
+        response = await async_client.get(
+            f'/v1/tasks/{generic_task.task_id + 1}/products',
+            params={'stream': True},
+        )
+        assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_endpoint_export_tasks(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_task,
+    generic_consignment,
+):
+    """Tests exporting filtered tasks as NDJSON and gzipped CSV."""
+    with test_app.services_container.tasks_service.override(tasks_service):
+        response = await async_client.get(
+            '/v1/tasks/export',
+            params={'consignment_number': generic_consignment.consignment_number},
+        )
+        assert response.status_code == 200
+        assert [json.loads(line)['task_id'] for line in response.text.splitlines()] == [
+            generic_task.task_id,
+        ]
+        response = await async_client.get(
+            '/v1/tasks/export',
+            params={'format': 'csv', 'gzip': True},
+        )
+        assert response.headers['content-encoding'] == 'gzip'
+        rows = list(csv.DictReader(io.StringIO(response.text)))
+        assert [(row['task_id'], row['name']) for row in rows] == [
+            (str(generic_task.task_id), generic_task.name),
+        ]
+        response = await async_client.get('/v1/tasks/export', params={'close_status': True})
+        assert response.text == ''
+
+
+@pytest.mark.asyncio
+async def test_endpoint_add_products_stream(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_consignment,
+    assert_added_products,
+    monkeypatch,
+):
+    """Tests adding products from a newline delimited JSON stream in several batches."""
+    monkeypatch.setattr('src.modules.tasks.service.PRODUCTS_BATCH_SIZE', 2)
+    consignment = {
+        'НомерПартии': generic_consignment.consignment_number,
+        'ДатаПартии': generic_consignment.consignment_date.isoformat(),
+    }
+
+    async def content():
+        for product_id in ('first-code', 'second-code', 'first-code'):
+            line = json.dumps({'УникальныйКодПродукта': product_id, **consignment})
+            yield f'{line}\n'.encode()
+
+    with test_app.services_container.tasks_service.override(tasks_service):
+        response = await async_client.post('/v1/tasks/products/stream', content=content())
+        assert response.status_code == 200
+        assert response.json() == {
+            'inserted': 2,
+            'ignored_duplicates': 1,
+            'ignored_unknown_consignment': 0,
+        }
+        await assert_added_products(['first-code', 'second-code'])
+        response = await async_client.post('/v1/tasks/products/stream', content=b'{}\n')
+        assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_endpoint_closed_task_cache(
+    async_client,
+    services_container,
+    session_manager,
+    tasks_repository,
+    generic_task,
+    generic_consignment,
+    task_data,
+    query_budget,
+):
+    """Tests that cached closed tasks are served while current and rebuilt after changes by any request."""
+    service = TasksService(
+        session_factory=session_manager,
+        tasks_repository=tasks_repository,
+        closed_tasks_cache=LRUCache(maxsize=10, ttl=60, negative_ttl=0, name='test_closed_tasks'),
+    )
+    url = f'/v1/tasks/{generic_task.task_id}'
+    consignment = {
+        'НомерПартии': generic_consignment.consignment_number,
+        'ДатаПартии': generic_consignment.consignment_date.isoformat(),
+    }
+    with services_container.tasks_service.override(providers.Object(service)):
+        await async_client.put(url, json={'close_status': True})
+        response = await async_client.get(url)
+        with query_budget(1):
+            cached = await async_client.get(url)
+        assert cached.json() == response.json()
+        assert cached.headers['Cache-Control'] == 'no-cache'
+
+        response = await async_client.post('/v1/tasks', json=[{**task_data, **consignment, 'СтатусЗакрытия': True}])
+        assert response.status_code == 200
+        response = await async_client.get(url)
+        assert response.json()['name'] == task_data['ПредставлениеЗаданияНаСмену']
+
+        response = await async_client.post(
+            '/v1/tasks/products', json=[{'УникальныйКодПродукта': 'new-code', **consignment}])
+        assert response.json()['inserted'] == 1
+        response = await async_client.get(url)
+        assert response.json()['products'] == ['new-code']
+
+
+@pytest.mark.asyncio
+async def test_endpoint_get_task_etag(
+    async_client,
+    test_session,
+    test_app,
+    tasks_service,
+    generic_task,
+    generic_consignment,
+):
+    """Tests conditional task reads and ETag changes after updates and ingestion."""
+    with test_app.services_container.tasks_service.override(tasks_service):
+        url = f'/v1/tasks/{generic_task.task_id}'
+        response = await async_client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert response.headers['Cache-Control'] == 'no-cache'
+        response = await async_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.headers['ETag'] == etag
+        assert not response.content
+        page = await async_client.get('/v1/tasks')
+        response = await async_client.get('/v1/tasks', headers={'If-None-Match': page.headers['ETag']})
+        assert response.status_code == 304
+
+        response = await async_client.put(url, json={'brigade': 'Бригада №5'})
+        assert response.status_code == 200
+        response = await async_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json()['brigade'] == 'Бригада №5'
+        etag = response.headers['ETag']
+        response = await async_client.get('/v1/tasks', headers={'If-None-Match': page.headers['ETag']})
+        assert response.status_code == 200
+
+        response = await async_client.post(
+            '/v1/tasks/products',
+            json=[{
+                'УникальныйКодПродукта': 'new-code',
+                'НомерПартии': generic_consignment.consignment_number,
+                'ДатаПартии': generic_consignment.consignment_date.isoformat(),
+            }],
+        )
+        assert response.status_code == 200
+        response = await async_client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.json()['products'] == ['new-code']
@@ -1,6 +1,12 @@
 import pytest
 from dependency_injector import providers
 
+from src.modules.analytics.repository import AnalyticsRepository
+from src.modules.analytics.service import AnalyticsService
+from src.modules.idempotency.repository import IdempotencyRepository
+from src.modules.idempotency.service import IdempotencyService
+from src.modules.partitions.repository import PartitionsRepository
+from src.modules.partitions.service import PartitionsService
 from src.modules.tasks.repository import TasksRepository
 from src.modules.tasks.service import TasksService
 
@@ -45,3 +51,59 @@ def tasks_service(
     ):
         service = services_container.tasks_service
         yield service()
+
+
+@pytest.fixture()
+def partitions_service(
+    services_container,
+    session_manager,
+):
+    with services_container.partitions_service.override(
+        providers.Factory(
+            PartitionsService,
+            session_factory=session_manager,
+            partitions_repository=PartitionsRepository(),
+            months_ahead=1,
+            archive_horizon_months=12,
+            archive_schema='archive',
+        )
+    ):
+        service = services_container.partitions_service
+        yield service()
+
+
+@pytest.fixture()
+def analytics_service(
+    services_container,
+    session_manager,
+):
+    with services_container.analytics_service.override(
+        providers.Factory(
+            AnalyticsService,
+            session_factory=session_manager,
+            analytics_repository=AnalyticsRepository(),
+            refresh_lag=60,
+            refresh_step_hours=1,
+        )
+    ):
+        service = services_container.analytics_service
+        yield service()
+
+
+@pytest.fixture()
+def idempotency_service(
+    services_container,
+    session_manager,
+):
+    with services_container.idempotency_service.override(
+        providers.Factory(
+            IdempotencyService,
+            session_factory=session_manager,
+            idempotency_repository=IdempotencyRepository(),
+            retention=3600,
+            hash_retention=60,
+            prune_batch_size=2,
+        )
+    ):
+        service = services_container.idempotency_service
+        yield service()
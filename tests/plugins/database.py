@@ -1,8 +1,9 @@
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, contextmanager
 from typing import TypeVar
 
 import pytest
 from mimesis import Schema
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
 
 DBInstanceType = TypeVar('DBInstanceType')
@@ -13,6 +14,29 @@ def database(test_app):
     yield test_app.adapters_container.database()
 
 
+@pytest.fixture()
+def query_budget(database):
+    """Fails the block when it executes more statements than the budget.
+    Savepoints of the test session are not counted, they are not executed in production."""
+    @contextmanager
+    def budget(statements: int):
+        executed = []
+
+        def count(conn, cursor, statement, parameters, context, executemany):
+            if not statement.startswith(('SAVEPOINT', 'RELEASE SAVEPOINT', 'ROLLBACK TO SAVEPOINT')):
+                executed.append(statement)
+
+        event.listen(database.engine.sync_engine, 'before_cursor_execute', count)
+        try:
+            yield executed
+        finally:
+            event.remove(database.engine.sync_engine, 'before_cursor_execute', count)
+        assert len(executed) <= statements, (
+            f'{len(executed)} statements over the budget of {statements}:\n' + '\n\n'.join(executed))
+
+    return budget
+
+
 @pytest.fixture()
 def insert_query_factory(test_session):
     async def factory(instance: DBInstanceType) -> DBInstanceType:
@@ -7,6 +7,41 @@ from mimesis import Field, Locale
 from src.db_models.products import Products
 from src.db_models.tasks import ShiftTasks, Consignments, ProductsToConsignments
 
+# Schemas of the rows are shared with benchmarks/, which seed them in bulk.
+_ = Field(locale=Locale.RU)
+
+
+def consignment_schema(**overriders) -> dict:
+    return {
+        "consignment_number": _("integer_number"),
+        "consignment_date":  datetime.now().date(),
+        **overriders,
+    }
+
+
+def task_schema(**overriders) -> dict:
+    return {
+        'name': str(uuid4()),
+        'line': str(uuid4()),
+        'shift': str(uuid4()),
+        'brigade': str(uuid4()),
+        'nomenclature': str(uuid4()),
+        'code': str(uuid4()),
+        'identifier': str(uuid4()),
+        'started_at': datetime.now().replace(hour=8, minute=0, second=0),
+        'completed_at': datetime.now().replace(hour=16, minute=0, second=0),
+        'closed_at': None,
+        'close_status': False,
+        **overriders,
+    }
+
+
+def product_schema(**overriders) -> dict:
+    return {
+        "product_id":  str(uuid4()),
+        **overriders,
+    }
+
 
 @pytest.fixture()
 def db_consignments_factory(
@@ -14,11 +49,7 @@ def db_consignments_factory(
     generate_schema,
 ):
     async def factory(**overriders):
-        _ = Field(locale=Locale.RU)
-        schema = generate_schema({
-            "consignment_number": _("integer_number"),
-            "consignment_date":  datetime.now().date(),
-        })
+        schema = generate_schema(consignment_schema())
         return await insert_query_factory(
             Consignments(**{**schema, **overriders}),
         )
@@ -38,20 +69,9 @@ def db_tasks_factory(
     generic_consignment,
 ):
     async def factory(**overriders):
-        schema = generate_schema({
-            'name': str(uuid4()),
-            'line': str(uuid4()),
-            'shift': str(uuid4()),
-            'brigade': str(uuid4()),
-            'consignment_id': generic_consignment.consignment_id,
-            'nomenclature': str(uuid4()),
-            'code': str(uuid4()),
-            'identifier': str(uuid4()),
-            'started_at': datetime.now().replace(hour=8, minute=0, second=0),
-            'completed_at': datetime.now().replace(hour=16, minute=0, second=0),
-            'closed_at': None,
-            'close_status': False,
-        })
+        schema = generate_schema(task_schema(
+            consignment_id=generic_consignment.consignment_id,
+        ))
         return await insert_query_factory(
             ShiftTasks(**{**schema, **overriders}),
         )
@@ -70,10 +90,7 @@ def db_products_factory(
     generate_schema,
 ):
     async def factory(**overriders):
-        _ = Field(locale=Locale.RU)
-        schema = generate_schema({
-            "product_id":  str(uuid4()),
-        })
+        schema = generate_schema(product_schema())
         return await insert_query_factory(
             Products(**{**schema, **overriders}),
         )
@@ -94,10 +111,10 @@ def db_product_to_consignment_factory(
     generic_product,
 ):
     async def factory(**overriders):
-        _ = Field(locale=Locale.RU)
         schema = generate_schema({
             "product_id":  generic_product.product_id,
             "consignment_id": generic_consignment.consignment_id,
+            "consignment_date": generic_consignment.consignment_date,
         })
         return await insert_query_factory(
             ProductsToConsignments(**{**schema, **overriders}),
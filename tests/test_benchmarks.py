@@ -0,0 +1,33 @@
+import random
+
+import pytest
+from httpx import ASGITransport, AsyncClient
+
+from benchmarks.http_load import DEFAULT_MIX, OPERATIONS, run_workload, seed
+from benchmarks.serialization import SERIALIZERS, run
+
+
+@pytest.mark.asyncio
+async def test_http_load_runs_every_operation(database, test_app, services_container):
+    """Tests that the workload of the benchmark runs against the app without errors."""
+    dataset = await seed(database, consignments=20, products_per_consignment=5, days=30, rng=random.Random(1))
+    # Requests run concurrently, so the service gets sessions of the database instead of the test session.
+    with services_container.tasks_service.override(test_app.services_container.tasks_service):
+        async with AsyncClient(transport=ASGITransport(app=test_app), base_url='http://benchmark') as client:
+            routes = await run_workload(
+                client, dataset, DEFAULT_MIX, concurrency=len(OPERATIONS), duration=1, warmup=0, batch=2, seed=1,
+            )
+    assert len(routes) == len(OPERATIONS)
+    for route, stats in routes.items():
+        assert stats['requests'] > 0, route
+        assert stats['errors'] == 0, (route, stats['statuses'])
+        assert stats['p50_ms'] <= stats['p95_ms'] <= stats['p99_ms']
+
+
+@pytest.mark.asyncio
+async def test_serializers_agree():
+    """Tests that the serializers of the benchmark encode the same tasks."""
+    results = await run(sizes=[1, 3], products=2, repeat=1)
+    assert list(results) == [1, 3]
+    for result in results.values():
+        assert set(SERIALIZERS) < set(result)
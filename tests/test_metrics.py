@@ -0,0 +1,67 @@
+import json
+
+import pytest
+from prometheus_client import REGISTRY
+
+AGGREGATE_ROUTE = '/v1/tasks/products/{product_id}/consignments/{consignment_id}'
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0
+
+
+@pytest.mark.asyncio
+async def test_metrics(
+    async_client,
+    test_app,
+    tasks_service,
+    generic_product_to_consignment,
+):
+    """Tests that requests, statements and aggregations are counted and exported."""
+    before = {
+        'ok': sample('http_requests_total', method='POST', route=AGGREGATE_ROUTE, status='200'),
+        'bad': sample('http_requests_total', method='POST', route=AGGREGATE_ROUTE, status='400'),
+        'aggregated': sample('aggregations_total', status='aggregated'),
+        'already_used': sample('aggregations_total', status='already_used'),
+        'queries': sample('db_query_duration_seconds_count', method='TasksRepository.aggregate'),
+    }
+    with test_app.services_container.tasks_service.override(tasks_service):
+        product_id = generic_product_to_consignment.product_id
+        consignment_id = generic_product_to_consignment.consignment_id
+        for _ in range(2):
+            await async_client.post(f'/v1/tasks/products/{product_id}/consignments/{consignment_id}')
+    assert sample('http_requests_total', method='POST', route=AGGREGATE_ROUTE, status='200') == before['ok'] + 1
+    assert sample('http_requests_total', method='POST', route=AGGREGATE_ROUTE, status='400') == before['bad'] + 1
+    assert sample('aggregations_total', status='aggregated') == before['aggregated'] + 1
+    assert sample('aggregations_total', status='already_used') == before['already_used'] + 1
+    assert sample('db_query_duration_seconds_count', method='TasksRepository.aggregate') > before['queries']
+    assert sample('db_pool_checkouts_total') > 0
+
+    response = await async_client.get('/metrics')
+    assert response.status_code == 200
+    assert f'http_request_duration_seconds_bucket{{le="0.005",method="POST",route="{AGGREGATE_ROUTE}"}}' in response.text
+
+
+@pytest.mark.asyncio
+async def test_server_timing(
+    async_client,
+    test_app,
+    tasks_service,
+    generic_task,
+    caplog,
+):
+    """Tests that statements of a request are returned in Server-Timing and logged."""
+    with test_app.services_container.tasks_service.override(tasks_service), caplog.at_level('INFO'):
+        response = await async_client.get(f'/v1/tasks/{generic_task.task_id}')
+    assert response.status_code == 200
+    timing = response.headers['Server-Timing']
+    assert timing.startswith('db;dur=')
+    assert 'desc="3 statements"' in timing
+    assert 'db-slowest;dur=' in timing
+    record = json.loads(next(
+        record.message for record in caplog.records if record.name == 'src.adapters.query_stats'
+    ))
+    assert record['route'] == '/v1/tasks/{task_id}'
+    assert record['status'] == 200
+    assert record['db_statements'] == 3
+    assert record['db_slowest_statement'].startswith('SELECT')
@@ -0,0 +1,72 @@
+import pytest
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from sqlalchemy import text
+
+from src.adapters.database import Base
+from src.db_models.tasks import is_products_partition
+
+
+def migrate(connection, revision):
+    config = Config('alembic.ini')
+    config.attributes['configure_logger'] = False
+    config.attributes['connection'] = connection
+    if revision == 'base':
+        command.downgrade(config, revision)
+    else:
+        command.upgrade(config, revision)
+
+
+@pytest.mark.asyncio
+async def test_migrations_match_models(database):
+    """Tests that migrations build the schema of the models and can be rolled back."""
+    def compare(connection):
+        return compare_metadata(
+            MigrationContext.configure(connection, opts={
+                'compare_server_default': True,
+                'include_name': lambda name, type_, _: not (type_ == 'table' and is_products_partition(name)),
+            }),
+            Base.metadata,
+        )
+
+    await database.drop_database()
+    async with database.engine.connect() as connection:
+        try:
+            await connection.run_sync(migrate, 'head')
+            assert await connection.run_sync(compare) == []
+        finally:
+            await connection.run_sync(migrate, 'base')
+            await connection.execute(text('DROP TABLE alembic_version'))
+            await connection.commit()
+
+
+@pytest.mark.asyncio
+async def test_duplicates_are_kept_for_review(database):
+    """Tests that rows violating the unique constraints of 0002 are moved aside, not deleted."""
+    await database.drop_database()
+    async with database.engine.connect() as connection:
+        try:
+            await connection.run_sync(migrate, '0001')
+            for statement in (
+                "INSERT INTO consignments (consignment_id, consignment_number, consignment_date) "
+                "VALUES (1, 1, '2024-01-01')",
+                "INSERT INTO shift_tasks (task_id, consignment_id, name) VALUES (1, 1, 'old'), (2, 1, 'new')",
+                "INSERT INTO products (product_id) VALUES ('code')",
+                "INSERT INTO products_to_consignments (product_to_consignment_id, product_id, consignment_id, "
+                "is_aggregated) VALUES (1, 'code', 1, false), (2, 'code', 1, true)",
+            ):
+                await connection.execute(text(statement))
+            await connection.run_sync(migrate, '0002')
+            removed_tasks = await connection.execute(text('SELECT task_id, name FROM removed_0002_shift_tasks'))
+            assert removed_tasks.all() == [(1, 'old')]
+            removed_bindings = await connection.execute(
+                text('SELECT product_to_consignment_id FROM removed_0002_products_to_consignments'))
+            assert removed_bindings.scalars().all() == [1]
+        finally:
+            await connection.run_sync(migrate, 'base')
+            await connection.execute(text('DROP TABLE IF EXISTS removed_0002_shift_tasks'))
+            await connection.execute(text('DROP TABLE IF EXISTS removed_0002_products_to_consignments'))
+            await connection.execute(text('DROP TABLE alembic_version'))
+            await connection.commit()